@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+# Microbenchmark of the logging overhead of serving sd requests from the cache and of the
+# exclusion checks in the collection loops
+#
+#     PYTHONPATH=. python benchmarks/bench_logging.py [number of requests]
+
+import io
+import logging as log
+import sys
+import time
+
+from logfmter import Logfmter
+
+from infoblox_discovery.cache import Cache, ZONES
+from infoblox_discovery.infoblox_zone import zone_factory
+from infoblox_discovery.log_summary import LogSummary
+
+MASTER = 'bench.foo.com'
+EXTATTRS = {'Site': {'value': 'foo'}, 'zone-exclusion': {'value': 'False'}}
+
+
+def logged_get(cache: Cache, count: int):
+    # The cache get as it was, with an info log line for every request
+    for _ in range(count):
+        if cache._valid(MASTER, ZONES):
+            log.info("Cache", extra={"hit": True})
+        else:
+            log.info("Cache", extra={"hit": False})
+
+
+def counted_get(cache: Cache, count: int):
+    for _ in range(count):
+        cache.count_request(MASTER, ZONES, cache.get_etag(MASTER, ZONES) is not None)
+
+
+def eager_debug(count: int):
+    for i in range(count):
+        log.debug(f"Extattrs {EXTATTRS}")
+        log.info(f"Exclude infoblox zone zone{i}.foo.com")
+
+
+def lazy_summary(count: int):
+    summary = LogSummary()
+    for i in range(count):
+        log.debug("Extattrs %s", EXTATTRS)
+        summary.add("zones_excluded", f"zone{i}.foo.com")
+    log.info("Discovered", extra=summary.extra())
+
+
+def bench(name, function, *args):
+    count = args[-1]
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed:8.3f}s {elapsed / count * 1e6:10.2f} us/op")
+
+
+if __name__ == '__main__':
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    handler = log.StreamHandler(io.StringIO())
+    handler.setFormatter(Logfmter(keys=["at"], mapping={"at": "levelname"}))
+    log.basicConfig(handlers=[handler], level=log.INFO)
+
+    cache = Cache()
+    cache.put(MASTER, ZONES, [zone_factory(f"zone{i}.foo.com", f"zone{i}.foo.com", MASTER) for i in range(100)])
+    bench("cache get logged", logged_get, cache, requests)
+    bench("cache get counted", counted_get, cache, requests)
+    bench("per object log lines", eager_debug, requests)
+    bench("per cycle summary", lazy_summary, requests)
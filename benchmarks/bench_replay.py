@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import os
+import sys
+import time
+
+from infoblox_discovery.environments import DISCOVERY_WAPI_REPLAY, DISCOVERY_WAPI_REPLAY_LATENCY, \
+    DISCOVERY_WAPI_CACHE_TTL
+
+USAGE = """
+Benchmark of the collect of all masters and types, replayed from a recorded WAPI archive, see the
+README section Record and replay
+
+    INFOBLOX_DISCOVERY_CONFIG=config.yml PYTHONPATH=. python benchmarks/bench_replay.py wapi.jsonl.gz [rounds] [recorded|zero]
+"""
+
+if len(sys.argv) < 2:
+    print(USAGE)
+    sys.exit(1)
+os.environ[DISCOVERY_WAPI_REPLAY] = sys.argv[1]
+os.environ[DISCOVERY_WAPI_REPLAY_LATENCY] = sys.argv[3] if len(sys.argv) > 3 else 'zero'
+# Every round replay the WAPI queries
+os.environ[DISCOVERY_WAPI_CACHE_TTL] = '0'
+
+# Imported after the replay is set in the environment
+from infoblox_discovery import collect  # noqa: E402
+from infoblox_discovery.cache import Cache  # noqa: E402
+from infoblox_discovery.recording import replay_archive  # noqa: E402
+
+
+def collect_round() -> float:
+    replay_archive(sys.argv[1]).rewind()
+    start = time.perf_counter()
+    collect.fill_cache()
+    return time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    times = sorted(collect_round() for _ in range(rounds))
+    cache = Cache()
+    for master, types in cache.get_types().items():
+        for type in types:
+            print(f"{master:<32} {type:<16} {len(cache.get(master, type)):10} targets {cache.get_status(master, type)[0]}")
+    print(f"{rounds} rounds, min {times[0]:.3f}s, median {times[len(times) // 2]:.3f}s, max {times[-1]:.3f}s")
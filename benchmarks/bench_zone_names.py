@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+# Microbenchmark of the zone name normalization in get_infoblox_zones
+#
+#     PYTHONPATH=. python benchmarks/bench_zone_names.py [number of zones]
+
+import ipaddress
+import random
+import sys
+import time
+
+from infoblox_discovery.zone_names import zone_names, reverse_zone_name, idna_name
+
+try:
+    from IPy import IP
+except ImportError:
+    IP = None
+
+
+def synthetic_zones(count: int):
+    random.seed(1)
+    fqdns = []
+    for i in range(count):
+        if i % 2:
+            prefix = random.choice([8, 16, 24, 25, 26])
+            fqdns.append(str(ipaddress.ip_network(f"{ipaddress.IPv4Address(random.getrandbits(32))}/{prefix}",
+                                                  strict=False)))
+        else:
+            fqdns.append(f"zone{i}.example{i % 100}.com")
+    return fqdns
+
+
+def ipy_names(fqdns):
+    for fqdn in fqdns:
+        if '/' in fqdn:
+            ip = IP(fqdn)
+            ip.reverseName()
+            ip.reverseName()
+        else:
+            fqdn.encode('idna').decode('utf-8')
+
+
+def normalized_names(fqdns):
+    for _ in map(zone_names, fqdns):
+        pass
+
+
+def bench(name, function, fqdns):
+    start = time.perf_counter()
+    function(fqdns)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed:8.3f}s {len(fqdns) / elapsed:12.0f} zones/s")
+
+
+if __name__ == '__main__':
+    zones = synthetic_zones(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
+    if IP is not None:
+        bench("IPy and idna encode", ipy_names, zones)
+    reverse_zone_name.cache_clear()
+    idna_name.cache_clear()
+    bench("zone_names cold", normalized_names, zones)
+    bench("zone_names memoized", normalized_names, zones)
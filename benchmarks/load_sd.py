@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import argparse
+import asyncio
+import base64
+import gc
+import os
+import random
+import socket
+import threading
+import time
+import tracemalloc
+from typing import Dict, List, Any, Tuple, Optional
+from urllib.parse import urlparse, urlencode
+
+DESCRIPTION = """
+Load generator for the http sd and metrics endpoints. The cache is filled with synthetic targets
+and the app is driven by concurrent clients, in-process through the ASGI interface and over a
+socket to uvicorn in the same process, or to a running instance with --url.
+
+    PYTHONPATH=. python benchmarks/load_sd.py --masters 4 --targets 20000 --clients 32 --requests 20000
+
+The in-process mode measure the app without the http server, the socket mode include uvicorn,
+but the clients and the server share the same interpreter. Use --url to load a separate instance.
+"""
+
+USERNAME = 'load'
+PASSWORD = 'load-password'
+
+# Set before the app is imported and the authenticator is created, so the imports below are not at the top
+os.environ.setdefault('INFOBLOX_DISCOVERY_BASIC_AUTH_ENABLED', 'true')
+os.environ.setdefault('INFOBLOX_DISCOVERY_BASIC_AUTH_USERNAME', USERNAME)
+os.environ.setdefault('INFOBLOX_DISCOVERY_BASIC_AUTH_PASSWORD', PASSWORD)
+
+import uvicorn  # noqa: E402
+
+from infoblox_discovery.cache import Cache, ZONES, DHCP_RANGES, MEMBERS  # noqa: E402
+from infoblox_discovery.extattr_labels import ExtattrLabels  # noqa: E402
+from infoblox_discovery.http_service_discovery import app  # noqa: E402
+from infoblox_discovery.infoblox_dhcp import dhcp_factory  # noqa: E402
+from infoblox_discovery.infoblox_member import Member  # noqa: E402
+from infoblox_discovery.infoblox_zone import zone_factory  # noqa: E402
+
+TYPES = [ZONES, DHCP_RANGES, MEMBERS]
+SD = 'sd'
+METRICS = 'metrics'
+# Headers sent by Prometheus http sd
+PROMETHEUS_HEADERS = {'User-Agent': 'Prometheus/2.45.0', 'Accept': 'application/json',
+                      'X-Prometheus-Refresh-Interval-Seconds': '60'}
+
+
+def fill_cache(masters: int, targets: int) -> List[str]:
+    """
+    Put synthetic zones, dhcp ranges and members in the cache
+    :param masters:
+    :param targets: the number of zones and dhcp ranges of every master
+    :return: the masters
+    """
+    cache = Cache()
+    labels = ExtattrLabels({'Site': 'site', 'Tenant': 'tenant'})
+    names = []
+    for m in range(masters):
+        master = f"load{m}.foo.com"
+        names.append(master)
+        extattrs = [{'Site': {'value': f"site{i}"}, 'Tenant': {'value': f"tenant{i % 7}"}} for i in range(50)]
+        cache.put(master, ZONES, [zone_factory(f"zone{i}.foo.com", f"zone{i}.foo.com", master,
+                                               labels.labels(extattrs[i % 50]), 'External')
+                                  for i in range(targets)])
+        cache.put(master, DHCP_RANGES, [dhcp_factory(f"10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}/32", master,
+                                                     i % 1000, 'NORMAL', labels.labels(extattrs[i % 50]), 'default')
+                                        for i in range(targets)])
+        members = []
+        for i in range(max(targets // 1000, 1)):
+            member = Member(f"member{i}.foo.com")
+            member.master = master
+            members.append(member)
+        cache.put(master, MEMBERS, members)
+    return names
+
+
+class Request:
+    def __init__(self, path: str, query: str, headers: Dict[str, str]):
+        self.path = path
+        self.query = query
+        self.headers = headers
+
+
+def next_request(masters: List[str], endpoint: str, conditional: float, etags: Dict[str, str],
+                 rnd: random.Random) -> Request:
+    """
+    Get a request, with an If-None-Match header of the last ETag for the part of the sd requests
+    given by conditional
+    """
+    headers = dict(PROMETHEUS_HEADERS)
+    credentials = f"{os.environ['INFOBLOX_DISCOVERY_BASIC_AUTH_USERNAME']}:" \
+                  f"{os.environ['INFOBLOX_DISCOVERY_BASIC_AUTH_PASSWORD']}"
+    headers['Authorization'] = 'Basic ' + base64.b64encode(credentials.encode()).decode()
+    if endpoint == METRICS:
+        return Request('/metrics', '', headers)
+    query = urlencode({'master': rnd.choice(masters), 'type': rnd.choice(TYPES)})
+    etag = etags.get(query)
+    if etag is not None and rnd.random() < conditional:
+        headers['If-None-Match'] = etag
+    return Request('/prometheus-sd-targets', query, headers)
+
+
+async def asgi_request(request: Request) -> Tuple[int, int, Optional[str]]:
+    """
+    Call the app through the ASGI interface
+    :return: the status, the body size and the etag
+    """
+    done = asyncio.Event()
+    response: Dict[str, Any] = {'status': 0, 'size': 0, 'etag': None}
+    sent = False
+
+    async def receive():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        await done.wait()
+        return {'type': 'http.disconnect'}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+            for name, value in message['headers']:
+                if name == b'etag':
+                    response['etag'] = value.decode()
+        elif message['type'] == 'http.response.body':
+            response['size'] += len(message.get('body', b''))
+            if not message.get('more_body'):
+                done.set()
+
+    scope = {'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+             'scheme': 'http', 'path': request.path, 'raw_path': request.path.encode(),
+             'query_string': request.query.encode(), 'root_path': '',
+             'headers': [(name.lower().encode(), value.encode()) for name, value in request.headers.items()],
+             'client': ('127.0.0.1', 50000), 'server': ('127.0.0.1', 9694)}
+    await app(scope, receive, send)
+    return response['status'], response['size'], response['etag']
+
+
+class HttpConnection:
+    """
+    A keep alive http/1.1 connection, only for the responses of this app
+    """
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+
+    async def request(self, request: Request) -> Tuple[int, int, Optional[str]]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        target = f"{request.path}?{request.query}" if request.query else request.path
+        lines = [f"GET {target} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        lines.extend(f"{name}: {value}" for name, value in request.headers.items())
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode())
+        status_line = await self.reader.readline()
+        status = int(status_line.split()[1])
+        length = 0
+        etag = None
+        while True:
+            line = await self.reader.readline()
+            if line in (b'\r\n', b''):
+                break
+            name, _, value = line.decode().partition(':')
+            if name.lower() == 'content-length':
+                length = int(value)
+            elif name.lower() == 'etag':
+                etag = value.strip()
+        await self.reader.readexactly(length)
+        return status, length, etag
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def percentile(latencies: List[float], p: float) -> float:
+    return latencies[min(int(len(latencies) * p), len(latencies) - 1)] if latencies else 0.0
+
+
+def report(name: str, elapsed: float, latencies: List[float], statuses: Dict[int, int], size: int):
+    latencies.sort()
+    print(f"{name:<18} {len(latencies) / elapsed:10.0f} req/s  p50 {percentile(latencies, 0.5) * 1000:8.2f} ms  "
+          f"p99 {percentile(latencies, 0.99) * 1000:8.2f} ms  {size / max(len(latencies), 1) / 1024:8.1f} KiB/resp  "
+          f"status {dict(sorted(statuses.items()))}")
+
+
+async def drive(name: str, call, masters: List[str], endpoint: str, clients: int, count: int,
+                conditional: float, new_client=None):
+    """
+    Run count requests with concurrent clients that each send the next request when the last has
+    returned
+    """
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    etags: Dict[str, str] = {}
+    size = 0
+    remaining = count
+
+    async def client(index: int):
+        nonlocal remaining, size
+        rnd = random.Random(index)
+        connection = new_client() if new_client is not None else None
+        try:
+            while remaining > 0:
+                remaining -= 1
+                request = next_request(masters, endpoint, conditional, etags, rnd)
+                start = time.perf_counter()
+                status, length, etag = await call(connection, request)
+                latencies.append(time.perf_counter() - start)
+                statuses[status] = statuses.get(status, 0) + 1
+                size += length
+                if etag is not None:
+                    etags[request.query] = etag
+        finally:
+            if connection is not None:
+                connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[client(i) for i in range(clients)])
+    report(name, time.perf_counter() - start, latencies, statuses, size)
+
+
+async def allocations(masters: List[str], endpoint: str, count: int):
+    """
+    Report the peak of the memory allocated by a request and the memory kept after the requests,
+    with tracemalloc, one request at a time
+    """
+    rnd = random.Random(0)
+    peaks = []
+    gc.collect()
+    tracemalloc.start()
+    start = tracemalloc.get_traced_memory()[0]
+    for _ in range(count):
+        request = next_request(masters, endpoint, 0, {}, rnd)
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        await asgi_request(request)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    gc.collect()
+    kept = tracemalloc.get_traced_memory()[0] - start
+    tracemalloc.stop()
+    peaks.sort()
+    print(f"{endpoint + ' allocations':<18} p50 {percentile(peaks, 0.5) / 1024:8.1f} KiB  "
+          f"p99 {percentile(peaks, 0.99) / 1024:8.1f} KiB peak per request, {kept / count:8.0f} B kept per request")
+
+
+def start_server() -> Tuple[uvicorn.Server, int]:
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    # No lifespan, so the startup does not start the collect scheduler
+    server = uvicorn.Server(uvicorn.Config(app, lifespan='off', log_level='warning', access_log=False))
+    threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, sock.getsockname()[1]
+
+
+async def main(args):
+    if args.url:
+        url = urlparse(args.url)
+        masters = args.master or ['infoblox.master.com']
+    else:
+        start = time.perf_counter()
+        masters = fill_cache(args.masters, args.targets)
+        print(f"Filled the cache with {args.masters} masters and {args.targets} zones and dhcp ranges each in "
+              f"{time.perf_counter() - start:.1f}s")
+    endpoints = [SD, METRICS] if args.endpoint == 'both' else [args.endpoint]
+
+    for endpoint in endpoints:
+        count = args.requests if endpoint == SD else max(args.requests // 100, 10)
+        if not args.url and args.mode in ('asgi', 'both'):
+            await drive(f"asgi {endpoint}", lambda connection, request: asgi_request(request), masters, endpoint,
+                        args.clients, count, args.conditional)
+            await allocations(masters, endpoint, min(count, 200))
+        if args.url or args.mode in ('socket', 'both'):
+            if args.url:
+                host, port = url.hostname, url.port or 80
+            else:
+                server, port = start_server()
+                host = '127.0.0.1'
+            await drive(f"socket {endpoint}", lambda connection, request: connection.request(request), masters,
+                        endpoint, args.clients, count, args.conditional, lambda: HttpConnection(host, port))
+            if not args.url:
+                server.should_exit = True
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=DESCRIPTION, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--masters', type=int, default=2, help="synthetic masters")
+    parser.add_argument('--targets', type=int, default=10000, help="zones and dhcp ranges of each master")
+    parser.add_argument('--clients', type=int, default=16, help="concurrent clients")
+    parser.add_argument('--requests', type=int, default=5000, help="sd requests, metrics get a 100th")
+    parser.add_argument('--conditional', type=float, default=0.5,
+                        help="the part of sd requests with If-None-Match of the last ETag")
+    parser.add_argument('--mode', choices=['asgi', 'socket', 'both'], default='both')
+    parser.add_argument('--endpoint', choices=[SD, METRICS, 'both'], default='both')
+    parser.add_argument('--url', help="load a running instance, e.g. http://localhost:9694, with "
+                                      "INFOBLOX_DISCOVERY_BASIC_AUTH_USERNAME/PASSWORD of the instance")
+    parser.add_argument('--master', action='append', help="the masters requested with --url")
+    asyncio.run(main(parser.parse_args()))
@@ -19,214 +19,278 @@
 
 """
 
-from typing import Dict, Tuple, List
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Tuple, List, Any, Callable, Optional
 
 import urllib3
 import logging as log
-from IPy import IP
-from infoblox_client import connector
 
-from infoblox_discovery.infoblox_dhcp import DHCP, dhcp_factory
-from infoblox_discovery.infoblox_dns_server import DNSServer, dns_server_factory
-from infoblox_discovery.infoblox_zone import Zone, zone_factory
+from infoblox_discovery.builder import ObjectBuilder, view_key, MEMBERS, WEB_ENDPOINTS, ZONES, DHCP_RANGES
+from infoblox_discovery.infoblox_dhcp import DHCP
+from infoblox_discovery.infoblox_dns_server import DNSServer, dns_server_factory, zone_assignments
+from infoblox_discovery.infoblox_zone import Zone
 from infoblox_discovery.infoblox_member import Member, member_factory
 from infoblox_discovery.infoblox_node import Node, node_factory
 from infoblox_discovery.infoblox_webendpoint import WebEndpoint, webendpoint_factory
+from infoblox_discovery.member_records import MemberRecord, member_record, STANDALONE
+from infoblox_discovery.config import InfobloxConfig, COMMONS
+from infoblox_discovery.deadline import DeadlineExceeded
 from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.log_summary import LogSummary
+from infoblox_discovery.fields import return_fields, MEMBER, MEMBER_DNS, ZONE_AUTH, RANGE, IPV4ADDRESS, \
+    RECORD_HOST, ZONE_ASSIGNMENT_FIELDS
+from infoblox_discovery.pool import use_pool, build_in_pool
+from infoblox_discovery.profiling import profiling
+from infoblox_discovery.ratelimit import rate_limiter
+from infoblox_discovery.wapi import wapi_connector
 
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-MEMBERS = "members"
-ZONES = "zones"
-DHCP_RANGES = "dhcp_ranges"
 
+class InfoBlox(ObjectBuilder):
+    def __init__(self, config: InfobloxConfig):
+        super().__init__(config)
+        # type -> targets rendered in the process pool, see pool.py
+        self.rendered: Dict[str, List[bytes]] = {}
 
-class InfoBlox:
-    def __init__(self, config):
-
-        self.master = config.get('master')
-
-        self.exclude_ranges = config.get('exclude_ranges')
-        self.exclusions: Dict[str, List[str]] = {}
-        self.inclusions: Dict[str, List[str]] = {}
-
-        if config.get('exclusion_labels') is not None:
-            for exclustion_key, exclustions in config.get('exclusion_labels').items():
-                if exclustion_key not in [MEMBERS, ZONES, DHCP_RANGES]:
-                    raise DiscoveryException(f"Invalid exclusion label {exclustion_key}")
-
-                self.exclusions[exclustion_key] = exclustions
-
-        if config.get('inclusion_labels') is not None:
-            for inclustion_key, inclustions in config.get('inclusion_labels').items():
-                if inclustion_key not in [MEMBERS, ZONES, DHCP_RANGES]:
-                    raise DiscoveryException(f"Invalid inclusion label {inclustion_key}")
-
-                self.inclusions[inclustion_key] = inclustions
-
-        self.opts = {'host': config.get('master'),
-                     'username': config.get('username'),
-                     'password': config.get('password'),
-                     'wapi_version': config.get('wapi_version'),
-                     'http_request_timeout': config.get('timeout', 60)}
-        self.conn = connector.Connector(self.opts)
+        self.opts = {'host': config.master,
+                     'username': config.username,
+                     'password': config.password,
+                     'wapi_version': config.wapi_version,
+                     'http_request_timeout': config.timeout,
+                     'http_pool_connections': config.max_concurrency,
+                     'http_pool_maxsize': config.max_concurrency}
+        self.conn = wapi_connector(self.opts, rate_limiter(config.master, config.requests_per_second, config.burst,
+                                                           config.max_concurrency))
 
     def get_infoblox_members(self) -> Tuple[Dict[str, Member], Dict[str, Node], Dict[str, DNSServer]]:
-        return_fields_member = ['host_name', 'service_status', 'platform', 'enable_ha', 'node_info', 'ntp_setting',
-                                'extattrs']
         try:
-            members_data = self.conn.get_object('member', return_fields=return_fields_member)
+            members_data = self.conn.get_object(MEMBER, return_fields=return_fields(MEMBER))
+        except DeadlineExceeded:
+            raise
         except Exception as err:
             log.error("Fetch members", extra={"error": str(err)})
             raise DiscoveryException("Could not fetch members")
 
+        summary = LogSummary()
+        member_labels = self.extattr_labels(MEMBERS)
+        # The parsed members and the extattr labels indexed by member name
+        records: Dict[str, MemberRecord] = {}
+        labels: Dict[str, Dict[str, str]] = {}
+        for member_data in members_data:
+            if self.validate_exclusion(member_data['extattrs'], [MEMBERS, COMMONS]):
+                summary.add("members_excluded", member_data['host_name'])
+                continue
+            record = member_record(member_data)
+            records[record.host_name] = record
+            labels[record.host_name] = member_labels.labels(member_data['extattrs'])
+
         members: Dict[str, Member] = {}
         nodes: Dict[str, Node] = {}
         dns_servers: Dict[str: DNSServer] = {}
 
-        for member_data in members_data:
-            if self.validate_exclusion(member_data['extattrs'], [MEMBERS]):
-                log.info(f"Exclude infoblox member {member_data['host_name']}")
-                continue
-
-            member = member_factory(member_data, self.master)
-            members[member.host_name] = member
+        for host_name, record in records.items():
+            members[host_name] = member_factory(record, self.master, labels[host_name])
 
-            if member.enable_ha == 'true':
-                for node in member_data['node_info']:
-                    node = node_factory(node, member.host_name, self.master)
-                    nodes[node.ip] = node
+            for node_record in record.nodes:
+                if node_record.role == STANDALONE:
+                    continue
+                if node_record.ip is None:
+                    summary.add("nodes_without_address", host_name)
+                    continue
+                node = node_factory(node_record, host_name, self.master)
+                nodes[node.ip] = node
 
-            for service in member_data['service_status']:
-                if service['service'] == 'DNS' and service['status'] == 'WORKING':
-                    dns_server = dns_server_factory(member.host_name, self.master)
-                    dns_servers[member.host_name] = dns_server
+            if record.service_working('DNS'):
+                dns_servers[host_name] = dns_server_factory(host_name, self.master)
 
-        log.info("Discovered from object member", extra={"members_infoblox": len(members_data), "members_discovery": len(members), "nodes_discovery": len(nodes), "dns_discovery": len(dns_servers)})
+        log.info("Discovered from object member", extra=summary.extra(members_infoblox=len(members_data), members_discovery=len(members), nodes_discovery=len(nodes), dns_discovery=len(dns_servers)))
         return members, nodes, dns_servers
 
-    def validate_exclusion(self, extattrs, exclutions: List[str]) -> bool:
-        if len(extattrs.keys()) > 0:
-            log.debug(f"Extattrs {extattrs}")
-
-        # First check inclusions
-        inclusion_exists = False
-        for inclusion in exclutions:
-            if inclusion in self.inclusions:
-                inclusion_exists = True
-                try:
-                    for inclusion_key in self.inclusions[inclusion]:
-                        if inclusion_key in extattrs and extattrs[inclusion_key]['value'] == 'True':
-                            return False
-                    return True
-                except Exception as err:
-                    log.error(f"Validate inclusion - {str(err)}")
-
-        # Second check exclusions
-        if inclusion_exists:
-            # If inclusion exists and not matched, do not execute exclude logic
-            return True
-        for exclusion in exclutions:
-            if exclusion in self.exclusions:
-                try:
-                    for exclusion_key in self.exclusions[exclusion]:
-                        if exclusion_key in extattrs and extattrs[exclusion_key]['value'] == 'True':
-                            return True
-                    return False
-                except Exception as err:
-                    log.error(f"Validate exclusion - {str(err)}")
+    def get_infoblox_dns_servers(self, dns_servers: Dict[str, DNSServer]) -> Dict[str, DNSServer]:
+        """
+        Add the views and the number of primary and secondary zones to the dns servers. The member:dns
+        objects and the zones of all views are fetched in bulk and joined by member name, independent of
+        the number of dns servers.
+        :param dns_servers: the dns servers found by get_infoblox_members
+        :return: the dns servers with views and zone assignments
+        """
+        if not dns_servers:
+            return {}
+        try:
+            members_dns_data = self.conn.get_object(MEMBER_DNS, return_fields=return_fields(MEMBER_DNS), paging=True)
+            zones_data = self.conn.get_object(ZONE_AUTH, return_fields=ZONE_ASSIGNMENT_FIELDS, paging=True)
+        except DeadlineExceeded:
+            raise
+        except Exception as err:
+            log.error("Fetch dns servers", extra={"error": str(err)})
+            raise DiscoveryException("Could not fetch dns servers")
+
+        views_by_member: Dict[str, List[str]] = {member_dns['host_name']: member_dns.get('views') or []
+                                                 for member_dns in members_dns_data}
+        assignments_by_member = zone_assignments(zones_data)
+
+        enriched: Dict[str, DNSServer] = {}
+        for host_name in dns_servers.keys():
+            enriched[host_name] = dns_server_factory(host_name, self.master, views_by_member.get(host_name),
+                                                     assignments_by_member.get(host_name))
+
+        log.info("Discovered from object member:dns", extra={"members_dns_infoblox": len(members_dns_data), "zones_infoblox": len(zones_data), "dns_discovery": len(enriched)})
+        return enriched
+
+    def _fetch_views(self, object_type: str, view_field: str, views: List[str], query: Dict[str, Any] = None,
+                     **kwargs) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Fetch the objects of all views concurrently over the same connection, the number of concurrent
+        requests is limited by the rate limiter of the master. The views not fetched before the deadline
+        of the collect are left out.
+        :param object_type:
+        :param view_field: the field of the object to query the view
+        :param views:
+        :param query: the query, without the view
+        :param kwargs: the get_object arguments
+        :return: the objects by view
+        :raises DeadlineExceeded: if no view was fetched before the deadline
+        """
+        def fetch(view: str) -> Optional[List[Dict[str, Any]]]:
+            try:
+                return self.conn.get_object(object_type, {**(query or {}), view_field: view}, **kwargs) or []
+            except DeadlineExceeded:
+                return None
+
+        if len(views) == 1 or profiling():
+            # A profiled collect run in the profiled thread
+            objects_by_view = {view: fetch(view) for view in views}
+        else:
+            with ThreadPoolExecutor(max_workers=min(len(views), self.config.max_concurrency),
+                                    thread_name_prefix=f"views-{self.master}") as executor:
+                # The threads run with the deadline of the calling thread
+                futures = {view: executor.submit(contextvars.copy_context().run, fetch, view) for view in views}
+                objects_by_view = {view: future.result() for view, future in futures.items()}
+        fetched = {view: objects for view, objects in objects_by_view.items() if objects is not None}
+        if not fetched:
+            raise DeadlineExceeded(object_type)
+        return fetched
+
+    def _build(self, discovery_type: str, objects_by_view: Dict[str, List[Dict[str, Any]]],
+               build: Callable[[List[Dict[str, Any]], LogSummary, str], Dict[str, Any]]) -> Tuple[Dict[str, Any], LogSummary]:
+        """
+        Build the targets of all views, in the process pool if enabled and there are enough objects,
+        else in this process
+        :param discovery_type:
+        :param objects_by_view: the WAPI objects by view
+        :param build: the builder method used in this process
+        :return: the targets and the log summary
+        """
+        self.rendered.pop(discovery_type, None)
+        targets: Dict[str, Any] = {}
+        rendered: Optional[List[bytes]] = []
+        summary = LogSummary()
+        for view, objects_data in objects_by_view.items():
+            if use_pool(discovery_type, len(objects_data)):
+                view_targets, view_rendered, view_summary = build_in_pool(self.config, discovery_type, objects_data,
+                                                                          view)
+                summary.merge(view_summary)
+            else:
+                view_targets, view_rendered = build(objects_data, summary, view), None
+            targets.update(view_targets)
+            if rendered is not None and view_rendered is not None:
+                rendered.extend(view_rendered)
+            elif view_targets:
+                rendered = None
+        if rendered:
+            self.rendered[discovery_type] = rendered
+        return targets, summary
 
     def get_infoblox_zones(self) -> Dict[str, Zone]:
-        return_fields_range = ['fqdn', 'disable', 'extattrs']
-        query = {'view': 'External'}
         try:
-            zones_data = self.conn.get_object('zone_auth', query, return_fields=return_fields_range)
+            zones_by_view = self._fetch_views(ZONE_AUTH, 'view', self.config.dns_views,
+                                              return_fields=return_fields(ZONE_AUTH))
+        except DeadlineExceeded:
+            raise
         except Exception as err:
             log.error(f"Could not fetch zones - {str(err)}")
             raise DiscoveryException("Could not fetch zones")
 
-        all_zones: Dict[str: Zone] = {}
-        disabled_zones = 0
-        for zone_data in zones_data:
-            log.debug(f"Dns zone {zone_data['fqdn']}")
-            if self.validate_exclusion(zone_data['extattrs'], [ZONES]) or \
-                    'disable' in zone_data and zone_data['disable']:
-                if 'disable' in zone_data and zone_data['disable']:
-                    disabled_zones += 1
-                log.debug(f"Exclude dns zone {zone_data['fqdn']}")
-                continue
-
-            zone = {}
-            if '/' in zone_data['fqdn']:
-                ip = IP(zone_data['fqdn'])
-                log.debug(f"dns zone {ip.reverseName()}")
-
-                zone['name'] = ip.reverseName()
-                zone['address'] = ip.reverseName()
-            else:
-                log.debug(f"dns zone {zone_data['fqdn']} - {zone_data['fqdn'].encode('idna').decode('utf-8')}")
-                zone['name'] = zone_data['fqdn']
-                zone['address'] = zone_data['fqdn'].encode('idna').decode("utf-8")
-
-            z = zone_factory(zone['name'], self.master)
-            all_zones[z.zone] = z
-        log.info("Discovered from object zone_auth", extra={"zones_infoblox": len(zones_data), "zone_disabled": disabled_zones, "zones_discovery": len(all_zones)})
+        all_zones, summary = self._build(ZONES, zones_by_view, self.build_zones)
+        if summary.get("zones_invalid"):
+            log.warning("Not valid zones", extra=summary.extra())
+        log.info("Discovered from object zone_auth", extra=summary.extra(views=",".join(zones_by_view.keys()), zones_infoblox=sum(map(len, zones_by_view.values())), zones_discovery=len(all_zones)))
         return all_zones
 
     def get_infoblox_dhcp_ranges(self) -> Dict[str, DHCP]:
-        return_fields_range = ['network', 'dhcp_utilization', 'dhcp_utilization_status', 'extattrs']
-        query = {'network_view': 'default'}
-
         try:
-            dhcp_ranges_data = self.conn.get_object('range', query, return_fields=return_fields_range, paging=True)
+            ranges_by_view = self._fetch_views(RANGE, 'network_view', self.config.network_views,
+                                               return_fields=return_fields(RANGE), paging=True)
+        except DeadlineExceeded:
+            raise
         except Exception as err:
             log.error(f"Could not get dhcp ranges, {str(err)}")
             raise DiscoveryException("Could not fetch dhcp ranges")
-        dhcp_ranges: Dict[str, DHCP] = {}
-        for dhcp_range in dhcp_ranges_data:
-            if self.validate_exclusion(dhcp_range['extattrs'], [DHCP_RANGES]):
-                log.debug(f"Exclude dhcp scope {dhcp_range['network']}")
-                continue
-
-            # Remove all configured scopes
-            range = int(dhcp_range['network'].split('/')[1])
-            if range in self.exclude_ranges:
-                continue
-
-            dhcp = dhcp_factory(dhcp_range['network'], self.master)
-            dhcp_ranges[dhcp.network] = dhcp
-
-        log.info("Discovered from object range", extra={"dhcp_ranges_infoblox": len(dhcp_ranges_data), "dhcp_ranges_discovery": len(dhcp_ranges)})
+        dhcp_ranges, summary = self._build(DHCP_RANGES, ranges_by_view, self.build_dhcp_ranges)
+        log.info("Discovered from object range", extra=summary.extra(network_views=",".join(ranges_by_view.keys()), dhcp_ranges_infoblox=sum(map(len, ranges_by_view.values())), dhcp_ranges_discovery=len(dhcp_ranges)))
         return dhcp_ranges
 
     def get_web_endpoints_by_networks(self, network) -> Dict[str, WebEndpoint]:
+        filtered = self.network_filter.filtered(network)
+        if filtered is not None:
+            log.info("Web endpoint network not discovered", extra={"network": network, "reason": filtered})
+            return {}
 
         fqdn_by_network = self._get_fqdn_by_network(network)
         web_endpoints: Dict[str, WebEndpoint] = {}
+        web_endpoint_labels = self.extattr_labels(WEB_ENDPOINTS)
         for fqdn in fqdn_by_network:
-            res = self._get_endpoint(fqdn)
+            try:
+                res = self._get_endpoint(fqdn)
+            except DeadlineExceeded:
+                # Keep the web endpoints of the host names fetched in time
+                break
             for dns in res:
-                if 'External' in dns['_ref'] and 'dns_aliases' in dns:
+                if dns.get('view') in self.config.dns_views and 'dns_aliases' in dns:
+                    labels = web_endpoint_labels.labels(dns.get('extattrs'))
                     for alias in dns['dns_aliases']:
-                        web_endpoints[alias] = webendpoint_factory(alias, master=self.master)
+                        web_endpoints[view_key(dns['view'], alias)] = webendpoint_factory(alias, master=self.master,
+                                                                                          extattr_labels=labels,
+                                                                                          view=dns['view'])
         log.info("Discovered from object record:host", extra={"web_endpoints_discovery": len(web_endpoints)})
         return web_endpoints
 
     def _get_fqdn_by_network(self, network):
-        return_fields_range = ['ip_address,names', 'objects', 'types']
-        query = {'network': network}
-        all_names = self.conn.get_object('ipv4address', query, return_fields=return_fields_range)
-
-        names = []
-        for name in all_names:
-            if 'HOST' in name['types']:
-                names.extend(name['names'])
-
-        log.info("Discovered from object ipv4address", extra={"fqdns_discovery": len(names)})
-        return names
+        try:
+            names_by_view = self._fetch_views(IPV4ADDRESS, 'network_view', self.config.network_views,
+                                              {'network': network}, return_fields=return_fields(IPV4ADDRESS))
+        except DeadlineExceeded:
+            raise
+        except Exception as err:
+            log.error(f"Could not fetch ipv4address - {str(err)}")
+            raise DiscoveryException("Could not fetch ipv4address")
+
+        # A host name can be in more than one network view, but is only fetched once
+        names: Dict[str, None] = {}
+        summary = LogSummary()
+        for all_names in names_by_view.values():
+            for name in all_names:
+                if 'HOST' not in name['types']:
+                    continue
+                # Addresses in excluded subnets of the network
+                filtered = self.network_filter.filtered(name['ip_address']) if 'ip_address' in name else None
+                if filtered is not None:
+                    summary.add(f"addresses_{filtered}", name['ip_address'])
+                    continue
+                names.update(dict.fromkeys(name['names']))
+
+        log.info("Discovered from object ipv4address", extra=summary.extra(fqdns_discovery=len(names)))
+        return list(names)
 
     def _get_endpoint(self, dns_fqdn):
-        return_fields_range = ['dns_aliases']
         query = {'name': dns_fqdn}
-        dns = self.conn.get_object('record:host', query, return_fields=return_fields_range)
+        try:
+            dns = self.conn.get_object(RECORD_HOST, query, return_fields=return_fields(RECORD_HOST))
+        except DeadlineExceeded:
+            raise
+        except Exception as err:
+            log.error(f"Could not fetch record:host - {str(err)}")
+            raise DiscoveryException("Could not fetch record:host")
         return dns
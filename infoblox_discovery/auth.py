@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+import logging as log
+from collections import OrderedDict
+from typing import Dict, Optional, List, Callable
+
+import yaml
+
+from infoblox_discovery.environments import DISCOVERY_BASIC_AUTH_ENABLED, DISCOVERY_BASIC_AUTH_USERNAME, \
+    DISCOVERY_BASIC_AUTH_PASSWORD, DISCOVERY_BASIC_AUTH_USERS_FILE, DISCOVERY_BASIC_AUTH_CACHE_TTL
+from infoblox_discovery.exceptions import DiscoveryException
+
+try:
+    import bcrypt
+except ImportError:
+    bcrypt = None
+
+try:
+    from argon2 import PasswordHasher
+    from argon2.exceptions import VerificationError, InvalidHashError
+except ImportError:
+    PasswordHasher = None
+
+PBKDF2_PREFIX = 'pbkdf2_sha256$'
+PBKDF2_ITERATIONS = 260000
+VERIFIED_CACHE_SIZE = 1024
+# Seconds a rejected header is rejected without verifying the password again
+REJECTED_CACHE_TTL = 5
+
+
+def hash_password(password: str, iterations: int = PBKDF2_ITERATIONS) -> str:
+    """
+    Create a pbkdf2_sha256 hash of a password that can be used in the users file
+    :param password:
+    :param iterations:
+    :return:
+    """
+    salt = secrets.token_hex(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt.encode('utf-8'), iterations)
+    return f"{PBKDF2_PREFIX}{iterations}${salt}${digest.hex()}"
+
+
+def password_verifier(credential: str) -> Callable[[bytes], bool]:
+    """
+    Create a function that verify a password against a configured credential. The credential
+    can be a pbkdf2_sha256, bcrypt or argon2 hash, or a plain text password
+    :param credential:
+    :return:
+    """
+    if credential.startswith(PBKDF2_PREFIX):
+        try:
+            _, iterations, salt, digest = credential.split('$')
+            expected = bytes.fromhex(digest)
+            rounds = int(iterations)
+        except ValueError:
+            raise DiscoveryException("Not a valid pbkdf2_sha256 hash")
+        return lambda password: hmac.compare_digest(
+            hashlib.pbkdf2_hmac('sha256', password, salt.encode('utf-8'), rounds), expected)
+
+    if credential.startswith(('$2a$', '$2b$', '$2y$')):
+        if bcrypt is None:
+            raise DiscoveryException("bcrypt hashed credentials require the bcrypt package")
+        hashed = credential.encode('utf-8')
+        return lambda password: bcrypt.checkpw(password, hashed)
+
+    if credential.startswith('$argon2'):
+        if PasswordHasher is None:
+            raise DiscoveryException("argon2 hashed credentials require the argon2-cffi package")
+        hasher = PasswordHasher()
+
+        def verify_argon2(password: bytes) -> bool:
+            try:
+                return hasher.verify(credential, password)
+            except (VerificationError, InvalidHashError):
+                return False
+        return verify_argon2
+
+    expected_password = credential.encode('utf-8')
+    return lambda password: secrets.compare_digest(password, expected_password)
+
+
+class Authenticator:
+    """
+    Verify the authorization header of a request against credentials loaded once. Verified
+    headers are kept, as a digest, in a short lived lru cache so a slow password hash is not
+    calculated for every request from the same client. Rejected headers are kept for a few
+    seconds, so a client with a wrong password does not calculate the hash for every request.
+    """
+    def __init__(self, enabled: bool, cache_ttl: int = 60):
+        self.enabled = enabled
+        self.cache_ttl = cache_ttl
+        self._users: Dict[str, Callable[[bytes], bool]] = {}
+        self._token_digests: List[bytes] = []
+        self._verified: OrderedDict = OrderedDict()
+        self._rejected: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add_user(self, username: str, credential: str):
+        self._users[username] = password_verifier(credential)
+
+    def add_token(self, token: str):
+        self._token_digests.append(hashlib.sha256(token.encode('utf-8')).digest())
+
+    def has_credentials(self) -> bool:
+        return bool(self._users or self._token_digests)
+
+    def _verify_basic(self, encoded: str) -> bool:
+        try:
+            username, separator, password = base64.b64decode(encoded, validate=True).decode('utf-8').partition(':')
+        except (binascii.Error, UnicodeDecodeError):
+            return False
+        if not separator or username not in self._users:
+            return False
+        return self._users[username](password.encode('utf-8'))
+
+    def _verify_token(self, token: str) -> bool:
+        digest = hashlib.sha256(token.encode('utf-8')).digest()
+        valid = False
+        for token_digest in self._token_digests:
+            valid |= hmac.compare_digest(digest, token_digest)
+        return valid
+
+    def verify(self, authorization: Optional[str]) -> bool:
+        if not self.enabled:
+            return True
+        if not authorization:
+            return False
+
+        header_digest = hashlib.sha256(authorization.encode('utf-8')).digest()
+        now = time.monotonic()
+        with self._lock:
+            if self._cached(self._verified, header_digest, now):
+                return True
+            if self._cached(self._rejected, header_digest, now):
+                return False
+
+        scheme, _, value = authorization.partition(' ')
+        scheme = scheme.lower()
+        if scheme == 'basic':
+            valid = self._verify_basic(value.strip())
+        elif scheme == 'bearer':
+            valid = self._verify_token(value.strip())
+        else:
+            valid = False
+
+        with self._lock:
+            if valid:
+                self._add(self._verified, header_digest, now + self.cache_ttl)
+            else:
+                self._add(self._rejected, header_digest, now + REJECTED_CACHE_TTL)
+        return valid
+
+    @staticmethod
+    def _cached(cache: OrderedDict, header_digest: bytes, now: float) -> bool:
+        expire = cache.get(header_digest)
+        if expire is None:
+            return False
+        if expire > now:
+            cache.move_to_end(header_digest)
+            return True
+        del cache[header_digest]
+        return False
+
+    @staticmethod
+    def _add(cache: OrderedDict, header_digest: bytes, expire: float):
+        cache[header_digest] = expire
+        if len(cache) > VERIFIED_CACHE_SIZE:
+            cache.popitem(last=False)
+
+
+def authenticator_factory() -> Authenticator:
+    """
+    Create the authenticator from the environment and the optional users file
+    :return:
+    """
+    authenticator = Authenticator(enabled=os.getenv(DISCOVERY_BASIC_AUTH_ENABLED) == "true",
+                                  cache_ttl=int(os.getenv(DISCOVERY_BASIC_AUTH_CACHE_TTL, '60')))
+    if not authenticator.enabled:
+        return authenticator
+
+    if os.getenv(DISCOVERY_BASIC_AUTH_USERNAME) and os.getenv(DISCOVERY_BASIC_AUTH_PASSWORD):
+        authenticator.add_user(os.getenv(DISCOVERY_BASIC_AUTH_USERNAME), os.getenv(DISCOVERY_BASIC_AUTH_PASSWORD))
+
+    if os.getenv(DISCOVERY_BASIC_AUTH_USERS_FILE):
+        with open(os.getenv(DISCOVERY_BASIC_AUTH_USERS_FILE), 'r') as users_file:
+            users_config = yaml.safe_load(users_file) or {}
+        for username, credential in (users_config.get('users') or {}).items():
+            authenticator.add_user(str(username), str(credential))
+        for token in users_config.get('tokens') or []:
+            authenticator.add_token(str(token))
+
+    if not authenticator.has_credentials():
+        log.error("Basic auth is enabled but no credentials are configured")
+    return authenticator
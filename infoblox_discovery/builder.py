@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+from typing import Dict, List, Any
+
+import logging as log
+
+from infoblox_discovery.config import InfobloxConfig, COMMONS
+from infoblox_discovery.extattr_labels import ExtattrLabels
+from infoblox_discovery.infoblox_dhcp import DHCP, dhcp_factory
+from infoblox_discovery.infoblox_zone import Zone, zone_factory
+from infoblox_discovery.log_summary import LogSummary
+from infoblox_discovery.zone_names import zone_names
+
+MEMBERS = "members"
+WEB_ENDPOINTS = "web_endpoints"
+ZONES = "zones"
+DHCP_RANGES = "dhcp_ranges"
+
+
+def view_key(view: str, name: str) -> str:
+    """
+    The key of a target that can exist in more than one view, like a zone or a network
+    :param view:
+    :param name:
+    :return:
+    """
+    return f"{view}/{name}"
+
+
+class ObjectBuilder:
+    """
+    Filter the WAPI objects and build the targets. Only depend on the configuration, so the
+    objects can be built in another process.
+    """
+    def __init__(self, config: InfobloxConfig):
+        self.master = config.master
+
+        self.exclude_ranges = frozenset(config.exclude_ranges)
+        self.network_filter = config.network_filter
+        self.exclusions: Dict[str, List[str]] = config.exclusion_labels
+        self.inclusions: Dict[str, List[str]] = config.inclusion_labels
+        self.config = config
+        # type -> extattr labels, shared by all targets of the type in this collect
+        self._extattr_labels: Dict[str, ExtattrLabels] = {}
+
+    def extattr_labels(self, discovery_type: str) -> ExtattrLabels:
+        if discovery_type not in self._extattr_labels:
+            self._extattr_labels[discovery_type] = ExtattrLabels(self.config.extattr_label_mapping(discovery_type))
+        return self._extattr_labels[discovery_type]
+
+    def validate_exclusion(self, extattrs, exclutions: List[str]) -> bool:
+        if extattrs:
+            log.debug("Extattrs %s", extattrs)
+
+        # First check inclusions
+        inclusion_exists = False
+        for inclusion in exclutions:
+            if inclusion in self.inclusions:
+                inclusion_exists = True
+                try:
+                    for inclusion_key in self.inclusions[inclusion]:
+                        if inclusion_key in extattrs and extattrs[inclusion_key]['value'] == 'True':
+                            return False
+                except Exception as err:
+                    log.error(f"Validate inclusion - {str(err)}")
+
+        # Second check exclusions
+        if inclusion_exists:
+            # If inclusion exists and not matched, do not execute exclude logic
+            return True
+        for exclusion in exclutions:
+            if exclusion in self.exclusions:
+                try:
+                    for exclusion_key in self.exclusions[exclusion]:
+                        if exclusion_key in extattrs and extattrs[exclusion_key]['value'] == 'True':
+                            return True
+                except Exception as err:
+                    log.error(f"Validate exclusion - {str(err)}")
+        return False
+
+    def build_zones(self, zones_data: List[Dict[str, Any]], summary: LogSummary, view: str) -> Dict[str, Zone]:
+        all_zones: Dict[str: Zone] = {}
+        zone_labels = self.extattr_labels(ZONES)
+        for zone_data in zones_data:
+            if 'disable' in zone_data and zone_data['disable']:
+                summary.add("zone_disabled")
+                continue
+            if self.validate_exclusion(zone_data['extattrs'], [ZONES, COMMONS]):
+                summary.add("zones_excluded", zone_data['fqdn'])
+                continue
+            try:
+                name, address = zone_names(zone_data['fqdn'])
+            except ValueError:
+                summary.add("zones_invalid", zone_data['fqdn'])
+                continue
+            z = zone_factory(name, address, self.master, zone_labels.labels(zone_data['extattrs']), view)
+            all_zones[view_key(view, z.zone)] = z
+        return all_zones
+
+    def build_dhcp_ranges(self, dhcp_ranges_data: List[Dict[str, Any]], summary: LogSummary,
+                          view: str) -> Dict[str, DHCP]:
+        dhcp_ranges: Dict[str, DHCP] = {}
+        dhcp_labels = self.extattr_labels(DHCP_RANGES)
+        for dhcp_range in dhcp_ranges_data:
+            if self.validate_exclusion(dhcp_range['extattrs'], [DHCP_RANGES, COMMONS]):
+                summary.add("dhcp_ranges_excluded", dhcp_range['network'])
+                continue
+
+            # Remove all configured scopes
+            range = int(dhcp_range['network'].split('/')[1])
+            if range in self.exclude_ranges:
+                summary.add("dhcp_ranges_excluded_prefix")
+                continue
+            filtered = self.network_filter.filtered(dhcp_range['network'])
+            if filtered is not None:
+                summary.add(f"dhcp_ranges_{filtered}", dhcp_range['network'])
+                continue
+
+            dhcp = dhcp_factory(dhcp_range['network'], self.master, dhcp_range.get('dhcp_utilization'),
+                                dhcp_range.get('dhcp_utilization_status'),
+                                dhcp_labels.labels(dhcp_range['extattrs']), view)
+            dhcp_ranges[view_key(view, dhcp.network)] = dhcp
+        return dhcp_ranges
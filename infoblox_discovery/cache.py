@@ -19,11 +19,14 @@
 
 """
 
+import math
 import os
+import threading
 import time
-import logging as log
-from typing import Dict, List, Any
-from infoblox_discovery.environments import DISCOVERY_CACHE_TTL
+from typing import Dict, List, Any, Optional, Tuple
+from infoblox_discovery.columns import target_columns, default_codec
+from infoblox_discovery.diff import TargetDiff, fingerprint_entries, diff_fingerprints
+from infoblox_discovery.environments import DISCOVERY_CACHE_TTL, DISCOVERY_CACHE_COMPRESSED_TYPES
 
 
 MEMBERS = 'members'
@@ -34,7 +37,23 @@ DHCP_RANGES = 'dhcp_ranges'
 WEB_ENDPOINTS = 'web_endpoints'
 VALID_TYPES = [MEMBERS, NODES, ZONES, DHCP_RANGES, DNS_SERVERS, WEB_ENDPOINTS]
 
+# The cache types populated by each discovery type
+DISCOVERY_CACHE_TYPES = {MEMBERS: [MEMBERS, NODES, DNS_SERVERS],
+                         ZONES: [ZONES],
+                         DHCP_RANGES: [DHCP_RANGES],
+                         WEB_ENDPOINTS: [WEB_ENDPOINTS]}
+
+# The order discovery types are collected, the types that are fast to collect first
+DISCOVERY_PRIORITY = {MEMBERS: 0, ZONES: 1, DHCP_RANGES: 2, WEB_ENDPOINTS: 3}
+
 MASTER = 'master'
+TYPE = 'type'
+
+# The status of the cached data for a master and type
+STATUS_OK = 'ok'
+STATUS_STALE = 'stale'
+STATUS_FAILED = 'failed'
+STATUS_PARTIAL = 'partial'
 
 
 class Singleton(type):
@@ -49,27 +68,239 @@ class Singleton(type):
 class Cache(metaclass=Singleton):
 
     def __init__(self):
+        # The data for a master and type is served until ttl after the last successful collect
         self._ttl: int = int(os.getenv(DISCOVERY_CACHE_TTL, "7200"))
-        self._expire: int = 0
+        # The types that are rarely requested and kept compressed, see columns.py
+        self._compressed_types: List[str] = [t.strip() for t in os.getenv(DISCOVERY_CACHE_COMPRESSED_TYPES, "").split(',')
+                                             if t.strip()]
         # master->type-> data
         self._collect_count: Dict[str, int] = {}
         self._collect_time: Dict[str, int] = {}
         self._collect_count_failed: Dict[str, int] = {}
         self._cache: Dict[str, Dict[str, List]] = {}
+        # Make etags unique between restarts
+        self._instance: str = format(time.time_ns(), 'x')
+        self._sequence: int = 0
+        self._generation: Dict[str, Dict[str, int]] = {}
+        self._fingerprints: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self._changes: Dict[str, Dict[str, TargetDiff]] = {}
+        self._churn: Dict[str, Dict[str, Dict[str, int]]] = {}
+        self._collected: Dict[str, Dict[str, float]] = {}
+        self._failures: Dict[str, Dict[str, int]] = {}
+        # Requests served from the cache, counted instead of logged
+        self._hits: Dict[str, Dict[str, int]] = {}
+        self._misses: Dict[str, Dict[str, int]] = {}
+        # Targets rendered as blocks of the sd json array when collected, see pool.py
+        self._rendered: Dict[str, Dict[str, Optional[List[bytes]]]] = {}
+        # The stages that ran out of time in the last collect, if the data is partial
+        self._partial: Dict[str, Dict[str, Optional[List[str]]]] = {}
+        self._deadline_exceeded: Dict[str, Dict[str, int]] = {}
+        # The types of a master are collected concurrently, reentrant since put take it before _add_master
+        self._lock = threading.RLock()
+
+    def put(self, master: str, type: str, data: List[Any], rendered: Optional[List[bytes]] = None,
+            partial: Optional[List[str]] = None) -> TargetDiff:
+        """
+        Put the collected data for master and type. If the targets and labels are the same as
+        already in the cache the generation and etag are kept, but the data is replaced since it
+        can have values that are not labels, like the dhcp utilization. The data is stored as
+        columns, see columns.py.
+        :param master:
+        :param type:
+        :param data:
+        :param rendered: the data already rendered as blocks of the sd json array, if any
+        :param partial: the stages that ran out of time, if only a part of the data was collected
+        :return: the difference to the data already in the cache
+        """
+        entries = [d.as_prometheus_file_sd_entry() for d in data]
+        new_fingerprints = fingerprint_entries(entries)
+        codec = default_codec() if type in self._compressed_types else None
+        data = target_columns(data, entries, codec) or data
+
+        with self._lock:
+            self._add_master(master)
+            self._collected[master][type] = time.time()
+            self._failures[master][type] = 0
+            self._rendered[master][type] = rendered
+            self._partial[master][type] = partial
+
+            diff = diff_fingerprints(self._fingerprints[master].get(type, {}), new_fingerprints)
+            if type in self._cache[master] and diff.is_empty():
+                self._cache[master][type] = data
+                return diff
+
+            self._cache[master][type] = data
+            self._fingerprints[master][type] = new_fingerprints
+            self._sequence += 1
+            self._generation[master][type] = self._sequence
+            self._changes[master][type] = diff
+            churn = self._churn[master].setdefault(type, {})
+            for change, count in diff.counts().items():
+                churn[change] = churn.get(change, 0) + count
+            return diff
+
+    def _add_master(self, master: str):
+        with self._lock:
+            if master not in self._cache:
+                for entries in self._entries():
+                    entries[master] = {}
+
+    def _entries(self) -> List[Dict[str, Dict[str, Any]]]:
+        return [self._cache, self._generation, self._fingerprints, self._changes, self._churn, self._collected,
+                self._failures, self._hits, self._misses, self._rendered, self._partial, self._deadline_exceeded]
+
+    def _valid(self, master: str, type: str) -> bool:
+        collected = self._collected.get(master, {}).get(type)
+        return collected is not None and time.time() - collected < self._ttl and type in self._cache[master]
+
+    def put_failed(self, master: str, type: str):
+        """
+        Register a failed collect for master and type. The data already in the cache is kept
+        and served as stale until ttl after the last successful collect.
+        :param master:
+        :param type:
+        :return:
+        """
+        with self._lock:
+            self._add_master(master)
+            self._failures[master][type] = self._failures[master].get(type, 0) + 1
+
+    def get_failures(self, master: str, type: str) -> int:
+        return self._failures.get(master, {}).get(type, 0)
+
+    def get_partial(self, master: str, type: str) -> Optional[List[str]]:
+        """
+        Get the stages that ran out of time in the last successful collect
+        :param master:
+        :param type:
+        :return: the stages or None if the collect was complete
+        """
+        return self._partial.get(master, {}).get(type)
+
+    def count_deadline_exceeded(self, master: str, type: str):
+        self._add_master(master)
+        self._deadline_exceeded[master][type] = self._deadline_exceeded[master].get(type, 0) + 1
 
-    def put(self, master: str, type: str, data: List[Any]):
-        self._expire = time.time() + self._ttl
-        if master not in self._cache:
-            self._cache[master] = {}
-        self._cache[master][type] = data
+    def get_deadline_exceeded(self, master: str, type: str) -> int:
+        return self._deadline_exceeded.get(master, {}).get(type, 0)
+
+    def get_status(self, master: str, type: str) -> Tuple[str, float]:
+        """
+        Get the status and the seconds since the last successful collect
+        :param master:
+        :param type:
+        :return:
+        """
+        collected = self._collected.get(master, {}).get(type)
+        staleness = time.time() - collected if collected is not None else math.inf
+        if not self._valid(master, type):
+            return STATUS_FAILED, staleness
+        if self.get_failures(master, type) > 0:
+            return STATUS_STALE, staleness
+        if self.get_partial(master, type):
+            return STATUS_PARTIAL, staleness
+        return STATUS_OK, staleness
+
+    def get_types(self) -> Dict[str, List[str]]:
+        """
+        Get the types, collected or failed, by master
+        :return:
+        """
+        return {master: list(types.keys()) for master, types in list(self._failures.items())}
 
     def get(self, master: str, type: str) -> List[Any]:
-        if time.time() < self._expire and master in self._cache and type in self._cache[master]:
-            log.info("Cache", extra={"hit": True})
+        if self._valid(master, type):
             return self._cache[master][type]
-        log.info("Cache", extra={"hit": False})
         return []
 
+    def get_rendered(self, master: str, type: str) -> Optional[List[bytes]]:
+        """
+        Get the rendered blocks of the data returned by get, None if the data was not rendered when collected
+        :param master:
+        :param type:
+        :return:
+        """
+        if self._valid(master, type):
+            return self._rendered[master].get(type)
+        return None
+
+    def get_stale(self, master: str, type: str) -> List[Any]:
+        """
+        Get the data also if it has expired, until evicted
+        :param master:
+        :param type:
+        :return:
+        """
+        return self._cache.get(master, {}).get(type, [])
+
+    def count_request(self, master: str, type: str, hit: bool):
+        """
+        Count a request for the data of master and type, requests for unknown masters are not counted
+        :param master:
+        :param type:
+        :param hit: true if the request was served with valid data
+        :return:
+        """
+        counts = self._hits if hit else self._misses
+        if master in counts:
+            counts[master][type] = counts[master].get(type, 0) + 1
+
+    def get_hits(self, master: str, type: str) -> int:
+        return self._hits.get(master, {}).get(type, 0)
+
+    def get_misses(self, master: str, type: str) -> int:
+        return self._misses.get(master, {}).get(type, 0)
+
+    def get_ttl(self) -> int:
+        return self._ttl
+
+    def get_generation(self, master: str, type: str) -> int:
+        return self._generation.get(master, {}).get(type, 0)
+
+    def get_state(self) -> Dict[str, Dict[str, Tuple[int, str]]]:
+        """
+        Get the generation and status of every master and type, the state change when the targets
+        or the status of any of them change
+        :return:
+        """
+        return {master: {type: (self.get_generation(master, type), self.get_status(master, type)[0]) for type in types}
+                for master, types in self.get_types().items()}
+
+    def get_etag(self, master: str, type: str) -> Optional[str]:
+        """
+        Get the etag of the data returned by get
+        :param master:
+        :param type:
+        :return:
+        """
+        if self._valid(master, type):
+            return f'"{self._instance}-{self._generation[master][type]}"'
+        return None
+
+    def get_changes(self, master: str, type: str) -> Optional[TargetDiff]:
+        return self._changes.get(master, {}).get(type)
+
+    def get_churn(self) -> Dict[str, Dict[str, Dict[str, int]]]:
+        return self._churn
+
+    def evict(self, master: str, type: str = None):
+        """
+        Remove a type, or everything if type is not set, for the master
+        :param master:
+        :param type:
+        :return:
+        """
+        with self._lock:
+            if type is not None:
+                for entries in self._entries():
+                    entries.get(master, {}).pop(type, None)
+                return
+            for entries in self._entries():
+                entries.pop(master, None)
+            self._collect_count.pop(master, None)
+            self._collect_time.pop(master, None)
+            self._collect_count_failed.pop(master, None)
+
     def get_all(self) -> Dict[str, Dict[str, List]]:
         return self._cache
 
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import socket
+import threading
+import time
+from typing import Dict, Optional, Tuple, Any, List
+from urllib.parse import urlparse
+
+from infoblox_discovery.exceptions import DiscoveryException
+
+MEMORY = 'memory'
+REDIS = 'redis'
+# All keys are prefixed so a redis server can be shared with other applications
+KEY_PREFIX = 'infoblox_discovery:'
+
+
+class CacheBackend:
+    """
+    The store shared by the replicas of the service, the published snapshot and the leader lease
+    """
+    # True if the backend is shared between replicas
+    shared: bool = False
+
+    def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: bytes):
+        raise NotImplementedError
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        """
+        Acquire the lease, or renew it if already owned
+        :param key:
+        :param owner: the unique name of the replica
+        :param ttl: the seconds until the lease expire if not renewed
+        :return: true if the owner hold the lease
+        """
+        raise NotImplementedError
+
+    def release_lease(self, key: str, owner: str):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """
+    The in-process backend, there is only one replica that is always the leader
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, bytes] = {}
+        # key -> owner and monotonic expire time
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self._data.get(key)
+
+    def set(self, key: str, value: bytes):
+        self._data[key] = value
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            lease = self._leases.get(key)
+            if lease is not None and lease[0] != owner and lease[1] > now:
+                return False
+            self._leases[key] = (owner, now + ttl)
+            return True
+
+    def release_lease(self, key: str, owner: str):
+        with self._lock:
+            if key in self._leases and self._leases[key][0] == owner:
+                del self._leases[key]
+
+
+class RespError(Exception):
+    pass
+
+
+class RespClient:
+    """
+    A minimal, thread safe, client of the redis protocol (RESP2). A command is sent again once
+    on a new connection if the connection is lost.
+    """
+    def __init__(self, host: str, port: int, db: int = 0, password: Optional[str] = None, timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.password = password
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._sock: Optional[socket.socket] = None
+        self._file = None
+
+    def _connect(self):
+        self._sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        self._file = self._sock.makefile('rb')
+        if self.password:
+            self._command('AUTH', self.password)
+        if self.db:
+            self._command('SELECT', self.db)
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        if self._sock is not None:
+            try:
+                self._file.close()
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = None
+        self._file = None
+
+    def execute(self, *args) -> Any:
+        with self._lock:
+            for attempt in range(2):
+                try:
+                    if self._sock is None:
+                        self._connect()
+                    return self._command(*args)
+                except (OSError, EOFError) as err:
+                    self._close()
+                    if attempt:
+                        raise DiscoveryException(f"Cache backend {self.host}:{self.port} - {str(err)}", exp=err)
+
+    def _command(self, *args) -> Any:
+        self._sock.sendall(encode_command(args))
+        return self._reply()
+
+    def _reply(self) -> Any:
+        line = self._file.readline()
+        if not line.endswith(b'\r\n'):
+            raise EOFError("Connection closed")
+        kind, value = line[:1], line[1:-2]
+        if kind == b'+':
+            return value.decode('utf-8')
+        if kind == b'-':
+            raise RespError(value.decode('utf-8'))
+        if kind == b':':
+            return int(value)
+        if kind == b'$':
+            length = int(value)
+            if length < 0:
+                return None
+            data = self._file.read(length + 2)
+            if len(data) != length + 2:
+                raise EOFError("Connection closed")
+            return data[:-2]
+        if kind == b'*':
+            length = int(value)
+            return None if length < 0 else [self._reply() for _ in range(length)]
+        raise RespError(f"Not a valid reply {line!r}")
+
+
+def encode_command(args: Tuple[Any, ...]) -> bytes:
+    parts: List[bytes] = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(parts)
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    A backend on a redis protocol compatible server, shared by all replicas
+    """
+    shared = True
+
+    def __init__(self, client: RespClient):
+        self.client = client
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.execute('GET', KEY_PREFIX + key)
+
+    def set(self, key: str, value: bytes):
+        self.client.execute('SET', KEY_PREFIX + key, value)
+
+    def acquire_lease(self, key: str, owner: str, ttl: float) -> bool:
+        key = KEY_PREFIX + key
+        ttl_ms = max(int(ttl * 1000), 1)
+        if self.client.execute('SET', key, owner, 'NX', 'PX', ttl_ms) == 'OK':
+            return True
+        # The lease may expire and be taken between the GET and the PEXPIRE, the other replica
+        # then get a longer lease and this replica find out at the next renew
+        if self.client.execute('GET', key) == owner.encode('utf-8'):
+            return self.client.execute('PEXPIRE', key, ttl_ms) == 1
+        return False
+
+    def release_lease(self, key: str, owner: str):
+        key = KEY_PREFIX + key
+        if self.client.execute('GET', key) == owner.encode('utf-8'):
+            self.client.execute('DEL', key)
+
+
+def cache_backend_factory(url: str) -> CacheBackend:
+    """
+    Create the backend from an url, memory:// or redis://[:password@]host[:port][/db]
+    :param url:
+    :return:
+    """
+    parsed = urlparse(url)
+    if parsed.scheme in ('', MEMORY):
+        return MemoryCacheBackend()
+    if parsed.scheme == REDIS:
+        try:
+            db = int(parsed.path.strip('/') or 0)
+            port = parsed.port or 6379
+        except ValueError as err:
+            raise DiscoveryException(f"Not a valid cache backend {url} - {str(err)}")
+        return RedisCacheBackend(RespClient(parsed.hostname or 'localhost', port, db, parsed.password))
+    raise DiscoveryException(f"Not a valid cache backend {parsed.scheme}")
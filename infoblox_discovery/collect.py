@@ -0,0 +1,426 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import datetime
+import os
+import threading
+import time
+import logging as log
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Any, Optional, Dict, Callable, Tuple
+
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.cache import Cache, MEMBERS, NODES, ZONES, DHCP_RANGES, DNS_SERVERS, WEB_ENDPOINTS, \
+    DISCOVERY_CACHE_TYPES, DISCOVERY_PRIORITY
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.config import ConfigWatcher, ConfigChange, InfobloxConfig
+from infoblox_discovery.deadline import Deadline, DeadlineExceeded, deadline_scope
+from infoblox_discovery.ratelimit import remove_rate_limiter
+from infoblox_discovery.response_cache import response_cache
+from infoblox_discovery.wapi import remove_response_stats
+from infoblox_discovery.environments import DISCOVERY_CONFIG, DISCOVERY_CONFIG_RELOAD_INTERVAL, \
+    DISCOVERY_FETCH_INTERVAL, DISCOVERY_RETRY_BACKOFF, DISCOVERY_RETRY_BACKOFF_MAX, DISCOVERY_RETRY_MAX, \
+    DISCOVERY_COLLECT_CONCURRENCY, DISCOVERY_COLLECT_BUDGET, DISCOVERY_TYPE_BUDGET
+
+_config_watcher: Optional[ConfigWatcher] = None
+_scheduler = None
+_after_collect: Optional[Callable[[], None]] = None
+# Only the leader of replicas that share a cache backend collect
+_is_leader: Optional[Callable[[], bool]] = None
+
+
+def config_watcher() -> ConfigWatcher:
+    global _config_watcher
+    if _config_watcher is None:
+        _config_watcher = ConfigWatcher(os.getenv(DISCOVERY_CONFIG, 'config.yml'))
+    return _config_watcher
+
+
+def apply_config_change(change: Optional[ConfigChange]):
+    """
+    Evict removed masters and discovery types from the cache
+    :param change:
+    :return:
+    """
+    if change is None:
+        return
+    cache = Cache()
+    for master in change.removed:
+        log.info("Evict removed master", extra={"master": master})
+        cache.evict(master)
+        remove_rate_limiter(master)
+        remove_response_stats(master)
+        response_cache().clear(master)
+    for master in change.changed:
+        # The responses of the previous views or connection settings
+        response_cache().clear(master)
+    for master, discovery_types in change.dropped.items():
+        for discovery_type in discovery_types:
+            for cache_type in DISCOVERY_CACHE_TYPES[discovery_type]:
+                cache.evict(master, cache_type)
+    if (change.removed or change.dropped) and _after_collect is not None:
+        _after_collect()
+
+
+def fill_cache(concurrency: Optional[int] = None):
+    """
+    Collect data from Infoblox for all masters and discovery types
+    Any change in the configuration file is applied before collecting
+    :param concurrency: the max number of collect tasks at the same time
+    :return:
+    """
+    apply_config_change(config_watcher().poll())
+    collect_masters([(ib, ib.discovery) for ib in list(config_watcher().get_configs().values())], concurrency)
+
+
+def reload_config():
+    """
+    Check the configuration file for changes and only collect the masters and discovery types
+    that changed
+    :return:
+    """
+    change = config_watcher().poll()
+    if change is None or change.is_empty():
+        return
+    apply_config_change(change)
+    configs = config_watcher().get_configs()
+    collect_masters([(configs[master], discovery_types) for master, discovery_types in change.changed.items()])
+
+
+def collect_now(master: Optional[str] = None, concurrency: Optional[int] = None):
+    """
+    Collect all discovery types now, outside the schedule
+    :param master: the master to collect, all masters if not set
+    :param concurrency: the max number of collect tasks at the same time
+    :return:
+    """
+    # Collect now fetch everything from the masters again
+    response_cache().clear(master)
+    if master is None:
+        fill_cache(concurrency)
+        return
+    apply_config_change(config_watcher().poll())
+    ib = config_watcher().get_configs().get(master)
+    if ib is None:
+        raise DiscoveryException(f"Master {master} is not configured", status=404)
+    collect_masters([(ib, ib.discovery)], concurrency)
+
+
+def collectable_type(master: str, cache_type: str) -> Optional[str]:
+    """
+    Get the discovery type that populate a cache type of a master
+    :param master:
+    :param cache_type:
+    :return: the discovery type or None if the master is not configured to collect it
+    """
+    ib = config_watcher().get_configs().get(master)
+    if ib is None:
+        return None
+    for discovery_type in ib.discovery:
+        if cache_type in DISCOVERY_CACHE_TYPES[discovery_type]:
+            return discovery_type
+    return None
+
+
+def refresh_type(master: str, discovery_type: str):
+    """
+    Collect a discovery type of a master on demand, e.g. when requested data is not in the cache
+    :param master:
+    :param discovery_type:
+    :return:
+    """
+    ib = config_watcher().get_configs().get(master)
+    if ib is None or discovery_type not in ib.discovery:
+        return
+    log.info("On demand collect", extra={"master": master, "type": discovery_type})
+    collect_master(ib, [discovery_type])
+
+
+def collect_type(infoblox: InfoBlox, ib: InfobloxConfig, discovery_type: str) -> Dict[str, List[Any]]:
+    """
+    Collect a discovery type. If the deadline is exceeded after a part of the type is collected,
+    like some of the views or networks, that part is returned.
+    :param infoblox:
+    :param ib:
+    :param discovery_type:
+    :return: the collected data by cache type
+    """
+    if discovery_type == MEMBERS:
+        members, nodes, dns_servers = infoblox.get_infoblox_members()
+        try:
+            dns_servers = infoblox.get_infoblox_dns_servers(dns_servers)
+        except DeadlineExceeded:
+            # The dns servers without views and zone assignments
+            pass
+        except DiscoveryException as err:
+            log.warning("Failed to collect dns server views and zones, not enriched",
+                        extra={"master": ib.master, "error": err.message})
+        return {MEMBERS: list(members.values()), NODES: list(nodes.values()),
+                DNS_SERVERS: list(dns_servers.values())}
+
+    if discovery_type == ZONES:
+        return {ZONES: list(infoblox.get_infoblox_zones().values())}
+
+    if discovery_type == DHCP_RANGES:
+        return {DHCP_RANGES: list(infoblox.get_infoblox_dhcp_ranges().values())}
+
+    if discovery_type == WEB_ENDPOINTS and ib.web_endpoint_networks:
+        web_endpoints = {}
+        for index, network in enumerate(ib.web_endpoint_networks):
+            try:
+                web_endpoints.update(infoblox.get_web_endpoints_by_networks(network))
+            except DeadlineExceeded:
+                if index == 0:
+                    raise
+                break
+        return {WEB_ENDPOINTS: list(web_endpoints.values())}
+
+    return {}
+
+
+class MasterCollect:
+    """
+    The collect of discovery types of a master, run as one task per discovery type. The tasks share
+    the connection to the master, and the collect of the master is done when the last task is done.
+    """
+    def __init__(self, ib: InfobloxConfig, discovery_types: List[str]):
+        self.ib = ib
+        self.discovery_types = discovery_types
+        self.start_time = time.time()
+        self.failed: List[str] = []
+        self._remaining = len(discovery_types)
+        self._lock = threading.Lock()
+        self._infoblox: Optional[InfoBlox] = None
+        self._connect_error: Optional[Exception] = None
+
+    def infoblox(self) -> InfoBlox:
+        with self._lock:
+            if self._infoblox is None and self._connect_error is None:
+                try:
+                    self._infoblox = InfoBlox(self.ib)
+                except Exception as err:
+                    log.error("Failed to create infoblox connection", extra={"error": str(err), "master": self.ib.master})
+                    self._connect_error = err
+            if self._connect_error is not None:
+                raise self._connect_error
+            return self._infoblox
+
+    def collect(self, discovery_type: str, cycle: Optional[Deadline] = None):
+        """
+        Collect a discovery type and put it in the cache. A discovery type that fail keep the data
+        already in the cache as stale, and a retry of only that type is scheduled. A discovery type
+        that run out of time put the part that was collected, marked as partial.
+        :param discovery_type:
+        :param cycle: the deadline of the collect cycle
+        :return:
+        """
+        cache = Cache()
+        deadline = Deadline(type_budget(), cycle)
+        try:
+            deadline.check('cycle')
+            infoblox = self.infoblox()
+            with deadline_scope(deadline):
+                collected = collect_type(infoblox, self.ib, discovery_type)
+            if deadline.stages:
+                log.warning("Collect deadline exceeded, partial data",
+                            extra={"master": self.ib.master, "type": discovery_type, "stages": ",".join(deadline.stages)})
+            for cache_type, data in collected.items():
+                cache.put(self.ib.master, cache_type, data, infoblox.rendered.get(cache_type), deadline.stages or None)
+        except Exception as err:
+            if isinstance(err, DeadlineExceeded):
+                log.warning("Collect deadline exceeded", extra={"master": self.ib.master, "type": discovery_type,
+                                                                "stages": ",".join(deadline.stages)})
+            elif err is not self._connect_error:
+                log.error("Failed to collect", extra={"master": self.ib.master, "type": discovery_type, "error": str(err)})
+            with self._lock:
+                self.failed.append(discovery_type)
+            for cache_type in DISCOVERY_CACHE_TYPES[discovery_type]:
+                cache.put_failed(self.ib.master, cache_type)
+            schedule_retry(self.ib.master, discovery_type)
+        finally:
+            if deadline.stages:
+                for cache_type in DISCOVERY_CACHE_TYPES[discovery_type]:
+                    cache.count_deadline_exceeded(self.ib.master, cache_type)
+            with self._lock:
+                self._remaining -= 1
+                done = self._remaining == 0
+            if done:
+                self._done()
+
+    def _done(self):
+        cache = Cache()
+        end_time = time.time()
+        cache.set_collect_time(self.ib.master, int(end_time - self.start_time))
+        if self.failed:
+            cache.inc_collect_count_failed(self.ib.master)
+        cache.inc_collect_count(self.ib.master)
+        log.info("Collect infoblox discovery", extra={"master": self.ib.master, "types": ",".join(self.discovery_types),
+                                                      "failed": ",".join(self.failed),
+                                                      "exec_time_seconds": end_time - self.start_time})
+
+
+def collect_concurrency() -> int:
+    return max(int(os.getenv(DISCOVERY_COLLECT_CONCURRENCY, '4')), 1)
+
+
+def collect_budget() -> float:
+    """
+    The seconds a collect of all masters may take, default the fetch interval, 0 for no limit
+    :return:
+    """
+    return float(os.getenv(DISCOVERY_COLLECT_BUDGET, os.getenv(DISCOVERY_FETCH_INTERVAL, '3600')))
+
+
+def type_budget() -> float:
+    """
+    The seconds the collect of a discovery type of a master may take, 0 for no limit
+    :return:
+    """
+    return float(os.getenv(DISCOVERY_TYPE_BUDGET, '0'))
+
+
+def collect_tasks(collects: List[MasterCollect]) -> List[Tuple[MasterCollect, str]]:
+    """
+    Get the collect tasks of all masters, one per master and discovery type, in priority order. The
+    discovery types that are fast to collect are collected first for all masters.
+    :param collects:
+    :return:
+    """
+    tasks = [(DISCOVERY_PRIORITY.get(discovery_type, len(DISCOVERY_PRIORITY)), index, master_collect, discovery_type)
+             for index, master_collect in enumerate(collects) for discovery_type in master_collect.discovery_types]
+    return [(master_collect, discovery_type) for _, _, master_collect, discovery_type in sorted(tasks, key=lambda t: t[:2])]
+
+
+def type_state(master: str, discovery_type: str) -> List[Tuple[int, str]]:
+    cache = Cache()
+    return [(cache.get_generation(master, cache_type), cache.get_status(master, cache_type)[0])
+            for cache_type in DISCOVERY_CACHE_TYPES[discovery_type]]
+
+
+def collect_masters(requests: List[Tuple[InfobloxConfig, List[str]]], concurrency: Optional[int] = None):
+    """
+    Collect the discovery types of the masters as independent tasks in priority order. Every
+    discovery type is put in the cache as soon as its task is done, and published if it changed. The
+    tasks not started, or not done, within INFOBLOX_DISCOVERY_COLLECT_BUDGET seconds run out of time.
+    :param requests: the configuration and the discovery types of every master
+    :param concurrency: the max number of tasks run at the same time, default INFOBLOX_DISCOVERY_COLLECT_CONCURRENCY
+    :return:
+    """
+    tasks = collect_tasks([MasterCollect(ib, discovery_types) for ib, discovery_types in requests if discovery_types])
+    concurrency = concurrency or collect_concurrency()
+    cycle = Deadline(collect_budget())
+
+    def run(master_collect: MasterCollect, discovery_type: str):
+        before = type_state(master_collect.ib.master, discovery_type)
+        master_collect.collect(discovery_type, cycle)
+        # Only published when the targets or the status of the collected types changed
+        if _after_collect is not None and type_state(master_collect.ib.master, discovery_type) != before:
+            _after_collect()
+
+    if concurrency == 1 or len(tasks) < 2:
+        # In the calling thread, e.g. when profiled
+        for master_collect, discovery_type in tasks:
+            run(master_collect, discovery_type)
+        return
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='collect') as executor:
+        for future in [executor.submit(run, master_collect, discovery_type) for master_collect, discovery_type in tasks]:
+            future.result()
+
+
+def collect_master(ib: InfobloxConfig, discovery_types: List[str]):
+    """
+    Collect the discovery types for a single master
+    :param ib:
+    :param discovery_types:
+    :return:
+    """
+    collect_masters([(ib, discovery_types)])
+
+
+def retry_backoff(failures: int) -> Optional[float]:
+    """
+    Get the seconds to wait before the next retry, the backoff is doubled for every consecutive
+    failure
+    :param failures: the number of consecutive failures
+    :return: the backoff or None if no more retries should be done
+    """
+    if failures < 1 or failures > int(os.getenv(DISCOVERY_RETRY_MAX, '5')):
+        return None
+    backoff = float(os.getenv(DISCOVERY_RETRY_BACKOFF, '10')) * 2 ** (failures - 1)
+    return min(backoff, float(os.getenv(DISCOVERY_RETRY_BACKOFF_MAX, '300')))
+
+
+def schedule_retry(master: str, discovery_type: str):
+    if _scheduler is None:
+        return
+    failures = max(Cache().get_failures(master, cache_type) for cache_type in DISCOVERY_CACHE_TYPES[discovery_type])
+    backoff = retry_backoff(failures)
+    if backoff is None:
+        log.warning("No more retries, wait for next collect", extra={"master": master, "type": discovery_type})
+        return
+    log.info("Schedule retry", extra={"master": master, "type": discovery_type, "backoff_seconds": backoff})
+    _scheduler.add_job(run_job, 'date', args=[retry_type, master, discovery_type],
+                       run_date=datetime.datetime.now() + datetime.timedelta(seconds=backoff),
+                       id=f"retry-{master}-{discovery_type}", replace_existing=True)
+
+
+def retry_type(master: str, discovery_type: str):
+    ib = config_watcher().get_configs().get(master)
+    if ib is None or discovery_type not in ib.discovery:
+        return
+    collect_master(ib, [discovery_type])
+
+
+def run_job(job: Callable, *args):
+    if _is_leader is not None and not _is_leader():
+        return
+    job(*args)
+
+
+def schedule_fill_cache():
+    """
+    Collect all masters as soon as possible, e.g. when a replica became leader
+    :return:
+    """
+    if _scheduler is None:
+        return
+    _scheduler.add_job(run_job, 'date', args=[fill_cache], run_date=datetime.datetime.now(), id='fill-cache-now',
+                       replace_existing=True)
+
+
+def add_collect_jobs(scheduler, after_collect: Optional[Callable[[], None]] = None,
+                     is_leader: Optional[Callable[[], bool]] = None):
+    """
+    Add the collect jobs to the scheduler
+    :param scheduler:
+    :param after_collect: called when a collect task is done or after evict, e.g. to publish the result
+    :param is_leader: if set, the jobs are only run when it return true
+    :return:
+    """
+    global _scheduler, _after_collect, _is_leader
+    _scheduler = scheduler
+    _after_collect = after_collect
+    _is_leader = is_leader
+    schedule_fill_cache()
+    scheduler.add_job(run_job, 'interval', args=[fill_cache],
+                      seconds=int(os.getenv(DISCOVERY_FETCH_INTERVAL, '3600')))
+    scheduler.add_job(run_job, 'interval', args=[reload_config],
+                      seconds=int(os.getenv(DISCOVERY_CONFIG_RELOAD_INTERVAL, '30')))
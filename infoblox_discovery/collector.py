@@ -24,7 +24,7 @@ from typing import List
 from prometheus_client.registry import Collector, Metric
 
 from infoblox_discovery.cache import Cache
-from infoblox_discovery.metrics import InfobloxMetrics
+from infoblox_discovery.metrics import InfobloxMetrics, render_dhcp_utilization
 
 
 def to_list(metric_generator) -> List[Metric]:
@@ -49,3 +49,10 @@ class InfobloxCollector(Collector):
         all_module_metrics.extend(t)
 
         return all_module_metrics
+
+    def collect_dhcp_utilization(self) -> bytes:
+        """
+        The dhcp range utilization gauges, pre-rendered since there can be tens of thousands of ranges
+        :return: the metrics in the prometheus text format
+        """
+        return render_dhcp_utilization(self.cache)
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import json
+import pickle
+import sys
+import zlib
+from array import array
+from typing import Dict, List, Any, Tuple, Optional, Iterator, Sequence
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZLIB = 'zlib'
+ZSTD = 'zstd'
+
+
+class Column:
+    """
+    The values of an attribute of all targets. A column with few distinct values, like the master
+    or the shared extattr labels, is dictionary encoded as the distinct values and an index per target.
+    """
+    __slots__ = ('values', 'codes')
+
+    def __init__(self, values: List[Any]):
+        distinct: Dict[Any, int] = {}
+        unique: List[Any] = []
+        codes = array('I')
+        for value in values:
+            # Labels dicts are shared between targets and not hashable, they are the same by identity
+            key = (id(value),) if isinstance(value, (dict, list)) else value
+            code = distinct.get(key)
+            if code is None:
+                code = distinct[key] = len(unique)
+                unique.append(value)
+            codes.append(code)
+            if len(unique) > len(values) // 2 + 1:
+                # Mostly distinct values, e.g. names, are kept as a list of interned strings
+                self.values = [sys.intern(v) if isinstance(v, str) else v for v in values]
+                self.codes = None
+                return
+        self.values = [sys.intern(v) if isinstance(v, str) else v for v in unique]
+        self.codes = codes
+
+    def __getitem__(self, index: int) -> Any:
+        if self.codes is None:
+            return self.values[index]
+        return self.values[self.codes[index]]
+
+    def __iter__(self) -> Iterator[Any]:
+        if self.codes is None:
+            return iter(self.values)
+        return (self.values[code] for code in self.codes)
+
+
+class Columns:
+    """
+    The uncompressed columns of the targets of a master and type. The labels with mostly distinct
+    values, like the zone address, are label columns, and the label sets only hold the labels that
+    are shared between targets. The varying labels of a label set have the value None.
+    """
+    __slots__ = ('model', 'attributes', 'targets', 'label_sets', 'label_index', 'label_columns')
+
+    def __init__(self, model: type, attributes: Dict[str, Column], targets: List[str], label_sets: List[Dict[str, str]],
+                 label_index: array, label_columns: Dict[str, Column]):
+        self.model = model
+        self.attributes = attributes
+        self.targets = targets
+        self.label_sets = label_sets
+        self.label_index = label_index
+        self.label_columns = label_columns
+
+    def labels(self, index: int) -> Dict[str, str]:
+        label_set = self.label_sets[self.label_index[index]]
+        if not self.label_columns:
+            return label_set
+        return {k: self.label_columns[k][index] if k in self.label_columns else v for k, v in label_set.items()}
+
+
+class TargetColumns(Sequence):
+    """
+    The targets of a master and type stored as columns: the interned target names, the index of
+    the distinct label set of every target and the model attributes as columns. The model objects
+    are created when accessed, and the sd json is rendered directly from the columns. The columns
+    can be kept compressed for types that are rarely requested.
+    """
+    def __init__(self, columns: Columns, length: int, codec: Optional[str] = None):
+        self._length = length
+        self._columns: Optional[Columns] = None
+        self._packed: Optional[bytes] = None
+        self.codec = codec
+        if codec is None:
+            self._columns = columns
+        else:
+            self._packed = compress(pickle.dumps(columns, protocol=pickle.HIGHEST_PROTOCOL), codec)
+
+    def columns(self) -> Columns:
+        if self._columns is not None:
+            return self._columns
+        return pickle.loads(decompress(self._packed, self.codec))
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __getitem__(self, index):
+        columns = self.columns()
+        if isinstance(index, slice):
+            return [_model(columns, i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("Target index out of range")
+        return _model(columns, index)
+
+    def __iter__(self) -> Iterator[Any]:
+        columns = self.columns()
+        return (_model(columns, i) for i in range(self._length))
+
+    def rows(self, *attributes: str) -> Iterator[Tuple[Any, ...]]:
+        """
+        Iterate the values of some attributes of all targets without creating the model objects
+        :param attributes:
+        :return:
+        """
+        columns = self.columns()
+        return zip(*[columns.attributes[attribute] for attribute in attributes])
+
+    def render(self) -> bytes:
+        """
+        Render the sd json, the same as render_targets of the model objects
+        :return:
+        """
+        columns = self.columns()
+        # Targets with the same label set and the same varying labels share a target group
+        groups: Dict[Tuple[Any, ...], Tuple[int, List[str]]] = {}
+        varying = list(columns.label_columns.values())
+        for i, (target, index) in enumerate(zip(columns.targets, columns.label_index)):
+            key = (index, *[column[i] for column in varying]) if varying else (index,)
+            group = groups.get(key)
+            if group is None:
+                groups[key] = (i, [target])
+            else:
+                group[1].append(target)
+        return json.dumps([{'targets': targets, 'labels': columns.labels(i)} for i, targets in groups.values()],
+                          indent=4).encode('utf-8')
+
+    def packed_size(self) -> Optional[int]:
+        return len(self._packed) if self._packed is not None else None
+
+
+def _model(columns: Columns, index: int) -> Any:
+    model = columns.model.__new__(columns.model)
+    model.__dict__.update({attribute: column[index] for attribute, column in columns.attributes.items()})
+    return model
+
+
+def compress(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD:
+        return zstandard.ZstdCompressor().compress(data)
+    return zlib.compress(data)
+
+
+def decompress(data: bytes, codec: str) -> bytes:
+    if codec == ZSTD:
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def default_codec() -> str:
+    return ZSTD if zstandard is not None else ZLIB
+
+
+def _label_columns(entries: List[Dict[str, Any]], attributes: Dict[str, Column]) -> Dict[str, Column]:
+    """
+    Get the labels with mostly distinct values as columns, None for the targets without the label.
+    A label with the same values as an attribute, like the zone address, share the attribute column.
+    :param entries:
+    :param attributes:
+    :return:
+    """
+    values: Dict[str, List[Any]] = {}
+    for i, entry in enumerate(entries):
+        for k, v in entry['labels'].items():
+            values.setdefault(k, [None] * len(entries))[i] = v
+    label_columns: Dict[str, Column] = {}
+    for k, label_values in values.items():
+        if len(set(label_values)) <= len(entries) // 2 + 1:
+            continue
+        shared = [column for column in attributes.values() if list(column) == label_values]
+        label_columns[k] = shared[0] if shared else Column(label_values)
+    return label_columns
+
+
+def target_columns(data: List[Any], entries: List[Dict[str, Any]], codec: Optional[str] = None) -> Optional[TargetColumns]:
+    """
+    Store the model objects as columns
+    :param data: the model objects, of the same class and with the same attributes
+    :param entries: the file sd entry of every model object
+    :param codec: the compression, None if not compressed
+    :return: the columns or None if the objects can not be stored as columns
+    """
+    if not data:
+        return None
+    model = type(data[0])
+    names = list(data[0].__dict__.keys())
+    for d in data:
+        if type(d) is not model or d.__dict__.keys() != data[0].__dict__.keys():
+            return None
+    for entry in entries:
+        if len(entry['targets']) != 1:
+            return None
+
+    attributes = {name: Column([d.__dict__[name] for d in data]) for name in names}
+    label_columns = _label_columns(entries, attributes)
+    label_keys: Dict[Tuple[Tuple[str, str], ...], int] = {}
+    label_sets: List[Dict[str, str]] = []
+    label_index = array('I')
+    for entry in entries:
+        label_set = {k: None if k in label_columns else v for k, v in entry['labels'].items()}
+        key = tuple(sorted(label_set.items()))
+        index = label_keys.get(key)
+        if index is None:
+            index = label_keys[key] = len(label_sets)
+            label_sets.append({sys.intern(k): sys.intern(v) if isinstance(v, str) else v
+                               for k, v in label_set.items()})
+        label_index.append(index)
+    columns = Columns(model, attributes, [sys.intern(entry['targets'][0]) for entry in entries], label_sets,
+                      label_index, label_columns)
+    return TargetColumns(columns, len(data), codec)
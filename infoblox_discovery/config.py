@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import os
+import threading
+import logging as log
+import re
+from typing import Dict, List, Any, Optional, Tuple
+
+import yaml
+
+from infoblox_discovery.cache import MEMBERS, ZONES, DHCP_RANGES, WEB_ENDPOINTS, MASTER
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.networks import NetworkFilter
+
+DISCOVERY_TYPES = [MEMBERS, ZONES, DHCP_RANGES, WEB_ENDPOINTS]
+# Inclusion and exclusion labels in commons apply to all types
+COMMONS = 'commons'
+LABEL_TYPES = [COMMONS, MEMBERS, ZONES, DHCP_RANGES]
+EXTATTR_LABEL_TYPES = [COMMONS, MEMBERS, ZONES, DHCP_RANGES, WEB_ENDPOINTS]
+LABEL_NAME = re.compile(r'^[a-zA-Z_][a-zA-Z0-9_]*$')
+# The views discovered if not configured
+DEFAULT_DNS_VIEWS = ['External']
+DEFAULT_NETWORK_VIEWS = ['default']
+
+# Settings that are used by all discovery types, a change will re-collect everything for the master
+CONNECTION_SETTINGS = ['wapi_version', 'username', 'password', 'timeout']
+
+
+class InfobloxConfig:
+    """
+    The validated configuration of one infoblox master entry
+    """
+    def __init__(self, master: str):
+        self.master: str = master
+        self.wapi_version: str = ''
+        self.username: str = ''
+        self.password: str = ''
+        self.timeout: int = 60
+        self.discovery: List[str] = []
+        self.exclude_ranges: List[int] = []
+        # The networks and supernets to include or exclude for dhcp ranges and web endpoints
+        self.include_networks: List[str] = []
+        self.exclude_networks: List[str] = []
+        self.network_filter: NetworkFilter = NetworkFilter()
+        self.exclusion_labels: Dict[str, List[str]] = {}
+        self.inclusion_labels: Dict[str, List[str]] = {}
+        self.web_endpoint_networks: List[str] = []
+        # The dns views of zones and web endpoints and the network views of dhcp ranges and networks
+        self.dns_views: List[str] = list(DEFAULT_DNS_VIEWS)
+        self.network_views: List[str] = list(DEFAULT_NETWORK_VIEWS)
+        # type -> extattr name -> label name
+        self.extattr_labels: Dict[str, Dict[str, str]] = {}
+        # WAPI rate limit, no limit on the request rate if requests_per_second is not set
+        self.requests_per_second: Optional[float] = None
+        self.burst: int = 1
+        self.max_concurrency: int = 4
+
+    def connection_settings(self) -> Tuple:
+        return tuple(self.__dict__[setting] for setting in CONNECTION_SETTINGS)
+
+    def extattr_label_mapping(self, discovery_type: str) -> Dict[str, str]:
+        """
+        Get the extattr to label mapping of a type, the mapping of the type override commons
+        :param discovery_type:
+        :return: extattr name -> label name
+        """
+        mapping = dict(self.extattr_labels.get(COMMONS, {}))
+        mapping.update(self.extattr_labels.get(discovery_type, {}))
+        return mapping
+
+    def type_settings(self, discovery_type: str) -> Tuple:
+        """
+        Get the settings that affect the result of a specific discovery type
+        :param discovery_type:
+        :return:
+        """
+        labels = (tuple(self.inclusion_labels.get(discovery_type, [])),
+                  tuple(self.exclusion_labels.get(discovery_type, [])),
+                  tuple(self.inclusion_labels.get(COMMONS, [])),
+                  tuple(self.exclusion_labels.get(COMMONS, [])),
+                  tuple(sorted(self.extattr_label_mapping(discovery_type).items())))
+        if discovery_type == ZONES:
+            return labels + (tuple(self.dns_views),)
+        if discovery_type == DHCP_RANGES:
+            return labels + (tuple(self.exclude_ranges), tuple(self.network_views), tuple(self.include_networks),
+                             tuple(self.exclude_networks))
+        if discovery_type == WEB_ENDPOINTS:
+            return labels + (tuple(self.web_endpoint_networks), tuple(self.dns_views), tuple(self.network_views),
+                             tuple(self.include_networks), tuple(self.exclude_networks))
+        return labels
+
+
+def _string_list(master: str, key: str, value: Any) -> List[str]:
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise DiscoveryException(f"Master {master} - {key} must be a list")
+    return [str(v) for v in value]
+
+
+def _labels(master: str, key: str, value: Any) -> Dict[str, List[str]]:
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise DiscoveryException(f"Master {master} - {key} must be a mapping")
+    labels: Dict[str, List[str]] = {}
+    for label_type, label_names in value.items():
+        if label_type not in LABEL_TYPES:
+            raise DiscoveryException(f"Master {master} - invalid {key} type {label_type}")
+        labels[label_type] = _string_list(master, f"{key}.{label_type}", label_names)
+    return labels
+
+
+def _extattr_labels(master: str, value: Any) -> Dict[str, Dict[str, str]]:
+    if value is None:
+        return {}
+    if not isinstance(value, dict):
+        raise DiscoveryException(f"Master {master} - extattr_labels must be a mapping")
+    extattr_labels: Dict[str, Dict[str, str]] = {}
+    for label_type, mapping in value.items():
+        if label_type not in EXTATTR_LABEL_TYPES:
+            raise DiscoveryException(f"Master {master} - invalid extattr_labels type {label_type}")
+        if not isinstance(mapping, dict):
+            raise DiscoveryException(f"Master {master} - extattr_labels.{label_type} must be a mapping")
+        for extattr, label in mapping.items():
+            if not LABEL_NAME.match(str(label)):
+                raise DiscoveryException(f"Master {master} - extattr_labels.{label_type} invalid label name {label}")
+        extattr_labels[label_type] = {str(extattr): str(label) for extattr, label in mapping.items()}
+    return extattr_labels
+
+
+def config_factory(config_data: Dict[str, Any]) -> InfobloxConfig:
+    if not isinstance(config_data, dict) or not config_data.get(MASTER):
+        raise DiscoveryException("Every infoblox entry must have a master")
+
+    config = InfobloxConfig(master=str(config_data[MASTER]))
+    for key in ['wapi_version', 'username', 'password']:
+        if config_data.get(key) is None:
+            raise DiscoveryException(f"Master {config.master} - missing {key}")
+        config.__dict__[key] = str(config_data[key])
+
+    try:
+        config.timeout = int(config_data.get('timeout', 60))
+        config.exclude_ranges = [int(prefix) for prefix in config_data.get('exclude_ranges') or []]
+    except (TypeError, ValueError) as err:
+        raise DiscoveryException(f"Master {config.master} - {str(err)}")
+
+    config.discovery = _string_list(config.master, 'discovery', config_data.get('discovery'))
+    for discovery_type in config.discovery:
+        if discovery_type not in DISCOVERY_TYPES:
+            raise DiscoveryException(f"Master {config.master} - invalid discovery type {discovery_type}")
+
+    config.exclusion_labels = _labels(config.master, 'exclusion_labels', config_data.get('exclusion_labels'))
+    config.inclusion_labels = _labels(config.master, 'inclusion_labels', config_data.get('inclusion_labels'))
+    config.extattr_labels = _extattr_labels(config.master, config_data.get('extattr_labels'))
+
+    rate_limit = config_data.get('rate_limit') or {}
+    try:
+        if rate_limit.get('requests_per_second') is not None:
+            config.requests_per_second = float(rate_limit.get('requests_per_second'))
+        config.burst = int(rate_limit.get('burst', max(1, int(config.requests_per_second or 1))))
+        config.max_concurrency = int(rate_limit.get('max_concurrency', 4))
+    except (TypeError, ValueError, AttributeError) as err:
+        raise DiscoveryException(f"Master {config.master} - rate_limit {str(err)}")
+    if (config.requests_per_second is not None and config.requests_per_second <= 0) or config.burst < 1 or \
+            config.max_concurrency < 1:
+        raise DiscoveryException(f"Master {config.master} - rate_limit values must be positive")
+
+    for key, default in [('dns_views', DEFAULT_DNS_VIEWS), ('network_views', DEFAULT_NETWORK_VIEWS)]:
+        views = _string_list(config.master, key, config_data.get(key)) or list(default)
+        if len(set(views)) != len(views):
+            raise DiscoveryException(f"Master {config.master} - {key} must be unique")
+        config.__dict__[key] = views
+
+    web_endpoints = config_data.get(WEB_ENDPOINTS) or {}
+    if not isinstance(web_endpoints, dict):
+        raise DiscoveryException(f"Master {config.master} - {WEB_ENDPOINTS} must be a mapping")
+    config.web_endpoint_networks = _string_list(config.master, 'web_endpoints.networks', web_endpoints.get('networks'))
+
+    config.include_networks = _string_list(config.master, 'include_networks', config_data.get('include_networks'))
+    config.exclude_networks = _string_list(config.master, 'exclude_networks', config_data.get('exclude_networks'))
+    try:
+        config.network_filter = NetworkFilter(config.include_networks, config.exclude_networks)
+    except ValueError as err:
+        raise DiscoveryException(f"Master {config.master} - {str(err)}")
+
+    return config
+
+
+def parse_config(config_data: Any) -> Dict[str, InfobloxConfig]:
+    """
+    Validate the parsed yaml document and return the configuration by master
+    :param config_data:
+    :return:
+    """
+    if not isinstance(config_data, dict) or not isinstance(config_data.get('infoblox'), list):
+        raise DiscoveryException("Configuration must have a list of infoblox entries")
+
+    configs: Dict[str, InfobloxConfig] = {}
+    for config_entry in config_data.get('infoblox'):
+        config = config_factory(config_entry)
+        if config.master in configs:
+            raise DiscoveryException(f"Master {config.master} is defined more than once")
+        configs[config.master] = config
+    return configs
+
+
+def load_config(file_name: str) -> Dict[str, InfobloxConfig]:
+    try:
+        with open(file_name, 'r') as config_file:
+            return parse_config(yaml.safe_load(config_file))
+    except (OSError, yaml.YAMLError) as err:
+        raise DiscoveryException(f"Can not read configuration file {file_name} - {str(err)}")
+
+
+class ConfigChange:
+    """
+    The difference between two configurations
+    """
+    def __init__(self):
+        # Masters no longer in the configuration
+        self.removed: List[str] = []
+        # master -> discovery types that must be collected
+        self.changed: Dict[str, List[str]] = {}
+        # master -> discovery types no longer discovered
+        self.dropped: Dict[str, List[str]] = {}
+
+    def is_empty(self) -> bool:
+        return not (self.removed or self.changed or self.dropped)
+
+
+def diff_config(old: Dict[str, InfobloxConfig], new: Dict[str, InfobloxConfig]) -> ConfigChange:
+    change = ConfigChange()
+    change.removed = [master for master in old if master not in new]
+
+    for master, config in new.items():
+        previous = old.get(master)
+        if previous is None or previous.connection_settings() != config.connection_settings():
+            changed = list(config.discovery)
+        else:
+            changed = [discovery_type for discovery_type in config.discovery
+                       if discovery_type not in previous.discovery or
+                       previous.type_settings(discovery_type) != config.type_settings(discovery_type)]
+        if changed:
+            change.changed[master] = changed
+
+        if previous is not None:
+            dropped = [discovery_type for discovery_type in previous.discovery
+                       if discovery_type not in config.discovery]
+            if dropped:
+                change.dropped[master] = dropped
+
+    return change
+
+
+class ConfigWatcher:
+    """
+    Keep the parsed configuration and detect changes in the configuration file based on
+    the file modification time and size
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self._signature: Optional[Tuple[int, int, int]] = None
+        self._configs: Dict[str, InfobloxConfig] = {}
+        self._lock = threading.Lock()
+
+    def get_configs(self) -> Dict[str, InfobloxConfig]:
+        return self._configs
+
+    def poll(self) -> Optional[ConfigChange]:
+        """
+        Reload the configuration file if changed since last poll
+        :return: the change or None if nothing changed or the new file is not valid
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.file_name)
+            except OSError as err:
+                log.error("Can not access configuration file", extra={"file_name": self.file_name, "error": str(err)})
+                return None
+
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if signature == self._signature:
+                return None
+            self._signature = signature
+
+            try:
+                configs = load_config(self.file_name)
+            except DiscoveryException as err:
+                # Keep running with the last valid configuration
+                log.error("Invalid configuration file", extra={"file_name": self.file_name, "error": err.message})
+                return None
+
+            change = diff_config(self._configs, configs)
+            self._configs = configs
+            log.info("Configuration loaded", extra={"file_name": self.file_name, "masters": len(configs),
+                                                    "removed": len(change.removed), "changed": len(change.changed)})
+            return change
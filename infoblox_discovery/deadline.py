@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import contextvars
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Iterator
+
+from infoblox_discovery.exceptions import DiscoveryException
+
+# The deadline of the collect task running in the current thread, copied to the threads it start
+_current: contextvars.ContextVar[Optional['Deadline']] = contextvars.ContextVar('deadline', default=None)
+
+
+class DeadlineExceeded(DiscoveryException):
+    """
+    The time budget of a collect ran out
+    """
+    def __init__(self, stage: str):
+        super().__init__(f"Deadline exceeded in {stage}")
+        self.stage = stage
+
+
+class Deadline:
+    """
+    The time budget of a collect. A deadline with a parent, like a type in a collect cycle, end
+    when the first of them end. The stages that ran out of time are recorded.
+    """
+    def __init__(self, seconds: Optional[float] = None, parent: Optional['Deadline'] = None):
+        self.end = time.monotonic() + seconds if seconds else math.inf
+        self.parent = parent
+        self.stages: List[str] = []
+        self._lock = threading.Lock()
+
+    def remaining(self) -> float:
+        remaining = self.end - time.monotonic()
+        if self.parent is not None:
+            remaining = min(remaining, self.parent.remaining())
+        return max(remaining, 0.0)
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def check(self, stage: str):
+        """
+        Check that there is time left before starting a stage, like a WAPI request
+        :param stage:
+        :return:
+        :raises DeadlineExceeded: if the budget has run out, the stage is recorded
+        """
+        if self.expired():
+            self.exceeded(stage)
+            raise DeadlineExceeded(stage)
+
+    def exceeded(self, stage: str):
+        with self._lock:
+            if stage not in self.stages:
+                self.stages.append(stage)
+
+    def timeout(self, timeout: float) -> float:
+        """
+        Limit a request timeout to the remaining budget
+        :param timeout:
+        :return:
+        """
+        return min(timeout, self.remaining())
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline) -> Iterator[Deadline]:
+    """
+    Run the WAPI requests in the block, and in the threads started with copy_context, with the deadline
+    :param deadline:
+    :return:
+    """
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from typing import Dict, List, Any
+
+from infoblox_discovery.meta_naming import meta_label_name
+
+ADDED = 'added'
+REMOVED = 'removed'
+CHANGED = 'changed'
+
+VIEW_LABEL = meta_label_name('view')
+
+
+class TargetDiff:
+    """
+    The targets added, removed and with changed labels between two collections
+    """
+    def __init__(self):
+        self.added: List[str] = []
+        self.removed: List[str] = []
+        self.changed: List[str] = []
+
+    def is_empty(self) -> bool:
+        return not (self.added or self.removed or self.changed)
+
+    def counts(self) -> Dict[str, int]:
+        return {ADDED: len(self.added), REMOVED: len(self.removed), CHANGED: len(self.changed)}
+
+    def as_dict(self) -> Dict[str, List[str]]:
+        return {ADDED: self.added, REMOVED: self.removed, CHANGED: self.changed}
+
+
+def fingerprint(data: List[Any]) -> Dict[str, int]:
+    """
+    Create the fingerprint of a collection as the hash of the labels by target
+    :param data: objects that implement as_prometheus_file_sd_entry
+    :return:
+    """
+    return fingerprint_entries([d.as_prometheus_file_sd_entry() for d in data])
+
+
+def fingerprint_entries(entries: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Create the fingerprint of the file sd entries of a collection
+    :param entries:
+    :return:
+    """
+    fingerprints: Dict[str, int] = {}
+    for entry in entries:
+        fingerprints[target_key(entry)] = hash(tuple(sorted(entry['labels'].items())))
+    return fingerprints
+
+
+def target_key(entry: Dict[str, Any]) -> str:
+    """
+    The key of a target in the changes, a target that exist in more than one view get the view as prefix
+    :param entry: the file sd entry
+    :return:
+    """
+    targets = ','.join(entry['targets'])
+    view = entry['labels'].get(VIEW_LABEL)
+    return f"{view}/{targets}" if view else targets
+
+
+def diff_fingerprints(old: Dict[str, int], new: Dict[str, int]) -> TargetDiff:
+    diff = TargetDiff()
+    diff.added = sorted(new.keys() - old.keys())
+    diff.removed = sorted(old.keys() - new.keys())
+    diff.changed = sorted(target for target in new.keys() & old.keys() if new[target] != old[target])
+    return diff
@@ -30,3 +30,28 @@ DISCOVERY_LOG_FILE = 'INFOBLOX_DISCOVERY_LOG_FILE'
 DISCOVERY_LOG_LEVEL = 'INFOBLOX_DISCOVERY_LOG_LEVEL'
 DISCOVERY_CACHE_TTL = 'INFOBLOX_DISCOVERY_CACHE_TTL'
 DISCOVERY_FETCH_INTERVAL = 'INFOBLOX_DISCOVERY_FETCH_INTERVAL'
+DISCOVERY_CONFIG_RELOAD_INTERVAL = 'INFOBLOX_DISCOVERY_CONFIG_RELOAD_INTERVAL'
+DISCOVERY_WORKERS = 'INFOBLOX_DISCOVERY_WORKERS'
+DISCOVERY_SNAPSHOT_FILE = 'INFOBLOX_DISCOVERY_SNAPSHOT_FILE'
+DISCOVERY_BASIC_AUTH_USERS_FILE = 'INFOBLOX_DISCOVERY_BASIC_AUTH_USERS_FILE'
+DISCOVERY_BASIC_AUTH_CACHE_TTL = 'INFOBLOX_DISCOVERY_BASIC_AUTH_CACHE_TTL'
+DISCOVERY_CHANGES_ENDPOINT = 'INFOBLOX_DISCOVERY_CHANGES_ENDPOINT'
+DISCOVERY_RETRY_BACKOFF = 'INFOBLOX_DISCOVERY_RETRY_BACKOFF'
+DISCOVERY_RETRY_BACKOFF_MAX = 'INFOBLOX_DISCOVERY_RETRY_BACKOFF_MAX'
+DISCOVERY_RETRY_MAX = 'INFOBLOX_DISCOVERY_RETRY_MAX'
+DISCOVERY_ADMIN_ENDPOINTS = 'INFOBLOX_DISCOVERY_ADMIN_ENDPOINTS'
+DISCOVERY_PROCESS_POOL_WORKERS = 'INFOBLOX_DISCOVERY_PROCESS_POOL_WORKERS'
+DISCOVERY_PROCESS_POOL_MIN_OBJECTS = 'INFOBLOX_DISCOVERY_PROCESS_POOL_MIN_OBJECTS'
+DISCOVERY_CACHE_BACKEND = 'INFOBLOX_DISCOVERY_CACHE_BACKEND'
+DISCOVERY_LEADER_LEASE_TTL = 'INFOBLOX_DISCOVERY_LEADER_LEASE_TTL'
+DISCOVERY_COLLECT_CONCURRENCY = 'INFOBLOX_DISCOVERY_COLLECT_CONCURRENCY'
+DISCOVERY_ON_DEMAND = 'INFOBLOX_DISCOVERY_ON_DEMAND'
+DISCOVERY_ON_DEMAND_DEADLINE = 'INFOBLOX_DISCOVERY_ON_DEMAND_DEADLINE'
+DISCOVERY_CACHE_COMPRESSED_TYPES = 'INFOBLOX_DISCOVERY_CACHE_COMPRESSED_TYPES'
+DISCOVERY_COLLECT_BUDGET = 'INFOBLOX_DISCOVERY_COLLECT_BUDGET'
+DISCOVERY_TYPE_BUDGET = 'INFOBLOX_DISCOVERY_TYPE_BUDGET'
+DISCOVERY_WAPI_CACHE_TTL = 'INFOBLOX_DISCOVERY_WAPI_CACHE_TTL'
+DISCOVERY_WAPI_CACHE_MAX_BYTES = 'INFOBLOX_DISCOVERY_WAPI_CACHE_MAX_BYTES'
+DISCOVERY_WAPI_RECORD = 'INFOBLOX_DISCOVERY_WAPI_RECORD'
+DISCOVERY_WAPI_REPLAY = 'INFOBLOX_DISCOVERY_WAPI_REPLAY'
+DISCOVERY_WAPI_REPLAY_LATENCY = 'INFOBLOX_DISCOVERY_WAPI_REPLAY_LATENCY'
@@ -22,6 +22,7 @@
 
 class DiscoveryException(Exception):
     def __init__(self, message: str = "", status: int = 503, exp: Exception = None):
+        super().__init__(message)
         self.message = message
         self.status = status
         self.exp = exp
@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import sys
+from typing import Dict, Any, List, Tuple, Optional
+
+from infoblox_discovery.meta_naming import meta_label_name
+
+# The labels of a target without mapped extattrs, shared and never changed
+EMPTY_LABELS: Dict[str, str] = {}
+
+
+class ExtattrLabels:
+    """
+    Map the extattrs of objects to labels. The label values are interned and targets with the
+    same extattr labels share one label dictionary. An instance is used for one collect, so it
+    only keeps the label sets of the last collect.
+    """
+    def __init__(self, mapping: Dict[str, str]):
+        """
+        :param mapping: extattr name -> label name without the meta prefix
+        """
+        self.mapping: List[Tuple[str, str]] = [(extattr, sys.intern(meta_label_name(label)))
+                                               for extattr, label in mapping.items()]
+        self._label_sets: Dict[Tuple[Tuple[str, str], ...], Dict[str, str]] = {}
+
+    def labels(self, extattrs: Optional[Dict[str, Any]]) -> Dict[str, str]:
+        """
+        Get the labels of the mapped extattrs. The returned dictionary is shared and must not be
+        changed.
+        :param extattrs: the extattrs of a WAPI object
+        :return:
+        """
+        if not self.mapping or not extattrs:
+            return EMPTY_LABELS
+        items: List[Tuple[str, str]] = []
+        for extattr, label in self.mapping:
+            attribute = extattrs.get(extattr)
+            if attribute is None:
+                continue
+            value = attribute.get('value')
+            if isinstance(value, list):
+                value = ','.join(str(v) for v in value)
+            items.append((label, sys.intern(str(value))))
+        if not items:
+            return EMPTY_LABELS
+        key = tuple(items)
+        label_set = self._label_sets.get(key)
+        if label_set is None:
+            label_set = dict(items)
+            self._label_sets[key] = label_set
+        return label_set
+
+    def label_sets(self) -> int:
+        return len(self._label_sets)
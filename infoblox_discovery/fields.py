@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+from typing import List, Dict
+
+from infoblox_discovery.infoblox_dhcp import DHCP_FIELDS
+from infoblox_discovery.infoblox_dns_server import DNS_SERVER_FIELDS, DNS_MEMBER_FIELDS, DNS_ZONE_FIELDS
+from infoblox_discovery.infoblox_member import MEMBER_FIELDS
+from infoblox_discovery.infoblox_node import NODE_FIELDS
+from infoblox_discovery.infoblox_webendpoint import HOST_ADDRESS_FIELDS, WEB_ENDPOINT_FIELDS
+from infoblox_discovery.infoblox_zone import ZONE_FIELDS
+
+# The fields used by the inclusion and exclusion filters
+FILTER_FIELDS = ['extattrs']
+
+MEMBER = 'member'
+MEMBER_DNS = 'member:dns'
+ZONE_AUTH = 'zone_auth'
+RANGE = 'range'
+IPV4ADDRESS = 'ipv4address'
+RECORD_HOST = 'record:host'
+
+
+def projection(*field_lists: List[str]) -> List[str]:
+    """
+    Merge the fields used by the different consumers of a WAPI object
+    :param field_lists:
+    :return: the unique fields in the order first used
+    """
+    fields: Dict[str, None] = {}
+    for field_list in field_lists:
+        for field in field_list:
+            fields[field] = None
+    return list(fields.keys())
+
+
+# The return fields of each WAPI object, derived from the fields the factories use
+RETURN_FIELDS: Dict[str, List[str]] = {
+    MEMBER: projection(MEMBER_FIELDS, NODE_FIELDS, DNS_SERVER_FIELDS, FILTER_FIELDS),
+    MEMBER_DNS: projection(DNS_MEMBER_FIELDS),
+    ZONE_AUTH: projection(ZONE_FIELDS, FILTER_FIELDS),
+    RANGE: projection(DHCP_FIELDS, FILTER_FIELDS),
+    IPV4ADDRESS: projection(HOST_ADDRESS_FIELDS),
+    RECORD_HOST: projection(WEB_ENDPOINT_FIELDS, FILTER_FIELDS),
+}
+
+# The zone_auth fields used to join zones with dns servers, in all views
+ZONE_ASSIGNMENT_FIELDS: List[str] = projection(DNS_ZONE_FIELDS)
+
+
+def return_fields(object_type: str) -> List[str]:
+    return RETURN_FIELDS[object_type]
@@ -26,7 +26,9 @@ import yaml
 import logging as log
 from infoblox_discovery.environments import DISCOVERY_PROMETHEUS_SD_FILE_DIRECTORY, DISCOVERY_CONFIG
 from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.config import load_config
 from infoblox_discovery.cache import MEMBERS, NODES, ZONES, DHCP_RANGES, DNS_SERVERS
+from infoblox_discovery.exceptions import DiscoveryException
 
 
 def file_service_discovery():
@@ -37,27 +39,26 @@ def file_service_discovery():
     if not os.path.exists(os.getenv(DISCOVERY_PROMETHEUS_SD_FILE_DIRECTORY)):
         log.error(f"Directory {DISCOVERY_PROMETHEUS_SD_FILE_DIRECTORY} does not exists")
         exit(1)
-    with open(os.getenv(DISCOVERY_CONFIG, 'config.yml'), 'r') as config_file:
-        try:
-            # Converts yaml document to python object
-            config = yaml.safe_load(config_file)
-
-        except yaml.YAMLError as err:
-            log.error("Parse config", extra={"error": str(err)})
+    try:
+        configs = load_config(os.getenv(DISCOVERY_CONFIG, 'config.yml'))
+    except DiscoveryException as err:
+        log.error("Parse config", extra={"error": err.message})
+        exit(1)
 
-    for ib in config.get('infoblox'):
+    for ib in configs.values():
         infoblox = InfoBlox(ib)
-        if MEMBERS in ib.get('discovery'):
+        if MEMBERS in ib.discovery:
             members, nodes, dns_servers = infoblox.get_infoblox_members()
-            write_sd_file(members, ib['master'], MEMBERS)
-            write_sd_file(nodes, ib['master'], NODES)
-            write_sd_file(dns_servers, ib['master'], DNS_SERVERS)
-        if ZONES in ib.get('discovery'):
+            dns_servers = infoblox.get_infoblox_dns_servers(dns_servers)
+            write_sd_file(members, ib.master, MEMBERS)
+            write_sd_file(nodes, ib.master, NODES)
+            write_sd_file(dns_servers, ib.master, DNS_SERVERS)
+        if ZONES in ib.discovery:
             zones = infoblox.get_infoblox_zones()
-            write_sd_file(zones, ib['master'], ZONES)
-        if DHCP_RANGES in ib.get('discovery'):
+            write_sd_file(zones, ib.master, ZONES)
+        if DHCP_RANGES in ib.discovery:
             dhcp_ranges = infoblox.get_infoblox_dhcp_ranges()
-            write_sd_file(dhcp_ranges, ib['master'], DHCP_RANGES)
+            write_sd_file(dhcp_ranges, ib.master, DHCP_RANGES)
 
 
 def write_sd_file(objects, prefix: str, type: str):
@@ -18,146 +18,205 @@
     along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
 
 """
-import datetime
+import asyncio
 import json
 import logging
 import math
+import multiprocessing
 import os
-import secrets
+import signal
+import sys
+import tempfile
+import threading
 import time
-from typing import List, Any
+from typing import Any, Optional, Dict, Tuple
 
 import uvicorn
 from uvicorn.config import LOGGING_CONFIG
-import yaml
 from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.schedulers.blocking import BlockingScheduler
 from fastapi import FastAPI, Request, Response, Depends, HTTPException, status
-from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from prometheus_client import CollectorRegistry, Gauge
 from prometheus_client.exposition import CONTENT_TYPE_LATEST
 from prometheus_client.utils import INF, MINUS_INF
 from prometheus_fastapi_instrumentator import Instrumentator
 
-from infoblox_discovery.api import InfoBlox
-from infoblox_discovery.cache import Cache, MEMBERS, NODES, ZONES, DHCP_RANGES, DNS_SERVERS, MASTER, WEB_ENDPOINTS, VALID_TYPES
+from infoblox_discovery.auth import Authenticator, authenticator_factory
+from infoblox_discovery.cache import Cache, VALID_TYPES, MASTER, TYPE, STATUS_FAILED, STATUS_STALE
+from infoblox_discovery.collect import add_collect_jobs, collect_now, schedule_fill_cache, collectable_type, \
+    refresh_type
 from infoblox_discovery.collector import InfobloxCollector
-from infoblox_discovery.environments import DISCOVERY_BASIC_AUTH_USERNAME, DISCOVERY_BASIC_AUTH_PASSWORD, \
-    DISCOVERY_BASIC_AUTH_ENABLED, DISCOVERY_HOST, DISCOVERY_PORT, DISCOVERY_FETCH_INTERVAL
-from infoblox_discovery.environments import DISCOVERY_CONFIG
+from infoblox_discovery.environments import DISCOVERY_HOST, DISCOVERY_PORT
+from infoblox_discovery.environments import DISCOVERY_WORKERS, DISCOVERY_SNAPSHOT_FILE, DISCOVERY_CHANGES_ENDPOINT, \
+    DISCOVERY_ADMIN_ENDPOINTS
+from infoblox_discovery.diff import TargetDiff
 from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.render import render_targets, join_blocks
+from infoblox_discovery.replicas import SharedSnapshotWriter, add_replica_job, cache_backend, lease_ttl
+from infoblox_discovery.pool import shutdown_pool
+from infoblox_discovery.ondemand import SingleFlight, on_demand_mode, on_demand_deadline, wait_for, STALE
+from infoblox_discovery.profiling import profile, trace_allocations, retained_size, TEXT, PSTATS
+from infoblox_discovery.snapshot import SnapshotReader, SnapshotWriter, SnapshotResponse, snapshot_key, METRICS_KEY, \
+    CHANGES_PREFIX
 import logging as log
 
 
 MIME_TYPE_TEXT_HTML = 'text/html'
 MIME_TYPE_APPLICATION_JSON = 'application/json'
+MIME_TYPE_TEXT_PLAIN = 'text/plain'
+MIME_TYPE_OCTET_STREAM = 'application/octet-stream'
+STATUS_HEADER = 'X-Infoblox-Discovery-Status'
+STALENESS_HEADER = 'X-Infoblox-Discovery-Staleness-Seconds'
 
 app = FastAPI()
 
 
-def fill_cache():
+_snapshot_reader: Optional[SnapshotReader] = None
+
+
+def workers() -> int:
+    return int(os.getenv(DISCOVERY_WORKERS, '1'))
+
+
+def snapshot_file() -> str:
+    default_directory = '/dev/shm' if os.path.isdir('/dev/shm') else tempfile.gettempdir()
+    return os.getenv(DISCOVERY_SNAPSHOT_FILE, os.path.join(default_directory, 'infoblox_discovery.snapshot'))
+
+
+# The collect tasks publish concurrently, a snapshot of an older state must not replace a newer
+_publish_lock = threading.Lock()
+
+
+def publish_snapshot(writer: SnapshotWriter) -> Optional[int]:
+    """
+    Render all sd targets and the metrics from the cache and publish them to the http workers. Nothing
+    is rendered or published if the targets and status of all masters and types are the same as in
+    the last published snapshot. A master and type without data in the cache is not published, except
+    the targets inherited from the snapshot of a previous leader that are kept until collected or expired.
+    :param writer:
+    :return: the generation of the published snapshot, None if not changed
     """
-    Collect data from Infoblox
-    The configuration file is read every time
+    with _publish_lock:
+        cache = Cache()
+        state = cache.get_state()
+        if state == writer.published_state:
+            return None
+        bodies: Dict[str, bytes] = {}
+        metadata: Dict[str, Dict[str, Any]] = {}
+        for master, types in list(cache.get_types().items()):
+            for type in types:
+                key = snapshot_key(master, type)
+                etag, body = rendered_targets(master, type)
+                if etag is None:
+                    continue
+                writer.inherited.discard(key)
+                bodies[key] = body
+                type_status, staleness = cache.get_status(master, type)
+                metadata[key] = {'etag': etag, 'status': type_status}
+                if not math.isinf(staleness):
+                    metadata[key]['collected'] = time.time() - staleness
+                if changes_enabled():
+                    bodies[CHANGES_PREFIX + key] = render_changes(master, type)
+        if writer.inherited:
+            inherit_snapshot(writer, bodies, metadata, cache.get_ttl())
+        infoblox_collector = InfobloxCollector(cache)
+        bodies[METRICS_KEY] = generate_latest(asyncio.run(infoblox_collector.collect())) + \
+            infoblox_collector.collect_dhcp_utilization()
+        generation = writer.publish(bodies, metadata)
+        writer.published_state = state
+        log.info("Published snapshot", extra={"generation": generation, "entries": len(bodies)})
+        return generation
+
+
+def inherit_snapshot(writer: SnapshotWriter, bodies: Dict[str, bytes], metadata: Dict[str, Dict[str, Any]],
+                     ttl: int):
+    """
+    Add the inherited targets, not yet collected by the leader, from the last snapshot. The targets are
+    dropped when ttl has passed since they were collected by the previous leader.
+    :param writer:
+    :param bodies:
+    :param metadata:
+    :param ttl:
     :return:
     """
+    previous = SnapshotReader(writer.file_name)
+    for key in list(writer.inherited):
+        body = previous.get(key)
+        key_metadata = previous.get_metadata(key)
+        if body is None or time.time() - key_metadata.get('collected', -math.inf) >= ttl:
+            writer.inherited.discard(key)
+            continue
+        bodies[key] = bytes(body)
+        metadata[key] = key_metadata
+        changes = previous.get(CHANGES_PREFIX + key)
+        if changes is not None:
+            bodies[CHANGES_PREFIX + key] = bytes(changes)
 
-    with open(os.getenv(DISCOVERY_CONFIG, 'config.yml'), 'r') as config_file:
-        try:
-            # Converts yaml document to python object
-            config = yaml.safe_load(config_file)
 
-        except yaml.YAMLError as err:
-            log.error("Can not open configuration file", extra={"file_name": config_file.name, "error": str(err)})
-            return
+def snapshot_mode() -> bool:
+    """
+    Serve from the published snapshot, with more than one worker or when replicas share a cache backend
+    :return:
+    """
+    return workers() > 1 or cache_backend().shared
 
-    cache = Cache()
-    for ib in config.get('infoblox'):
-        start_time = time.time()
-        try:
-            infoblox = InfoBlox(ib)
-        except DiscoveryException as err:
-            log.error("Failed to create infoblox connection", extra={"error": str(err), "master": ib.get(MASTER, 'n/a')})
-            continue
+
+def run_collector(file_name: str):
+    """
+    The collector process in snapshot mode, own the scheduler and publish snapshots
+    :param file_name:
+    :return:
+    """
+    # Terminated by the http process on shutdown, the process pool workers are stopped on exit
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    backend = cache_backend()
+    sch = BlockingScheduler()
+    if not backend.shared:
+        writer = SnapshotWriter(file_name)
+        publish_snapshot(writer)
+        add_collect_jobs(sch, lambda: publish_snapshot(writer))
         try:
-            if MEMBERS in ib.get('discovery'):
-                try:
-                    members, nodes, dns_servers = infoblox.get_infoblox_members()
-                    cache.put(ib[MASTER], MEMBERS, list(members.values()))
-                    cache.put(ib[MASTER], NODES, list(nodes.values()))
-                    cache.put(ib[MASTER], DNS_SERVERS, list(dns_servers.values()))
-                except DiscoveryException:
-                    log.error("Failed to get members", extra={"master": ib[MASTER]})
-
-            if ZONES in ib.get('discovery'):
-                try:
-                    dns = infoblox.get_infoblox_zones()
-                    cache.put(ib[MASTER], ZONES, list(dns.values()))
-                except DiscoveryException:
-                    log.error("Failed to get zones", extra={"master": ib[MASTER]})
-
-            if DHCP_RANGES in ib.get('discovery'):
-                try:
-                    dhcp_ranges = infoblox.get_infoblox_dhcp_ranges()
-                    cache.put(ib[MASTER], DHCP_RANGES, list(dhcp_ranges.values()))
-                except DiscoveryException:
-                    log.error("Failed to get dhcp ranges", extra={"master": ib[MASTER]})
-
-            if WEB_ENDPOINTS in ib.get('discovery') and ib.get(WEB_ENDPOINTS):
-                try:
-                    for network in ib.get(WEB_ENDPOINTS).get('networks'):
-                        web_endpoints = infoblox.get_web_endpoints_by_networks(network)
-                        cache.put(ib[MASTER], WEB_ENDPOINTS, list(web_endpoints.values()))
-                except DiscoveryException:
-                    log.error("Failed to get dhcp ranges", extra={"master": ib[MASTER]})
-
-            end_time = time.time()
-            cache.set_collect_time(ib[MASTER], int(end_time - start_time))
-            log.info("Collect infoblox discovery", extra={"master": ib[MASTER], "exec_time_seconds": end_time - start_time})
-        except DiscoveryException:
-            cache.inc_collect_count_failed(ib[MASTER])
+            sch.start()
         finally:
-            cache.inc_collect_count(ib[MASTER])
+            shutdown_pool()
+        return
+
+    shared_writer = SharedSnapshotWriter(file_name, backend, lease_ttl())
+    # Serve the snapshot of the current leader until this replica is leader and has collected
+    shared_writer.sync()
+    add_collect_jobs(sch, lambda: publish_snapshot(shared_writer), shared_writer.is_leader)
+    add_replica_job(sch, shared_writer, schedule_fill_cache)
+    try:
+        sch.start()
+    finally:
+        shared_writer.resign()
+        shutdown_pool()
 
 
 @app.on_event("startup")
 async def run_scheduler():
+    global _snapshot_reader
+    app.state.authenticator = authenticator_factory()
+    if snapshot_mode():
+        # The collector process own the scheduler, the worker serve from the published snapshot
+        _snapshot_reader = SnapshotReader(snapshot_file())
+        return
     sch = BackgroundScheduler()
     sch.start()
-    sch.add_job(fill_cache, 'date', run_date=datetime.datetime.now())
-    sch.add_job(fill_cache, 'interval', seconds=int(os.getenv(DISCOVERY_FETCH_INTERVAL, '3600')))
+    add_collect_jobs(sch)
 
 Instrumentator().instrument(app).expose(app=app, endpoint="/exporter-metrics")
 
-security = HTTPBasic()
 
+def authenticator(request: Request) -> Authenticator:
+    if not hasattr(request.app.state, 'authenticator'):
+        request.app.state.authenticator = authenticator_factory()
+    return request.app.state.authenticator
 
-async def optional_security(request: Request):
-    if os.getenv(DISCOVERY_BASIC_AUTH_ENABLED) and os.getenv(DISCOVERY_BASIC_AUTH_ENABLED) == "true":
-        return await security(request)
-    else:
-        return None
-
-
-async def basic_auth(credentials: HTTPBasicCredentials = Depends(optional_security)) -> bool:
 
-    if not os.getenv(DISCOVERY_BASIC_AUTH_USERNAME) or not os.getenv(DISCOVERY_BASIC_AUTH_USERNAME):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect credentials",
-            headers={"WWW-Authenticate": "Basic"},
-        )
-
-    current_username_bytes = credentials.username.encode("utf8")
-    correct_username_bytes = bytes(os.getenv(DISCOVERY_BASIC_AUTH_USERNAME), 'utf-8')
-    is_correct_username = secrets.compare_digest(
-        current_username_bytes, correct_username_bytes
-    )
-    current_password_bytes = credentials.password.encode("utf8")
-    correct_password_bytes = bytes(os.getenv(DISCOVERY_BASIC_AUTH_PASSWORD), 'utf-8')
-    is_correct_password = secrets.compare_digest(
-        current_password_bytes, correct_password_bytes
-    )
-    if not (is_correct_username and is_correct_password):
+def basic_auth(request: Request) -> bool:
+    # Not async, so a slow password hash is verified in the threadpool and not on the event loop
+    if not authenticator(request).verify(request.headers.get('authorization')):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect credentials",
@@ -265,6 +324,9 @@ async def get_metrics(auth: str = Depends(basic_auth)):
     registry = CollectorRegistry()
 
     try:
+        if _snapshot_reader is not None:
+            return SnapshotResponse(_snapshot_reader.get(METRICS_KEY), status_code=200, media_type=CONTENT_TYPE_LATEST)
+
         infoblox_collector = InfobloxCollector(cache)
 
         registry.register(infoblox_collector)
@@ -273,7 +335,8 @@ async def get_metrics(auth: str = Depends(basic_auth)):
 
         duration.set(time.time() - start_time)
 
-        infoblox_metrics = generate_latest(await infoblox_collector.collect())
+        infoblox_metrics = generate_latest(await infoblox_collector.collect()) + \
+            infoblox_collector.collect_dhcp_utilization()
 
         duration.set(time.time() - start_time)
         return Response(infoblox_metrics, status_code=200, media_type=CONTENT_TYPE_LATEST)
@@ -286,25 +349,184 @@ async def get_metrics(auth: str = Depends(basic_auth)):
                         media_type=MIME_TYPE_TEXT_HTML)
 
 
+# snapshot key -> etag and rendered sd targets
+_rendered: Dict[str, Tuple[str, bytes]] = {}
+# master and discovery type -> the on demand collect in flight
+_single_flight = SingleFlight()
+
+
+def rendered_targets(master: str, type: str) -> Tuple[Optional[str], bytes]:
+    """
+    Get the etag and the rendered sd targets. The targets are only rendered again when the
+    data in the cache has changed
+    :param master:
+    :param type:
+    :return:
+    """
+    cache = Cache()
+    key = snapshot_key(master, type)
+    etag = cache.get_etag(master, type)
+    if etag is None:
+        _rendered.pop(key, None)
+        return None, b'[]'
+    rendered = _rendered.get(key)
+    if rendered is None or rendered[0] != etag:
+        blocks = cache.get_rendered(master, type)
+        if blocks is not None:
+            rendered = (etag, join_blocks(blocks))
+        else:
+            rendered = (etag, render_targets(cache.get(master, type)))
+        _rendered[key] = rendered
+    return rendered
+
+
+async def on_demand_targets(master: str, type: str) -> Tuple[Optional[str], bytes, bool]:
+    """
+    Collect the master and type on a miss, concurrent requests share the same collect. Expired data is
+    served directly in stale mode, else the request wait for the collect until the deadline.
+    :param master:
+    :param type:
+    :return: the etag, the rendered sd targets and true if expired data is served
+    """
+    discovery_type = collectable_type(master, type)
+    if discovery_type is None:
+        return None, b'[]', False
+    future = _single_flight.do(snapshot_key(master, discovery_type), refresh_type, master, discovery_type)
+    if on_demand_mode() == STALE:
+        stale = Cache().get_stale(master, type)
+        if stale:
+            return None, render_targets(stale), True
+    if future is not None and await wait_for(future, on_demand_deadline()):
+        etag, targets = rendered_targets(master, type)
+        return etag, targets, False
+    return None, b'[]', False
+
+
+def changes_enabled() -> bool:
+    return os.getenv(DISCOVERY_CHANGES_ENDPOINT) == "true"
+
+
+def render_changes(master: str, type: str) -> bytes:
+    cache = Cache()
+    changes = cache.get_changes(master, type) or TargetDiff()
+    body = {MASTER: master, TYPE: type, 'generation': cache.get_generation(master, type)}
+    body.update(changes.as_dict())
+    return json.dumps(body, indent=4).encode('utf-8')
+
+
+def invalid_type() -> Response:
+    return Response(json.dumps({'error': 'Not a valid type', 'valid_types': VALID_TYPES}, indent=4),
+                    status_code=status.HTTP_400_BAD_REQUEST, media_type=MIME_TYPE_APPLICATION_JSON)
+
+
 @app.get('/prometheus-sd-targets')
-async def discovery(master: str, type: str, auth: str = Depends(basic_auth)):
+async def discovery(master: str, type: str, request: Request, auth: str = Depends(basic_auth)):
     try:
         if type not in VALID_TYPES:
-            return Response(json.dumps({'error': 'Not a valid type', 'valid_types': VALID_TYPES}, indent=4), status_code=status.HTTP_400_BAD_REQUEST, media_type=MIME_TYPE_APPLICATION_JSON)
-        cache = Cache()
-        data = cache.get(master, type)
-
-        prometheus_sd: List[Any] = []
-        for d in data:
-            prometheus_sd.append(d.as_prometheus_file_sd_entry())
-
-        targets = json.dumps(prometheus_sd, indent=4)
-        return Response(targets, status_code=status.HTTP_200_OK, media_type=MIME_TYPE_APPLICATION_JSON)
+            return invalid_type()
+        if _snapshot_reader is not None:
+            key = snapshot_key(master, type)
+            targets = _snapshot_reader.get(key)
+            metadata = _snapshot_reader.get_metadata(key)
+            etag = metadata.get('etag')
+            type_status = metadata.get('status', STATUS_FAILED)
+            staleness = time.time() - metadata['collected'] if 'collected' in metadata else math.inf
+            if targets is None:
+                targets = b'[]'
+        else:
+            etag, targets = rendered_targets(master, type)
+            cache = Cache()
+            cache.count_request(master, type, etag is not None)
+            served_stale = False
+            if etag is None and on_demand_mode() is not None:
+                etag, targets, served_stale = await on_demand_targets(master, type)
+            type_status, staleness = cache.get_status(master, type)
+            if served_stale:
+                type_status = STATUS_STALE
+
+        headers = {STATUS_HEADER: type_status}
+        if not math.isinf(staleness):
+            headers[STALENESS_HEADER] = str(int(staleness))
+        if etag is None:
+            return SnapshotResponse(targets, status_code=status.HTTP_200_OK, headers=headers,
+                                    media_type=MIME_TYPE_APPLICATION_JSON)
+        headers['ETag'] = etag
+        if request.headers.get('if-none-match') == etag:
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return SnapshotResponse(targets, status_code=status.HTTP_200_OK, headers=headers,
+                                media_type=MIME_TYPE_APPLICATION_JSON)
     except Exception as err:
         log.error("Failed to get prometheus sd targets", extra={"error": str(err)})
         return Response(None, status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, media_type=MIME_TYPE_APPLICATION_JSON)
 
 
+@app.get('/prometheus-sd-changes')
+async def discovery_changes(master: str, type: str, auth: str = Depends(basic_auth)):
+    if not changes_enabled():
+        return Response(None, status_code=status.HTTP_404_NOT_FOUND, media_type=MIME_TYPE_APPLICATION_JSON)
+    if type not in VALID_TYPES:
+        return invalid_type()
+    if _snapshot_reader is not None:
+        changes = _snapshot_reader.get(CHANGES_PREFIX + snapshot_key(master, type))
+        return SnapshotResponse(changes if changes is not None else b'{}', status_code=status.HTTP_200_OK,
+                                media_type=MIME_TYPE_APPLICATION_JSON)
+    return Response(render_changes(master, type), status_code=status.HTTP_200_OK, media_type=MIME_TYPE_APPLICATION_JSON)
+
+
+def admin_enabled() -> bool:
+    return os.getenv(DISCOVERY_ADMIN_ENDPOINTS) == "true"
+
+
+def admin_denied(request: Request) -> Optional[Response]:
+    """
+    The admin endpoints must be enabled and authenticated, and run where the collect run
+    :param request:
+    :return: the response if denied
+    """
+    if not admin_enabled() or _snapshot_reader is not None:
+        return Response(None, status_code=status.HTTP_404_NOT_FOUND, media_type=MIME_TYPE_TEXT_HTML)
+    if not authenticator(request).enabled:
+        return Response("Admin endpoints require authentication", status_code=status.HTTP_403_FORBIDDEN,
+                        media_type=MIME_TYPE_TEXT_HTML)
+    return None
+
+
+@app.post('/admin/profile')
+def admin_profile(request: Request, master: Optional[str] = None, format: str = TEXT, top: int = 30,
+                  auth: str = Depends(basic_auth)):
+    denied = admin_denied(request)
+    if denied is not None:
+        return denied
+    try:
+        # The collect tasks, views and process pool builds are run in the profiled thread
+        body = profile(lambda: collect_now(master, concurrency=1), format, top)
+    except DiscoveryException as err:
+        return Response(err.message, status_code=err.status, media_type=MIME_TYPE_TEXT_HTML)
+    log.info("Profiled collect", extra={"master": master, "format": format})
+    return Response(body, status_code=status.HTTP_200_OK,
+                    media_type=MIME_TYPE_OCTET_STREAM if format == PSTATS else MIME_TYPE_TEXT_PLAIN)
+
+
+@app.post('/admin/memory')
+def admin_memory(request: Request, master: Optional[str] = None, top: int = 30, auth: str = Depends(basic_auth)):
+    denied = admin_denied(request)
+    if denied is not None:
+        return denied
+    try:
+        result = trace_allocations(lambda: collect_now(master), top)
+    except DiscoveryException as err:
+        return Response(err.message, status_code=err.status, media_type=MIME_TYPE_TEXT_HTML)
+    cached = Cache().get_all()
+    result['cache_targets'] = {cached_master: {type: len(data) for type, data in types.items()}
+                               for cached_master, types in cached.items()}
+    # The memory held by the targets in the cache, not only what the collect allocated
+    result['cache_bytes'] = {cached_master: {type: retained_size(data) for type, data in types.items()}
+                             for cached_master, types in cached.items()}
+    log.info("Traced collect", extra={"master": master, "traced_bytes": result['traced_bytes']})
+    return Response(json.dumps(result, indent=4), status_code=status.HTTP_200_OK,
+                    media_type=MIME_TYPE_APPLICATION_JSON)
+
+
 def http_service_discovery():
     logging.Formatter.converter = time.gmtime
     log_config = LOGGING_CONFIG.copy()
@@ -313,5 +535,20 @@ def http_service_discovery():
     log_config["formatters"]["access"]["fmt"] = "at=%(levelname)s when=%(asctime)s msg=\"%(client_addr)s - %(request_line)s\" status=%(status_code)s"
     log_config["formatters"]["access"]["datefmt"] = "%Y-%m-%dT%H:%M:%SZ"
 
-    uvicorn.run(app, host=os.getenv(DISCOVERY_HOST, "0.0.0.0"), port=os.getenv(DISCOVERY_PORT, 9694),
-                log_config=log_config)
+    host = os.getenv(DISCOVERY_HOST, "0.0.0.0")
+    port = int(os.getenv(DISCOVERY_PORT, '9694'))
+    if snapshot_mode():
+        # One collector process publish snapshots that all uvicorn workers serve
+        os.environ[DISCOVERY_SNAPSHOT_FILE] = snapshot_file()
+        # Not a daemon, since a daemon process can not start the workers of the process pool
+        collector = multiprocessing.Process(target=run_collector, args=(snapshot_file(),))
+        collector.start()
+        try:
+            uvicorn.run("infoblox_discovery.http_service_discovery:app", host=host, port=port, workers=workers(),
+                        log_config=log_config)
+        finally:
+            collector.terminate()
+            collector.join()
+        return
+
+    uvicorn.run(app, host=host, port=port, log_config=log_config)
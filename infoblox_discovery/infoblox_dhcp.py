@@ -19,19 +19,37 @@
 
 """
 
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, Optional
+from infoblox_discovery.extattr_labels import EMPTY_LABELS
 from infoblox_discovery.meta_naming import meta_label_name
 
+# The WAPI range fields used by dhcp_factory
+DHCP_FIELDS = ['network', 'dhcp_utilization', 'dhcp_utilization_status']
+
+# The attributes that are exposed as metrics and not as labels
+METRIC_ATTRIBUTES = ('utilization', 'utilization_status')
+# The value of the dhcp_utilization_status
+UTILIZATION_STATUS = {'NORMAL': 0, 'LOW': 1, 'HIGH': 2, 'FULL': 3}
+# Utilization or status not returned by WAPI
+UNKNOWN = -1
+
 
 class DHCP:
     def __init__(self, network: str):
         self.network: str = network
         self.master: str = ''
+        # The network view
+        self.view: str = ''
+        # The labels of mapped extattrs, shared between targets
+        self.extattr_labels: Dict[str, str] = EMPTY_LABELS
+        # dhcp_utilization in tenths of percent, 0 - 1000
+        self.utilization: int = UNKNOWN
+        self.utilization_status: int = UNKNOWN
 
     def _as_labels(self) -> Dict[str, str]:
-        labels: Dict[str, str] = {}
+        labels: Dict[str, str] = dict(self.extattr_labels)
         for k, v in self.__dict__.items():
-            if k != "network":
+            if k != "network" and k != "extattr_labels" and k not in METRIC_ATTRIBUTES:
                 labels[meta_label_name(k)] = v
         return labels
 
@@ -42,8 +60,15 @@ class DHCP:
         return {'targets': [f"{self.network}"], 'labels': self._as_labels()}
 
 
-def dhcp_factory(network: str, master: str) -> DHCP:
+def dhcp_factory(network: str, master: str, utilization: Optional[int] = None,
+                 utilization_status: Optional[str] = None, extattr_labels: Dict[str, str] = EMPTY_LABELS,
+                 view: str = '') -> DHCP:
     node = DHCP(network)
+    node.extattr_labels = extattr_labels
     node.master = master
+    node.view = view
+    if utilization is not None:
+        node.utilization = int(utilization)
+    node.utilization_status = UTILIZATION_STATUS.get(utilization_status, UNKNOWN)
 
     return node
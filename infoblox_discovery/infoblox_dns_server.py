@@ -19,14 +19,27 @@
 
 """
 
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Tuple, List, Optional
 from infoblox_discovery.meta_naming import meta_label_name
 
+# The WAPI member fields used to find dns servers
+DNS_SERVER_FIELDS = ['host_name', 'service_status']
+# The WAPI member:dns fields used to find the views served by dns servers
+DNS_MEMBER_FIELDS = ['host_name', 'views']
+# The WAPI zone_auth fields used to find the zones assigned to dns servers
+DNS_ZONE_FIELDS = ['grid_primary', 'grid_secondaries', 'disable']
+
+PRIMARY = 'grid_primary'
+SECONDARY = 'grid_secondaries'
+
 
 class DNSServer:
     def __init__(self, host_name: str):
         self.host_name: str = host_name
         self.master: str = ''
+        self.views: str = ''
+        self.primary_zones: str = '0'
+        self.secondary_zones: str = '0'
 
     def _as_labels(self) -> Dict[str, str]:
         labels: Dict[str, str] = {}
@@ -42,7 +55,31 @@ class DNSServer:
         return {'targets': [f"{self.host_name}"], 'labels': self._as_labels()}
 
 
-def dns_server_factory(host_name: str, master: str) -> DNSServer:
+def zone_assignments(zones_data: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+    """
+    Index the number of zones by the member name of the grid primary and secondaries, disabled
+    zones are not counted
+    :param zones_data: the zone_auth objects
+    :return: member name -> assignment -> number of zones
+    """
+    assignments: Dict[str, Dict[str, int]] = {}
+    for zone_data in zones_data:
+        if zone_data.get('disable'):
+            continue
+        for assignment in (PRIMARY, SECONDARY):
+            for server in zone_data.get(assignment) or []:
+                counts = assignments.setdefault(server['name'], {PRIMARY: 0, SECONDARY: 0})
+                counts[assignment] += 1
+    return assignments
+
+
+def dns_server_factory(host_name: str, master: str, views: Optional[List[str]] = None,
+                       assignments: Optional[Dict[str, int]] = None) -> DNSServer:
     dns_server = DNSServer(host_name)
     dns_server.master = master
+    if views:
+        dns_server.views = ','.join(sorted(views))
+    if assignments:
+        dns_server.primary_zones = str(assignments.get(PRIMARY, 0))
+        dns_server.secondary_zones = str(assignments.get(SECONDARY, 0))
     return dns_server
@@ -20,19 +20,26 @@
 """
 
 from typing import Dict, Any, Tuple
+from infoblox_discovery.member_records import MemberRecord
+from infoblox_discovery.extattr_labels import EMPTY_LABELS
 from infoblox_discovery.meta_naming import meta_label_name
 
+# The WAPI member fields used by member_factory
+MEMBER_FIELDS = ['host_name', 'enable_ha']
+
 
 class Member:
     def __init__(self, host_name: str):
         self.host_name: str = host_name
         self.enable_ha: str = "false"
         self.master: str = ''
+        # The labels of mapped extattrs, shared between targets
+        self.extattr_labels: Dict[str, str] = EMPTY_LABELS
 
     def _as_labels(self) -> Dict[str, str]:
-        labels: Dict[str, str] = {}
+        labels: Dict[str, str] = dict(self.extattr_labels)
         for k, v in self.__dict__.items():
-            if k != "host_name":
+            if k != "host_name" and k != "extattr_labels":
                 labels[meta_label_name(k)] = v
         return labels
 
@@ -43,8 +50,9 @@ class Member:
         return {'targets': [f"{self.host_name}"], 'labels': self._as_labels()}
 
 
-def member_factory(member_data, master: str) -> Member:
-    member = Member(host_name=member_data['host_name'])
+def member_factory(record: MemberRecord, master: str, extattr_labels: Dict[str, str] = EMPTY_LABELS) -> Member:
+    member = Member(host_name=record.host_name)
+    member.extattr_labels = extattr_labels
     member.master = master
-    member.enable_ha = str(member_data['enable_ha']).lower()
+    member.enable_ha = str(record.enable_ha).lower()
     return member
@@ -20,13 +20,18 @@
 """
 
 from typing import Dict, Any, Tuple
+from infoblox_discovery.member_records import NodeRecord
 from infoblox_discovery.meta_naming import meta_label_name
 
+# The WAPI member fields used by node_factory
+NODE_FIELDS = ['node_info']
+
 
 class Node:
     def __init__(self, ip: str):
         self.ip: str = ip
         self.ha_node_of: str = ""
+        self.ha_status: str = ""
         self.master: str = ''
 
     def _as_labels(self) -> Dict[str, str]:
@@ -43,9 +48,9 @@ class Node:
         return {'targets': [f"{self.ip}"], 'labels': self._as_labels()}
 
 
-def node_factory(node_data, member_host_name: str, master: str) -> Node:
-    node = Node(ip=node_data['lan_ha_port_setting']['mgmt_lan'])
-    # node.ha_status = node_data['ha_status']
+def node_factory(record: NodeRecord, member_host_name: str, master: str) -> Node:
+    node = Node(ip=record.ip)
+    node.ha_status = record.ha_status
     node.ha_node_of = member_host_name
     node.master = master
     return node
@@ -20,18 +20,27 @@
 """
 
 from typing import Dict, Any, Tuple
+from infoblox_discovery.extattr_labels import EMPTY_LABELS
 from infoblox_discovery.meta_naming import meta_label_name
 
+# The WAPI ipv4address fields used to find host names in a network
+HOST_ADDRESS_FIELDS = ['names', 'types', 'ip_address']
+# The WAPI record:host fields used by webendpoint_factory
+WEB_ENDPOINT_FIELDS = ['dns_aliases', 'view']
+
 
 class WebEndpoint:
     def __init__(self, host_name: str):
         self.host_name: str = host_name
         self.master: str = ''
+        self.view: str = ''
+        # The labels of mapped extattrs, shared between targets
+        self.extattr_labels: Dict[str, str] = EMPTY_LABELS
 
     def _as_labels(self) -> Dict[str, str]:
-        labels: Dict[str, str] = {}
+        labels: Dict[str, str] = dict(self.extattr_labels)
         for k, v in self.__dict__.items():
-            if k != "host_name":
+            if k != "host_name" and k != "extattr_labels":
                 labels[meta_label_name(k)] = v
         return labels
 
@@ -42,7 +51,10 @@ class WebEndpoint:
         return {'targets': [f"{self.host_name}"], 'labels': self._as_labels()}
 
 
-def webendpoint_factory(endpoint, master: str) -> WebEndpoint:
+def webendpoint_factory(endpoint, master: str, extattr_labels: Dict[str, str] = EMPTY_LABELS,
+                        view: str = '') -> WebEndpoint:
     member = WebEndpoint(host_name=endpoint)
+    member.extattr_labels = extattr_labels
     member.master = master
+    member.view = view
     return member
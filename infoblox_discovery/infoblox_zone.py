@@ -20,18 +20,26 @@
 """
 
 from typing import Dict, Any, Tuple
+from infoblox_discovery.extattr_labels import EMPTY_LABELS
 from infoblox_discovery.meta_naming import meta_label_name
 
+# The WAPI zone_auth fields used to create zones
+ZONE_FIELDS = ['fqdn', 'disable']
+
 
 class Zone:
     def __init__(self, zone: str):
         self.zone: str = zone
+        self.address: str = zone
         self.master: str = ''
+        self.view: str = ''
+        # The labels of mapped extattrs, shared between targets
+        self.extattr_labels: Dict[str, str] = EMPTY_LABELS
 
     def _as_labels(self) -> Dict[str, str]:
-        labels: Dict[str, str] = {}
+        labels: Dict[str, str] = dict(self.extattr_labels)
         for k, v in self.__dict__.items():
-            if k != "zone":
+            if k != "zone" and k != "extattr_labels":
                 labels[meta_label_name(k)] = v
         return labels
 
@@ -42,7 +50,11 @@ class Zone:
         return {'targets': [f"{self.zone}"], 'labels': self._as_labels()}
 
 
-def zone_factory(zone_name: str, master: str) -> Zone:
+def zone_factory(zone_name: str, address: str, master: str, extattr_labels: Dict[str, str] = EMPTY_LABELS,
+                 view: str = '') -> Zone:
     zone = Zone(zone=zone_name)
+    zone.extattr_labels = extattr_labels
+    zone.address = address
     zone.master = master
+    zone.view = view
     return zone
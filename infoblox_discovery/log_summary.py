@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+from typing import Dict, List, Any
+
+# The max number of objects kept as sample of an event
+SAMPLE_SIZE = 5
+
+
+class LogSummary:
+    """
+    Aggregate the events of a loop over all objects into the fields of one log line, instead
+    of one log line for every object. Only a bounded sample of the objects of an event is kept.
+    """
+    def __init__(self, sample_size: int = SAMPLE_SIZE):
+        self.sample_size = sample_size
+        self.counts: Dict[str, int] = {}
+        self.samples: Dict[str, List[str]] = {}
+
+    def add(self, event: str, sample: str = None):
+        self.counts[event] = self.counts.get(event, 0) + 1
+        if sample is not None:
+            samples = self.samples.setdefault(event, [])
+            if len(samples) < self.sample_size:
+                samples.append(sample)
+
+    def merge(self, other: 'LogSummary'):
+        """
+        Add the counts and samples of another summary, like the summary of a worker process
+        :param other:
+        :return:
+        """
+        for event, count in other.counts.items():
+            self.counts[event] = self.counts.get(event, 0) + count
+        for event, samples in other.samples.items():
+            own = self.samples.setdefault(event, [])
+            own.extend(samples[:self.sample_size - len(own)])
+
+    def get(self, event: str) -> int:
+        return self.counts.get(event, 0)
+
+    def extra(self, **fields) -> Dict[str, Any]:
+        """
+        Get the log extra with the fields, the count of every event and the samples as
+        <event>_sample
+        :param fields: other fields of the log line
+        :return:
+        """
+        extra: Dict[str, Any] = dict(fields)
+        extra.update(self.counts)
+        for event, samples in self.samples.items():
+            extra[f"{event}_sample"] = ",".join(samples)
+        return extra
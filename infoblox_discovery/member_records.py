@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+from typing import Dict, Any, List, Optional
+
+# The role of a node
+ACTIVE = 'active'
+PASSIVE = 'passive'
+STANDALONE = 'standalone'
+
+HA_ROLES = {'ACTIVE': ACTIVE, 'PASSIVE': PASSIVE}
+
+
+class NodeRecord:
+    """
+    The parsed node_info of a member node
+    """
+    __slots__ = ('ip', 'role', 'ha_status', 'services')
+
+    def __init__(self, ip: Optional[str], role: str, ha_status: str, services: Dict[str, str]):
+        self.ip: Optional[str] = ip
+        self.role: str = role
+        self.ha_status: str = ha_status
+        self.services: Dict[str, str] = services
+
+
+class MemberRecord:
+    """
+    The parsed member object, shared by the member, node and dns server targets
+    """
+    __slots__ = ('host_name', 'enable_ha', 'services', 'nodes')
+
+    def __init__(self, host_name: str, enable_ha: bool, services: Dict[str, str], nodes: List[NodeRecord]):
+        self.host_name: str = host_name
+        self.enable_ha: bool = enable_ha
+        self.services: Dict[str, str] = services
+        self.nodes: List[NodeRecord] = nodes
+
+    def service_working(self, service: str) -> bool:
+        return self.services.get(service) == 'WORKING'
+
+
+def _services(service_status: Optional[List[Dict[str, Any]]]) -> Dict[str, str]:
+    return {service['service']: service.get('status', '') for service in service_status or []
+            if 'service' in service}
+
+
+def _node_ip(node_data: Dict[str, Any]) -> Optional[str]:
+    """
+    The management address of the node, or the lan address if the node has no management port
+    :param node_data:
+    :return: None if the node has no address
+    """
+    ip = (node_data.get('lan_ha_port_setting') or {}).get('mgmt_lan')
+    if not ip:
+        ip = (node_data.get('mgmt_network_setting') or {}).get('address')
+    return ip or None
+
+
+def node_record(node_data: Dict[str, Any], enable_ha: bool) -> NodeRecord:
+    ha_status = node_data.get('ha_status', '')
+    role = HA_ROLES.get(ha_status, PASSIVE) if enable_ha else STANDALONE
+    return NodeRecord(_node_ip(node_data), role, ha_status, _services(node_data.get('service_status')))
+
+
+def member_record(member_data: Dict[str, Any]) -> MemberRecord:
+    """
+    Parse a member object in one pass, fields missing for a node are left empty
+    :param member_data:
+    :return:
+    """
+    enable_ha = str(member_data.get('enable_ha', False)).lower() == 'true'
+    nodes = [node_record(node_data, enable_ha) for node_data in member_data.get('node_info') or []]
+    return MemberRecord(member_data['host_name'], enable_ha, _services(member_data.get('service_status')), nodes)
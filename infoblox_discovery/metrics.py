@@ -19,17 +19,27 @@
 
 """
 
-from typing import Dict, List
+from typing import Dict, List, Any, Tuple
 
 from prometheus_client.core import GaugeMetricFamily
 from prometheus_client.metrics_core import Metric, CounterMetricFamily
 
-from infoblox_discovery.cache import Cache, MASTER, MEMBERS, NODES, ZONES, DHCP_RANGES
+from infoblox_discovery.cache import Cache, MASTER, TYPE, MEMBERS, NODES, ZONES, DHCP_RANGES, STATUS_OK, \
+    STATUS_STALE, STATUS_FAILED, STATUS_PARTIAL
+from infoblox_discovery.columns import TargetColumns
+from infoblox_discovery.diff import ADDED, REMOVED, CHANGED
+from infoblox_discovery.infoblox_dhcp import UNKNOWN
+from infoblox_discovery.ratelimit import get_rate_limiters
+from infoblox_discovery.response_cache import response_cache
+from infoblox_discovery.wapi import get_response_stats, OBJECT_TYPE
 
 
 from infoblox_discovery.transform import Transform, LabelsBase
 
 
+STATUS_VALUES = {STATUS_OK: 0, STATUS_STALE: 1, STATUS_FAILED: 2, STATUS_PARTIAL: 3}
+
+
 class IBMetricDefinition:
     prefix = 'infoblox_'
     help_prefix = 'Infoblox '
@@ -72,6 +82,35 @@ class IBMetricDefinition:
                 CounterMetricFamily(name=f"{IBMetricDefinition.prefix}cache_dhcp_ranges",
                                     documentation=f"{IBMetricDefinition.help_prefix}number of dhcp ranges",
                                     labels=common_labels),
+            "wapi_requests":
+                CounterMetricFamily(name=f"{IBMetricDefinition.prefix}wapi_requests",
+                                    documentation=f"{IBMetricDefinition.help_prefix}total WAPI requests",
+                                    labels=common_labels),
+            "wapi_throttled":
+                CounterMetricFamily(name=f"{IBMetricDefinition.prefix}wapi_throttled",
+                                    documentation=f"{IBMetricDefinition.help_prefix}total WAPI requests throttled "
+                                                  f"with 429 or 503",
+                                    labels=common_labels),
+            "wapi_queue_wait_seconds":
+                CounterMetricFamily(name=f"{IBMetricDefinition.prefix}wapi_queue_wait_seconds",
+                                    documentation=f"{IBMetricDefinition.help_prefix}total seconds WAPI requests "
+                                                  f"waited on the rate limit",
+                                    labels=common_labels),
+            "wapi_cache_hits":
+                CounterMetricFamily(name=f"{IBMetricDefinition.prefix}wapi_cache_hits",
+                                    documentation=f"{IBMetricDefinition.help_prefix}total WAPI queries served from "
+                                                  f"the response cache",
+                                    labels=common_labels),
+            "wapi_cache_misses":
+                CounterMetricFamily(name=f"{IBMetricDefinition.prefix}wapi_cache_misses",
+                                    documentation=f"{IBMetricDefinition.help_prefix}total WAPI queries not in the "
+                                                  f"response cache",
+                                    labels=common_labels),
+            "wapi_rate":
+                GaugeMetricFamily(name=f"{IBMetricDefinition.prefix}wapi_rate",
+                                  documentation=f"{IBMetricDefinition.help_prefix}current WAPI requests per second "
+                                                f"limit, 0 if not limited",
+                                  labels=common_labels),
         }
 
         return metric_definition
@@ -87,12 +126,131 @@ class IBMetric(IBMetricDefinition.Labels):
         self.cache_nodes: float = 0
         self.cache_zones: float = 0
         self.cache_dhcp_ranges: float = 0
+        self.wapi_requests: float = 0
+        self.wapi_throttled: float = 0
+        self.wapi_queue_wait_seconds: float = 0
+        self.wapi_cache_hits: float = 0
+        self.wapi_cache_misses: float = 0
+        self.wapi_rate: float = 0
+
+
+class IBTypeMetricDefinition:
+    prefix = 'infoblox_'
+    help_prefix = 'Infoblox '
+
+    class Labels(LabelsBase):
+        def __init__(self):
+            super().__init__()
+            self.labels = {MASTER: "", TYPE: ""}
+
+    @staticmethod
+    def metrics_definition() -> Dict[str, Metric]:
+        common_labels = IBTypeMetricDefinition.Labels().get_label_keys()
+
+        metric_definition = {
+            "cache_targets_added":
+                CounterMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_targets_added",
+                                    documentation=f"{IBTypeMetricDefinition.help_prefix}targets added by collect",
+                                    labels=common_labels),
+            "cache_targets_removed":
+                CounterMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_targets_removed",
+                                    documentation=f"{IBTypeMetricDefinition.help_prefix}targets removed by collect",
+                                    labels=common_labels),
+            "cache_targets_changed":
+                CounterMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_targets_changed",
+                                    documentation=f"{IBTypeMetricDefinition.help_prefix}targets with changed labels "
+                                                  f"by collect",
+                                    labels=common_labels),
+            "cache_status":
+                GaugeMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_status",
+                                  documentation=f"{IBTypeMetricDefinition.help_prefix}status of cached data, "
+                                                f"0 ok, 1 stale, 2 failed, 3 partial",
+                                  labels=common_labels),
+            "cache_staleness_seconds":
+                GaugeMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_staleness_seconds",
+                                  documentation=f"{IBTypeMetricDefinition.help_prefix}seconds since last successful "
+                                                f"collect",
+                                  labels=common_labels),
+            "cache_consecutive_failures":
+                GaugeMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_consecutive_failures",
+                                  documentation=f"{IBTypeMetricDefinition.help_prefix}consecutive failed collects",
+                                  labels=common_labels),
+            "cache_hits":
+                CounterMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_hits",
+                                    documentation=f"{IBTypeMetricDefinition.help_prefix}requests served from the "
+                                                  f"cache",
+                                    labels=common_labels),
+            "cache_misses":
+                CounterMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_misses",
+                                    documentation=f"{IBTypeMetricDefinition.help_prefix}requests with no valid data "
+                                                  f"in the cache",
+                                    labels=common_labels),
+            "cache_deadline_exceeded":
+                CounterMetricFamily(name=f"{IBTypeMetricDefinition.prefix}cache_deadline_exceeded",
+                                    documentation=f"{IBTypeMetricDefinition.help_prefix}collects that ran out of "
+                                                  f"time",
+                                    labels=common_labels),
+        }
+
+        return metric_definition
+
+
+class IBTypeMetric(IBTypeMetricDefinition.Labels):
+    def __init__(self):
+        super().__init__()
+        self.cache_targets_added: float = 0
+        self.cache_targets_removed: float = 0
+        self.cache_targets_changed: float = 0
+        self.cache_status: float = 0
+        self.cache_staleness_seconds: float = 0
+        self.cache_consecutive_failures: float = 0
+        self.cache_hits: float = 0
+        self.cache_misses: float = 0
+        self.cache_deadline_exceeded: float = 0
+
+
+class IBObjectMetricDefinition:
+    prefix = 'infoblox_'
+    help_prefix = 'Infoblox '
+
+    class Labels(LabelsBase):
+        def __init__(self):
+            super().__init__()
+            self.labels = {MASTER: "", OBJECT_TYPE: ""}
+
+    @staticmethod
+    def metrics_definition() -> Dict[str, Metric]:
+        common_labels = IBObjectMetricDefinition.Labels().get_label_keys()
+
+        metric_definition = {
+            "wapi_responses":
+                CounterMetricFamily(name=f"{IBObjectMetricDefinition.prefix}wapi_responses",
+                                    documentation=f"{IBObjectMetricDefinition.help_prefix}total WAPI responses, "
+                                                  f"including each page",
+                                    labels=common_labels),
+            "wapi_response_bytes":
+                CounterMetricFamily(name=f"{IBObjectMetricDefinition.prefix}wapi_response_bytes",
+                                    documentation=f"{IBObjectMetricDefinition.help_prefix}total bytes of WAPI "
+                                                  f"response bodies",
+                                    labels=common_labels),
+        }
+
+        return metric_definition
+
+
+class IBObjectMetric(IBObjectMetricDefinition.Labels):
+    def __init__(self):
+        super().__init__()
+        self.wapi_responses: float = 0
+        self.wapi_response_bytes: float = 0
 
 
 class InfobloxMetrics(Transform):
     def __init__(self, cache: Cache):
         self.cache = cache
         self.all_metrics: List[IBMetric] = []
+        self.all_type_metrics: List[IBTypeMetric] = []
+        self.all_object_metrics: List[IBObjectMetric] = []
 
     def metrics(self):
 
@@ -102,8 +260,24 @@ class InfobloxMetrics(Transform):
                 metrics_list[attribute].add_metric(m.get_label_values(),
                                                    m.__dict__.get(attribute))
 
+        type_metrics_list = IBTypeMetricDefinition.metrics_definition()
+        for attribute in type_metrics_list.keys():
+            for m in self.all_type_metrics:
+                type_metrics_list[attribute].add_metric(m.get_label_values(),
+                                                        m.__dict__.get(attribute))
+
+        object_metrics_list = IBObjectMetricDefinition.metrics_definition()
+        for attribute in object_metrics_list.keys():
+            for m in self.all_object_metrics:
+                object_metrics_list[attribute].add_metric(m.get_label_values(),
+                                                          m.__dict__.get(attribute))
+
         for m in metrics_list.values():
             yield m
+        for m in type_metrics_list.values():
+            yield m
+        for m in object_metrics_list.values():
+            yield m
 
     def parse(self):
         metrics: Dict[str, IBMetric] = {}
@@ -126,6 +300,18 @@ class InfobloxMetrics(Transform):
                 metrics[master].add_label(MASTER, master)
             metrics[master].cache_collect_time = value
 
+        responses = response_cache()
+        for master, limiter in list(get_rate_limiters().items()):
+            if master not in metrics:
+                metrics[master] = IBMetric()
+                metrics[master].add_label(MASTER, master)
+            metrics[master].wapi_requests = limiter.requests
+            metrics[master].wapi_throttled = limiter.throttled
+            metrics[master].wapi_queue_wait_seconds = limiter.queue_wait_seconds
+            metrics[master].wapi_rate = limiter.current_rate()
+            metrics[master].wapi_cache_hits = responses.hits.get(master, 0)
+            metrics[master].wapi_cache_misses = responses.misses.get(master, 0)
+
         for master, types in self.cache.get_all().items():
             if master not in metrics:
                 metrics[master] = IBMetric()
@@ -142,3 +328,103 @@ class InfobloxMetrics(Transform):
                     metrics[master].cache_dhcp_ranges = len(type)
 
         self.all_metrics.extend(list(metrics.values()))
+
+        for master, types in self.cache.get_types().items():
+            churn_by_type = self.cache.get_churn().get(master, {})
+            for type_name in types:
+                type_metric = IBTypeMetric()
+                type_metric.add_label(MASTER, master)
+                type_metric.add_label(TYPE, type_name)
+                churn = churn_by_type.get(type_name, {})
+                type_metric.cache_targets_added = churn.get(ADDED, 0)
+                type_metric.cache_targets_removed = churn.get(REMOVED, 0)
+                type_metric.cache_targets_changed = churn.get(CHANGED, 0)
+                type_status, staleness = self.cache.get_status(master, type_name)
+                type_metric.cache_status = STATUS_VALUES[type_status]
+                type_metric.cache_staleness_seconds = staleness
+                type_metric.cache_consecutive_failures = self.cache.get_failures(master, type_name)
+                type_metric.cache_hits = self.cache.get_hits(master, type_name)
+                type_metric.cache_misses = self.cache.get_misses(master, type_name)
+                type_metric.cache_deadline_exceeded = self.cache.get_deadline_exceeded(master, type_name)
+                self.all_type_metrics.append(type_metric)
+
+        for master, stats in list(get_response_stats().items()):
+            for obj_type, counters in stats.get().items():
+                object_metric = IBObjectMetric()
+                object_metric.add_label(MASTER, master)
+                object_metric.add_label(OBJECT_TYPE, obj_type)
+                object_metric.wapi_responses = counters['responses']
+                object_metric.wapi_response_bytes = counters['bytes']
+                self.all_object_metrics.append(object_metric)
+
+
+DHCP_UTILIZATION = f"{IBMetricDefinition.prefix}dhcp_range_utilization"
+DHCP_UTILIZATION_STATUS = f"{IBMetricDefinition.prefix}dhcp_range_utilization_status"
+DHCP_UTILIZATION_HEADER = f"# HELP {DHCP_UTILIZATION} {IBMetricDefinition.help_prefix}dhcp range utilization " \
+                          f"ratio\n# TYPE {DHCP_UTILIZATION} gauge\n"
+DHCP_UTILIZATION_STATUS_HEADER = f"# HELP {DHCP_UTILIZATION_STATUS} {IBMetricDefinition.help_prefix}dhcp range " \
+                                 f"utilization status, 0 normal, 1 low, 2 high, 3 full\n" \
+                                 f"# TYPE {DHCP_UTILIZATION_STATUS} gauge\n"
+
+# master -> the cached dhcp ranges and the rendered utilization and status samples
+_rendered_utilization: Dict[str, Tuple[List[Any], bytes, bytes]] = {}
+
+
+def _label_value(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _render_utilization_samples(master: str, dhcp_ranges: List[Any]) -> Tuple[bytes, bytes]:
+    utilization: List[str] = []
+    utilization_status: List[str] = []
+    master_label = f'master="{_label_value(master)}",view="'
+    if isinstance(dhcp_ranges, TargetColumns):
+        # Read the columns without creating the dhcp range objects
+        rows = dhcp_ranges.rows('view', 'network', 'utilization', 'utilization_status')
+    else:
+        rows = ((dhcp.view, dhcp.network, dhcp.utilization, dhcp.utilization_status) for dhcp in dhcp_ranges)
+    for view, network, range_utilization, range_utilization_status in rows:
+        labels = f'{master_label}{_label_value(view)}",network="'
+        network = _label_value(network)
+        if range_utilization != UNKNOWN:
+            utilization.append(f'{DHCP_UTILIZATION}{{{labels}{network}"}} {range_utilization / 1000}\n')
+        if range_utilization_status != UNKNOWN:
+            utilization_status.append(f'{DHCP_UTILIZATION_STATUS}{{{labels}{network}"}} '
+                                      f'{float(range_utilization_status)}\n')
+    return ''.join(utilization).encode('utf-8'), ''.join(utilization_status).encode('utf-8')
+
+
+def render_dhcp_utilization(cache: Cache) -> bytes:
+    """
+    Render the utilization gauges of all cached dhcp ranges in the prometheus text format. The
+    samples of a master are only rendered again when the dhcp ranges are collected again.
+    :param cache:
+    :return:
+    """
+    utilization: List[bytes] = []
+    utilization_status: List[bytes] = []
+    masters = set()
+    for master, types in list(cache.get_types().items()):
+        if DHCP_RANGES not in types:
+            continue
+        dhcp_ranges = cache.get(master, DHCP_RANGES)
+        masters.add(master)
+        rendered = _rendered_utilization.get(master)
+        if rendered is None or rendered[0] is not dhcp_ranges:
+            rendered = (dhcp_ranges, *_render_utilization_samples(master, dhcp_ranges))
+            _rendered_utilization[master] = rendered
+        utilization.append(rendered[1])
+        utilization_status.append(rendered[2])
+
+    for master in list(_rendered_utilization.keys()):
+        if master not in masters:
+            _rendered_utilization.pop(master, None)
+
+    body: List[bytes] = []
+    if any(utilization):
+        body.append(DHCP_UTILIZATION_HEADER.encode('utf-8'))
+        body.extend(utilization)
+    if any(utilization_status):
+        body.append(DHCP_UTILIZATION_STATUS_HEADER.encode('utf-8'))
+        body.extend(utilization_status)
+    return b''.join(body)
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import ipaddress
+from typing import List, Optional, Union
+
+# The reasons a network is not discovered
+EXCLUDED = 'excluded'
+NOT_INCLUDED = 'not_included'
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+class PrefixTree:
+    """
+    A binary radix tree of networks. A lookup walk the bits of the network address, so the cost is
+    at most the prefix length of the network, independent of the number of networks in the tree.
+    """
+    def __init__(self, networks: List[Network] = ()):
+        # A node is [child for bit 0, child for bit 1, true if a network end in the node]
+        self._roots = {4: [None, None, False], 6: [None, None, False]}
+        self._size = 0
+        for network in networks:
+            self.add(network)
+
+    def add(self, network: Network):
+        node = self._roots[network.version]
+        address = int(network.network_address)
+        bits = network.max_prefixlen
+        for i in range(network.prefixlen):
+            bit = (address >> (bits - 1 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, False]
+            node = node[bit]
+        if not node[2]:
+            node[2] = True
+            self._size += 1
+
+    def covers(self, network: Network) -> bool:
+        """
+        Check if the network, or a supernet of it, is in the tree
+        :param network:
+        :return:
+        """
+        node = self._roots[network.version]
+        address = int(network.network_address)
+        bits = network.max_prefixlen
+        for i in range(network.prefixlen):
+            if node[2]:
+                return True
+            node = node[(address >> (bits - 1 - i)) & 1]
+            if node is None:
+                return False
+        return node[2]
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class NetworkFilter:
+    """
+    The configured include_networks and exclude_networks of a master, compiled once per configuration.
+    A network is discovered if it is inside one of the included networks, if any, and not inside
+    one of the excluded networks.
+    """
+    def __init__(self, include: List[str] = (), exclude: List[str] = ()):
+        self.include = PrefixTree([parse_network(network) for network in include])
+        self.exclude = PrefixTree([parse_network(network) for network in exclude])
+
+    def is_empty(self) -> bool:
+        return not self.include and not self.exclude
+
+    def filtered(self, network: str) -> Optional[str]:
+        """
+        Get the reason the network, or address, should not be discovered
+        :param network: the network in cidr notation or an address
+        :return: the reason or None if the network should be discovered
+        """
+        if self.is_empty():
+            return None
+        parsed = ipaddress.ip_network(network, strict=False)
+        if self.include and not self.include.covers(parsed):
+            return NOT_INCLUDED
+        if self.exclude.covers(parsed):
+            return EXCLUDED
+        return None
+
+
+def parse_network(network: str) -> Network:
+    """
+    Parse a configured network
+    :param network: the network in cidr notation, the host bits must be zero
+    :return:
+    :raises ValueError: if not a valid network
+    """
+    return ipaddress.ip_network(str(network), strict=True)
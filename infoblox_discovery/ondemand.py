@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import asyncio
+import math
+import os
+import threading
+import time
+import logging as log
+from concurrent.futures import ThreadPoolExecutor, Future
+from typing import Dict, Optional, Callable, Any
+
+from infoblox_discovery.environments import DISCOVERY_ON_DEMAND, DISCOVERY_ON_DEMAND_DEADLINE
+
+# On a miss, wait for the refresh until the deadline
+WAIT = 'wait'
+# On a miss, serve expired data directly while the refresh run, else wait as WAIT
+STALE = 'stale'
+ON_DEMAND_MODES = [WAIT, STALE]
+
+# The minimum seconds between the start of two refreshes of the same key, so requests for a
+# master that can not be collected do not trigger a refresh each
+REFRESH_COOLDOWN = 30.0
+# The max number of refreshes running at the same time
+MAX_REFRESHES = 4
+
+
+def on_demand_mode() -> Optional[str]:
+    mode = os.getenv(DISCOVERY_ON_DEMAND, '')
+    return mode if mode in ON_DEMAND_MODES else None
+
+
+def on_demand_deadline() -> float:
+    return float(os.getenv(DISCOVERY_ON_DEMAND_DEADLINE, '5'))
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls with the same key onto one call, run in a thread pool
+    """
+    def __init__(self, max_workers: int = MAX_REFRESHES, cooldown: float = REFRESH_COOLDOWN):
+        self.max_workers = max_workers
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._flights: Dict[str, Future] = {}
+        self._started: Dict[str, float] = {}
+
+    def do(self, key: str, function: Callable[..., Any], *args) -> Optional[Future]:
+        """
+        Start the call for the key, or join the call already in flight
+        :param key:
+        :param function:
+        :param args:
+        :return: the future of the call, None if the last call of the key started within the cooldown
+        """
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                return future
+            now = time.monotonic()
+            if now - self._started.get(key, -math.inf) < self.cooldown:
+                return None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='on-demand')
+            future = self._executor.submit(function, *args)
+            self._flights[key] = future
+            self._started[key] = now
+        future.add_done_callback(lambda done: self._done(key, done))
+        return future
+
+    def _done(self, key: str, future: Future):
+        with self._lock:
+            if self._flights.get(key) is future:
+                del self._flights[key]
+        if future.exception() is not None:
+            log.error("On demand refresh", extra={"key": key, "error": str(future.exception())})
+
+    def in_flight(self) -> int:
+        return len(self._flights)
+
+
+async def wait_for(future: Future, deadline: float) -> bool:
+    """
+    Wait for a call in flight without blocking the event loop, a call that pass the deadline
+    keep running
+    :param future:
+    :param deadline: the max seconds to wait
+    :return: true if the call completed within the deadline
+    """
+    try:
+        await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), deadline)
+        return True
+    except asyncio.TimeoutError:
+        return False
+    except Exception:
+        # Logged when done
+        return True
@@ -0,0 +1,168 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Any, Optional, Tuple
+
+from infoblox_discovery.builder import ObjectBuilder, ZONES, DHCP_RANGES
+from infoblox_discovery.columns import Column
+from infoblox_discovery.config import InfobloxConfig
+from infoblox_discovery.environments import DISCOVERY_PROCESS_POOL_WORKERS, DISCOVERY_PROCESS_POOL_MIN_OBJECTS
+from infoblox_discovery.log_summary import LogSummary
+from infoblox_discovery.profiling import profiling
+from infoblox_discovery.render import render_block
+
+# The discovery types that can be built in the process pool
+POOL_TYPES = [ZONES, DHCP_RANGES]
+
+
+class TargetBlock:
+    """
+    The targets built from a partition of the WAPI objects, rendered as a block of the sd json
+    array, and the attributes of the targets as columns. The model objects are not pickled one by
+    one, they are created again from the columns by the process that put them in the cache.
+    """
+    def __init__(self, model: Optional[type], keys: List[str], attributes: Dict[str, Column], rendered: bytes,
+                 summary: LogSummary):
+        self.model = model
+        self.keys = keys
+        self.attributes = attributes
+        self.rendered = rendered
+        self.summary = summary
+
+    def targets(self) -> Dict[str, Any]:
+        targets: Dict[str, Any] = {}
+        names = list(self.attributes.keys())
+        for key, values in zip(self.keys, zip(*self.attributes.values())):
+            target = self.model.__new__(self.model)
+            target.__dict__.update(zip(names, values))
+            targets[key] = target
+        return targets
+
+
+def build_block(config: InfobloxConfig, discovery_type: str, objects_data: List[Dict[str, Any]],
+                view: str) -> TargetBlock:
+    """
+    Build and render the targets of a partition of the WAPI objects. Run in a worker process.
+    :param config:
+    :param discovery_type:
+    :param objects_data:
+    :param view: the view of the objects
+    :return:
+    """
+    builder = ObjectBuilder(config)
+    summary = LogSummary()
+    if discovery_type == ZONES:
+        targets = builder.build_zones(objects_data, summary, view)
+    elif discovery_type == DHCP_RANGES:
+        targets = builder.build_dhcp_ranges(objects_data, summary, view)
+    else:
+        raise ValueError(f"Not a process pool type {discovery_type}")
+    data = list(targets.values())
+    if not data:
+        return TargetBlock(None, [], {}, b'', summary)
+    # The targets of a type are built with the same attributes
+    names = list(data[0].__dict__.keys())
+    return TargetBlock(type(data[0]), list(targets.keys()),
+                       {name: Column([d.__dict__[name] for d in data]) for name in names},
+                       render_block(data), summary)
+
+
+def partitions(data: List[Any], parts: int) -> List[List[Any]]:
+    """
+    Split the data in parts of about the same size, keeping the order
+    :param data:
+    :param parts:
+    :return:
+    """
+    size = -(-len(data) // max(parts, 1))
+    return [data[i:i + size] for i in range(0, len(data), size)] if size else []
+
+
+def pool_workers() -> int:
+    return int(os.getenv(DISCOVERY_PROCESS_POOL_WORKERS, "0"))
+
+
+def pool_min_objects() -> int:
+    return int(os.getenv(DISCOVERY_PROCESS_POOL_MIN_OBJECTS, "20000"))
+
+
+def use_pool(discovery_type: str, objects: int) -> bool:
+    if multiprocessing.current_process().daemon:
+        # Like the collector process in snapshot mode, a daemon process can not start the pool workers
+        return False
+    # A profiled collect build in the profiled thread
+    return discovery_type in POOL_TYPES and pool_workers() > 1 and objects >= pool_min_objects() and not profiling()
+
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _pool() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # Spawn, since forking a process with the scheduler and http threads is not safe
+            _executor = ProcessPoolExecutor(max_workers=pool_workers(),
+                                            mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def shutdown_pool():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def build_in_pool(config: InfobloxConfig, discovery_type: str, objects_data: List[Dict[str, Any]],
+                  view: str) -> Tuple[Dict[str, Any], Optional[List[bytes]], LogSummary]:
+    """
+    Build the targets in the process pool, one partition of the objects for every worker. The
+    rendered blocks are only returned if the targets of the partitions are unique, otherwise the
+    targets must be rendered again.
+    :param config:
+    :param discovery_type:
+    :param objects_data:
+    :param view: the view of the objects
+    :return: the targets, the rendered blocks and the merged log summary
+    """
+    futures = [_pool().submit(build_block, config, discovery_type, part, view)
+               for part in partitions(objects_data, pool_workers())]
+    targets: Dict[str, Any] = {}
+    rendered: Optional[List[bytes]] = []
+    summary = LogSummary()
+    for future in futures:
+        block = future.result()
+        size = len(targets)
+        targets.update(block.targets())
+        if rendered is not None and len(targets) == size + len(block.keys):
+            rendered.append(block.rendered)
+        else:
+            rendered = None
+        summary.merge(block.summary)
+    return targets, rendered, summary
@@ -0,0 +1,207 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import cProfile
+import contextvars
+import gc
+import io
+import marshal
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from types import FunctionType, ModuleType
+from typing import Callable, Dict, List, Any
+
+from infoblox_discovery.exceptions import DiscoveryException
+
+PSTATS = 'pstats'
+TEXT = 'text'
+COLLAPSED = 'collapsed'
+FORMATS = [PSTATS, TEXT, COLLAPSED]
+
+# Seconds between the stack samples of the collapsed format
+SAMPLE_INTERVAL = 0.005
+# The number of frames kept for every allocation traced by tracemalloc
+TRACE_FRAMES = 10
+
+# Only one profiled or traced run at a time
+_profile_lock = threading.Lock()
+# Set while profiled, the threads and processes of a collect are only seen if run in the profiled thread
+_profiling: contextvars.ContextVar[bool] = contextvars.ContextVar('profiling', default=False)
+# Shared by all objects, not part of the size of any of them
+SHARED_TYPES = (type, ModuleType, FunctionType)
+
+
+def profiling() -> bool:
+    """
+    Check if the calling thread is profiled, a collect then run the views and the process pool
+    builds in the calling thread
+    :return:
+    """
+    return _profiling.get()
+
+
+class StackSampler:
+    """
+    Sample the stack of a thread on an interval and count the samples by stack, the result is
+    in the collapsed format used by flamegraph.pl and speedscope
+    """
+    def __init__(self, thread_id: int, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks: Dict[str, int] = {}
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            functions: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                functions.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stack = ';'.join(reversed(functions))
+            self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def collapsed(self) -> str:
+        return ''.join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+def _run_exclusive(run: Callable[[], Any]) -> Any:
+    if not _profile_lock.acquire(blocking=False):
+        raise DiscoveryException("A profile is already running", status=409)
+    try:
+        return run()
+    finally:
+        _profile_lock.release()
+
+
+def profile(function: Callable[[], Any], output_format: str = TEXT, top: int = 30) -> bytes:
+    """
+    Run the function with a profiler
+    :param function: the function to profile, e.g. a collect
+    :param output_format: pstats for the marshalled stats that pstats.Stats can load, text for the
+    top functions by cumulative time or collapsed for sampled stacks
+    :param top: the number of functions in the text format
+    :return:
+    """
+    if output_format not in FORMATS:
+        raise DiscoveryException(f"Not a valid format {output_format}, valid formats are {', '.join(FORMATS)}",
+                                 status=400)
+
+    def run() -> bytes:
+        token = _profiling.set(True)
+        try:
+            return run_profiled()
+        finally:
+            _profiling.reset(token)
+
+    def run_profiled() -> bytes:
+        if output_format == COLLAPSED:
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                function()
+            finally:
+                sampler.stop()
+            return sampler.collapsed().encode('utf-8')
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            function()
+        finally:
+            profiler.disable()
+        profiler.create_stats()
+        if output_format == PSTATS:
+            return marshal.dumps(profiler.stats)
+        output = io.StringIO()
+        pstats.Stats(profiler, stream=output).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        return output.getvalue().encode('utf-8')
+
+    return _run_exclusive(run)
+
+
+def trace_allocations(function: Callable[[], Any], top: int = 30) -> Dict[str, Any]:
+    """
+    Run the function with tracemalloc and get the allocation sites of the memory allocated by the
+    run and still allocated after it. See retained_size for the memory held by an object like the
+    targets in the cache.
+    :param function:
+    :param top: the number of allocation sites
+    :return:
+    """
+    def run() -> Dict[str, Any]:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(TRACE_FRAMES)
+        start_time = time.time()
+        try:
+            before = tracemalloc.take_snapshot()
+            function()
+            after = tracemalloc.take_snapshot()
+            traced, peak = tracemalloc.get_traced_memory()
+        finally:
+            if started:
+                tracemalloc.stop()
+
+        statistics = after.compare_to(before, 'lineno')
+        sites = [{'site': str(statistic.traceback[0]), 'size_bytes': statistic.size,
+                  'size_diff_bytes': statistic.size_diff, 'count': statistic.count,
+                  'count_diff': statistic.count_diff}
+                 for statistic in statistics[:top]]
+        return {'traced_bytes': traced, 'peak_bytes': peak, 'exec_time_seconds': time.time() - start_time,
+                'top': sites}
+
+    return _run_exclusive(run)
+
+
+def retained_size(obj: Any) -> int:
+    """
+    Get the bytes of an object and all objects it refer to, every object counted once. Classes,
+    modules and functions are shared and not counted.
+    :param obj:
+    :return:
+    """
+    seen = set()
+    pending = [obj]
+    size = 0
+    while pending:
+        referent = pending.pop()
+        if id(referent) in seen or isinstance(referent, SHARED_TYPES):
+            continue
+        seen.add(id(referent))
+        size += sys.getsizeof(referent)
+        pending.extend(gc.get_referents(referent))
+    return size
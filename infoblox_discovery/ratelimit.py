@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import email.utils
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+# The lowest rate, as part of the configured rate, when slowing down on throttled responses
+MIN_RATE_FACTOR = 0.1
+# The part of the configured rate added back for every successful request
+RATE_RECOVERY_FACTOR = 0.05
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header that can be in seconds or a http date
+    :param value:
+    :return: the seconds to wait or None if not set or not valid
+    """
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(retry_at.timestamp() - time.time(), 0.0)
+
+
+class TokenBucket:
+    """
+    A thread safe token bucket. A token is reserved directly and the caller wait outside the lock
+    until the token is available.
+    """
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens: float = burst
+        self._updated: float = time.monotonic()
+        self._paused_until: float = 0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Reserve a token
+        :return: the seconds to wait before the token can be used
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0
+            return max(wait, self._paused_until - now)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class RateLimiter:
+    """
+    Limit the request rate and the number of concurrent requests to a master. The rate is
+    lowered when the master respond with 429 or 503 and recover on successful requests.
+    """
+    def __init__(self, master: str, requests_per_second: Optional[float], burst: int, max_concurrency: int):
+        self.master = master
+        self.requests_per_second = requests_per_second
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self._bucket: Optional[TokenBucket] = TokenBucket(requests_per_second, burst) if requests_per_second else None
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._paused_until: float = 0
+        self.requests: int = 0
+        self.throttled: int = 0
+        self.queue_wait_seconds: float = 0
+
+    def same_settings(self, requests_per_second: Optional[float], burst: int, max_concurrency: int) -> bool:
+        return (self.requests_per_second, self.burst, self.max_concurrency) == \
+            (requests_per_second, burst, max_concurrency)
+
+    def current_rate(self) -> float:
+        return self._bucket.rate if self._bucket else 0
+
+    @contextmanager
+    def request(self):
+        """
+        Wait for a concurrency slot and a token before the request is done
+        :return:
+        """
+        start = time.monotonic()
+        self._slots.acquire()
+        try:
+            wait = self._bucket.reserve() if self._bucket else max(self._paused_until - time.monotonic(), 0)
+            if wait > 0:
+                time.sleep(wait)
+            with self._lock:
+                self.requests += 1
+                self.queue_wait_seconds += time.monotonic() - start
+            yield
+        finally:
+            self._slots.release()
+
+    def slow_down(self, retry_after: Optional[float]):
+        """
+        Called when the master respond with a throttled status
+        :param retry_after: the seconds from the Retry-After header
+        :return:
+        """
+        with self._lock:
+            self.throttled += 1
+            if self._bucket:
+                self._bucket.rate = max(self._bucket.rate / 2, self.requests_per_second * MIN_RATE_FACTOR)
+        pause = retry_after if retry_after is not None else 1.0
+        if self._bucket:
+            self._bucket.pause(pause)
+        else:
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def recover(self):
+        """
+        Called on a successful request to recover the rate
+        :return:
+        """
+        if self._bucket and self._bucket.rate < self.requests_per_second:
+            with self._lock:
+                self._bucket.rate = min(self.requests_per_second,
+                                        self._bucket.rate + self.requests_per_second * RATE_RECOVERY_FACTOR)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def rate_limiter(master: str, requests_per_second: Optional[float], burst: int, max_concurrency: int) -> RateLimiter:
+    """
+    Get the rate limiter for the master, shared by all connections to the master
+    :return:
+    """
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(master)
+        if limiter is None or not limiter.same_settings(requests_per_second, burst, max_concurrency):
+            limiter = RateLimiter(master, requests_per_second, burst, max_concurrency)
+            _rate_limiters[master] = limiter
+        return limiter
+
+
+def get_rate_limiters() -> Dict[str, RateLimiter]:
+    return _rate_limiters
+
+
+def remove_rate_limiter(master: str):
+    with _rate_limiters_lock:
+        _rate_limiters.pop(master, None)
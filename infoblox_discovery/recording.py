@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import atexit
+import gzip
+import json
+import threading
+import time
+import logging as log
+from typing import Dict, List, Any, Optional
+
+from infoblox_discovery.deadline import current_deadline
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.response_cache import ResponseKey, response_key
+
+ARCHIVE_VERSION = 1
+# The replay latency
+RECORDED = 'recorded'
+ZERO = 'zero'
+LATENCIES = [RECORDED, ZERO]
+
+
+class Recorder:
+    """
+    Write every WAPI query of all masters, with the objects or the error and the time it took, to a
+    gzip compressed archive of json lines. Every query is flushed, so the archive can be read while
+    the recording process is running.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self.queries = 0
+        self._file = gzip.open(file_name, 'wt', encoding='utf-8')
+        self._lock = threading.Lock()
+        self._write({'version': ARCHIVE_VERSION, 'recorded': time.time()})
+
+    def record(self, key: ResponseKey, elapsed: float, objects: Any = None, error: Optional[str] = None):
+        entry: Dict[str, Any] = {'key': list(key), 'elapsed': round(elapsed, 6)}
+        if error is not None:
+            entry['error'] = error
+        else:
+            entry['objects'] = objects
+        with self._lock:
+            self._write(entry)
+            self.queries += 1
+
+    def _write(self, entry: Dict[str, Any]):
+        self._file.write(json.dumps(entry, separators=(',', ':')))
+        self._file.write('\n')
+        self._file.flush()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+class RecordedQuery:
+    def __init__(self, elapsed: float, objects: Any = None, error: Optional[str] = None):
+        self.elapsed = elapsed
+        self.objects = objects
+        self.error = error
+
+
+class ReplayArchive:
+    """
+    The recorded queries of an archive. A query made more than once is replayed in the recorded
+    order, and the last response is repeated when all are replayed.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self._queries: Dict[ResponseKey, List[RecordedQuery]] = {}
+        self._next: Dict[ResponseKey, int] = {}
+        self._lock = threading.Lock()
+        try:
+            with gzip.open(file_name, 'rt', encoding='utf-8') as archive:
+                header = json.loads(archive.readline() or '{}')
+                if header.get('version') != ARCHIVE_VERSION:
+                    raise DiscoveryException(f"Not a WAPI archive {file_name}")
+                for line in archive:
+                    entry = json.loads(line)
+                    self._queries.setdefault(archive_key(entry['key']), []).append(
+                        RecordedQuery(entry['elapsed'], entry.get('objects'), entry.get('error')))
+        except EOFError:
+            # The recording process did not close the archive, the last query is not complete
+            pass
+        except (OSError, ValueError) as err:
+            raise DiscoveryException(f"Can not read WAPI archive {file_name} - {str(err)}")
+
+    def next(self, key: ResponseKey) -> Optional[RecordedQuery]:
+        with self._lock:
+            queries = self._queries.get(key)
+            if not queries:
+                return None
+            index = self._next.get(key, 0)
+            self._next[key] = index + 1
+            return queries[min(index, len(queries) - 1)]
+
+    def rewind(self):
+        with self._lock:
+            self._next.clear()
+
+    def __len__(self) -> int:
+        return sum(map(len, self._queries.values()))
+
+
+def archive_key(key: List[Any]) -> ResponseKey:
+    master, obj_type, payload, return_fields, extattrs, max_results, paging = key
+    return master, obj_type, payload, tuple(return_fields), extattrs, max_results, paging
+
+
+class ReplayConnector:
+    """
+    Serve the WAPI queries of a master from a recorded archive instead of the master, with the
+    recorded latency or none
+    """
+    def __init__(self, master: str, archive: ReplayArchive, latency: str = ZERO):
+        self.master = master
+        self.archive = archive
+        self.latency = latency
+
+    def get_object(self, obj_type, payload=None, return_fields=None, extattrs=None, force_proxy=False,
+                   max_results=None, paging=None):
+        query = self.archive.next(response_key(self.master, obj_type, payload, return_fields, extattrs, max_results,
+                                               paging))
+        if query is None:
+            raise DiscoveryException(f"No recorded {obj_type} query for {self.master}")
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check(obj_type)
+        if self.latency == RECORDED:
+            time.sleep(query.elapsed if deadline is None else deadline.timeout(query.elapsed))
+            if deadline is not None:
+                deadline.check(obj_type)
+        if query.error is not None:
+            raise DiscoveryException(query.error)
+        return query.objects
+
+
+_recorder: Optional[Recorder] = None
+_archives: Dict[str, ReplayArchive] = {}
+_lock = threading.Lock()
+
+
+def recorder(file_name: str) -> Recorder:
+    """
+    Get the recorder of the process, all masters are recorded to the same archive
+    :param file_name:
+    :return:
+    """
+    global _recorder
+    with _lock:
+        if _recorder is None:
+            _recorder = Recorder(file_name)
+            atexit.register(_recorder.close)
+            log.info("Record WAPI queries", extra={"archive": file_name})
+        return _recorder
+
+
+def replay_archive(file_name: str) -> ReplayArchive:
+    with _lock:
+        archive = _archives.get(file_name)
+        if archive is None:
+            archive = ReplayArchive(file_name)
+            _archives[file_name] = archive
+            log.info("Replay WAPI queries", extra={"archive": file_name, "queries": len(archive)})
+        return archive
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import json
+from typing import Dict, List, Any, Tuple
+
+from infoblox_discovery.columns import TargetColumns
+
+
+def _target_groups(data: List[Any]) -> List[Dict[str, Any]]:
+    # Targets with the same labels, like ranges with the same extattr labels, share one target group
+    prometheus_sd: Dict[Tuple[Tuple[str, str], ...], Dict[str, Any]] = {}
+    for d in data:
+        entry = d.as_prometheus_file_sd_entry()
+        key = tuple(sorted(entry['labels'].items()))
+        group = prometheus_sd.get(key)
+        if group is None:
+            prometheus_sd[key] = entry
+        else:
+            group['targets'].extend(entry['targets'])
+    return list(prometheus_sd.values())
+
+
+def render_targets(data: List[Any]) -> bytes:
+    if isinstance(data, TargetColumns):
+        return data.render()
+    return json.dumps(_target_groups(data), indent=4).encode('utf-8')
+
+
+def render_block(data: List[Any]) -> bytes:
+    """
+    Render the target groups of the data as a block of a json array, without the brackets, so
+    blocks rendered in different processes can be joined without encoding the targets again
+    :param data:
+    :return: the block, empty if there are no targets
+    """
+    rendered = json.dumps(_target_groups(data), indent=4)
+    # Strip the '[\n' and '\n]' around the groups, an empty list is rendered as '[]'
+    return rendered[2:-2].encode('utf-8')
+
+
+def join_blocks(blocks: List[bytes]) -> bytes:
+    """
+    Join rendered blocks into the same json array as render_targets would render, except that
+    targets with the same labels in different blocks are kept in separate target groups
+    :param blocks:
+    :return:
+    """
+    blocks = [block for block in blocks if block]
+    if not blocks:
+        return b'[]'
+    return b'[\n' + b',\n'.join(blocks) + b'\n]'
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import os
+import socket
+import time
+import uuid
+import logging as log
+from typing import Callable, Optional
+
+from infoblox_discovery.cache_backend import CacheBackend, cache_backend_factory
+from infoblox_discovery.environments import DISCOVERY_CACHE_BACKEND, DISCOVERY_LEADER_LEASE_TTL
+from infoblox_discovery.snapshot import SnapshotReader, SnapshotWriter, snapshot_generation, METRICS_KEY, CHANGES_PREFIX
+
+LEADER_KEY = 'leader'
+SNAPSHOT_KEY = 'snapshot'
+# The generation is stored separately so followers only fetch the snapshot when it has changed
+SNAPSHOT_GENERATION_KEY = 'snapshot_generation'
+
+
+def cache_backend() -> CacheBackend:
+    return cache_backend_factory(os.getenv(DISCOVERY_CACHE_BACKEND, 'memory://'))
+
+
+def lease_ttl() -> float:
+    return float(os.getenv(DISCOVERY_LEADER_LEASE_TTL, '30'))
+
+
+class SharedSnapshotWriter(SnapshotWriter):
+    """
+    A snapshot writer for replicas that share a cache backend. The replica that hold the leader
+    lease collect and publish the snapshot to the backend, the other replicas copy the published
+    snapshot to their own snapshot file, so all replicas serve the same snapshot.
+    """
+    def __init__(self, file_name: str, backend: CacheBackend, ttl: float, owner: Optional[str] = None):
+        super().__init__(file_name)
+        self.backend = backend
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # The lease is only trusted until it expire, also if the backend can not be reached
+        self._lease_until: float = 0
+
+    def is_leader(self) -> bool:
+        return self._lease_until > time.monotonic()
+
+    def elect(self) -> bool:
+        """
+        Acquire or renew the leader lease
+        :return: true if the replica became leader
+        """
+        was_leader = self.is_leader()
+        start = time.monotonic()
+        try:
+            acquired = self.backend.acquire_lease(LEADER_KEY, self.owner, self.ttl)
+        except Exception as err:
+            log.error("Leader election", extra={"owner": self.owner, "error": str(err)})
+            return False
+        if acquired and not was_leader:
+            # Keep the targets of the previous leader until they are collected by this replica
+            self.sync()
+            self.inherited = {key for key in SnapshotReader(self.file_name).keys()
+                              if key != METRICS_KEY and not key.startswith(CHANGES_PREFIX)}
+        self._lease_until = start + self.ttl if acquired else 0
+        if acquired != was_leader:
+            log.info("Leader changed", extra={"owner": self.owner, "leader": acquired})
+        return acquired and not was_leader
+
+    def resign(self):
+        if self.is_leader():
+            self._lease_until = 0
+            self.backend.release_lease(LEADER_KEY, self.owner)
+
+    def sync(self) -> bool:
+        """
+        Copy the snapshot published by the leader if it has changed
+        :return: true if a new snapshot was copied
+        """
+        if self.is_leader():
+            return False
+        try:
+            generation = self.backend.get(SNAPSHOT_GENERATION_KEY)
+            if generation is None or int(generation) == self._generation:
+                return False
+            data = self.backend.get(SNAPSHOT_KEY)
+            if data is None:
+                return False
+            self.replace(data)
+        except Exception as err:
+            log.error("Copy published snapshot", extra={"owner": self.owner, "error": str(err)})
+            return False
+        log.info("Copied published snapshot", extra={"owner": self.owner, "generation": self._generation})
+        return True
+
+    def _write(self, data: bytes):
+        super()._write(data)
+        if not self.is_leader():
+            return
+        try:
+            self.backend.set(SNAPSHOT_KEY, data)
+            self.backend.set(SNAPSHOT_GENERATION_KEY, str(snapshot_generation(data)).encode('utf-8'))
+        except Exception as err:
+            log.error("Publish snapshot to cache backend", extra={"owner": self.owner, "error": str(err)})
+
+
+def add_replica_job(scheduler, writer: SharedSnapshotWriter, on_elected: Callable[[], None]):
+    """
+    Add the job that renew the leader lease, about three times per lease ttl, and copy the
+    published snapshot when not leader
+    :param scheduler:
+    :param writer:
+    :param on_elected: called when the replica became leader
+    :return:
+    """
+    def run():
+        if writer.elect():
+            on_elected()
+        else:
+            writer.sync()
+
+    run()
+    scheduler.add_job(run, 'interval', seconds=max(writer.ttl / 3, 1), id='replica', replace_existing=True)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple, List
+
+from infoblox_discovery.environments import DISCOVERY_WAPI_CACHE_TTL, DISCOVERY_WAPI_CACHE_MAX_BYTES
+
+ResponseKey = Tuple[str, str, str, Tuple[str, ...], str, Any, bool]
+
+
+def response_key(master: str, obj_type: str, payload: Optional[Dict[str, Any]], return_fields: Optional[List[str]],
+                 extattrs: Optional[Dict[str, Any]], max_results: Optional[int], paging: bool) -> ResponseKey:
+    """
+    The key of a WAPI query, the same for the same object type, query and return fields
+    :return:
+    """
+    return (master, obj_type, json.dumps(payload or {}, sort_keys=True), tuple(return_fields or ()),
+            json.dumps(extattrs or {}, sort_keys=True), max_results, bool(paging))
+
+
+class ResponseCache:
+    """
+    The WAPI responses of all masters by query, shared by all discovery types in the process. An
+    entry expire ttl seconds after it was fetched, and the least recently used entries are evicted
+    when the size of the response bodies exceed max_bytes. The cached objects are shared by all
+    callers and must not be modified.
+    """
+    def __init__(self, ttl: float, max_bytes: int):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits: Dict[str, int] = {}
+        self.misses: Dict[str, int] = {}
+        self.evictions = 0
+        # key -> expire time, response bytes, objects
+        self._entries: OrderedDict[ResponseKey, Tuple[float, int, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def enabled(self) -> bool:
+        return self.ttl > 0 and self.max_bytes > 0
+
+    def get(self, key: ResponseKey) -> Tuple[bool, Any]:
+        """
+        Get the objects of a query
+        :param key:
+        :return: true and the objects if cached and not expired, else false and None
+        """
+        master = key[0]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= time.monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses[master] = self.misses.get(master, 0) + 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits[master] = self.hits.get(master, 0) + 1
+            return True, entry[2]
+
+    def put(self, key: ResponseKey, objects: Any, size: int):
+        """
+        Put the objects of a query
+        :param key:
+        :param objects:
+        :param size: the bytes of the response bodies, including all pages
+        :return:
+        """
+        if not self.enabled() or size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (time.monotonic() + self.ttl, size, objects)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def clear(self, master: Optional[str] = None):
+        """
+        Remove the entries of a master, or all entries
+        :param master:
+        :return:
+        """
+        with self._lock:
+            for key in [key for key in self._entries if master is None or key[0] == master]:
+                self._remove(key)
+            if master is not None:
+                self.hits.pop(master, None)
+                self.misses.pop(master, None)
+
+    def _remove(self, key: ResponseKey):
+        self.size -= self._entries.pop(key)[1]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+
+def response_cache() -> ResponseCache:
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(float(os.getenv(DISCOVERY_WAPI_CACHE_TTL, '60')),
+                                            int(os.getenv(DISCOVERY_WAPI_CACHE_MAX_BYTES, str(64 * 1024 * 1024))))
+        return _response_cache
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import json
+import mmap
+import os
+import struct
+import threading
+import logging as log
+from typing import Dict, List, Optional, Set, Tuple, Any
+
+from starlette.responses import Response
+
+# The header is the magic, the generation counter and the length of the index
+SNAPSHOT_MAGIC = b'IBDSNAP1'
+SNAPSHOT_HEADER = struct.Struct('<8sQI')
+
+METRICS_KEY = 'metrics'
+CHANGES_PREFIX = 'changes/'
+
+
+def snapshot_key(master: str, type: str) -> str:
+    return f"{master}/{type}"
+
+
+class SnapshotWriter:
+    """
+    Publish pre-rendered response bodies to a file, normally on a tmpfs like /dev/shm, that is
+    memory mapped by the http workers. A new snapshot is written to a temporary file and
+    atomically replaced so readers always see a complete snapshot.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self._generation: int = SnapshotReader(file_name).generation()
+        self._lock = threading.Lock()
+        # The state of the data in the last published snapshot, set by the publisher to skip unchanged data
+        self.published_state: Optional[Any] = None
+        # The keys of the snapshot of a previous leader that are kept until collected again, see replicas.py
+        self.inherited: Set[str] = set()
+
+    def publish(self, bodies: Dict[str, bytes], metadata: Dict[str, Dict[str, Any]] = None) -> int:
+        """
+        Publish a new snapshot
+        :param bodies: the body by key
+        :param metadata: the optional metadata, like etag and status, by key
+        :return: the generation of the snapshot
+        """
+        with self._lock:
+            self._generation += 1
+            self._write(encode_snapshot(self._generation, bodies, metadata or {}))
+            return self._generation
+
+    def replace(self, data: bytes) -> int:
+        """
+        Publish a snapshot encoded by another writer, like the writer of another replica
+        :param data: the encoded snapshot
+        :return: the generation of the snapshot
+        """
+        with self._lock:
+            self._generation = snapshot_generation(data)
+            self._write(data)
+            return self._generation
+
+    def _write(self, data: bytes):
+        tmp_file_name = f"{self.file_name}.tmp"
+        with open(tmp_file_name, 'wb') as snapshot_file:
+            snapshot_file.write(data)
+        os.replace(tmp_file_name, self.file_name)
+
+
+def encode_snapshot(generation: int, bodies: Dict[str, bytes], metadata: Dict[str, Dict[str, Any]]) -> bytes:
+    index: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+    offset = 0
+    for key, body in bodies.items():
+        index[key] = (offset, len(body), metadata.get(key, {}))
+        offset += len(body)
+    index_data = json.dumps(index).encode('utf-8')
+    return b''.join([SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, generation, len(index_data)), index_data, *bodies.values()])
+
+
+def snapshot_generation(data: bytes) -> int:
+    """
+    Get the generation of an encoded snapshot
+    :param data:
+    :return:
+    """
+    if len(data) < SNAPSHOT_HEADER.size:
+        raise ValueError("Not a valid snapshot")
+    magic, generation, _ = SNAPSHOT_HEADER.unpack_from(data, 0)
+    if magic != SNAPSHOT_MAGIC:
+        raise ValueError("Not a valid snapshot")
+    return generation
+
+
+class SnapshotReader:
+    """
+    Serve response bodies from the memory mapped snapshot file. The file is mapped again when
+    the writer has replaced it.
+    """
+    def __init__(self, file_name: str):
+        self.file_name = file_name
+        self._signature: Optional[Tuple[int, int]] = None
+        self._map: Optional[mmap.mmap] = None
+        self._data_offset: int = 0
+        self._generation: int = 0
+        self._index: Dict[str, Tuple[int, int, Dict[str, Any]]] = {}
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.file_name)
+        except FileNotFoundError:
+            return
+        signature = (stat.st_ino, stat.st_mtime_ns)
+        if signature == self._signature or stat.st_size < SNAPSHOT_HEADER.size:
+            return
+
+        with open(self.file_name, 'rb') as snapshot_file:
+            snapshot_map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, generation, index_length = SNAPSHOT_HEADER.unpack_from(snapshot_map, 0)
+        if magic != SNAPSHOT_MAGIC:
+            log.error("Not a valid snapshot file", extra={"file_name": self.file_name})
+            return
+        index_start = SNAPSHOT_HEADER.size
+        self._index = json.loads(snapshot_map[index_start:index_start + index_length])
+        self._data_offset = index_start + index_length
+        self._generation = generation
+        # A replaced map is closed when the last memoryview of it is released
+        self._map = snapshot_map
+        self._signature = signature
+
+    def generation(self) -> int:
+        self._refresh()
+        return self._generation
+
+    def keys(self) -> List[str]:
+        self._refresh()
+        return list(self._index.keys())
+
+    def get(self, key: str) -> Optional[memoryview]:
+        """
+        Get a body without copying it from the shared memory
+        :param key:
+        :return: the body or None if not part of the snapshot
+        """
+        self._refresh()
+        if key not in self._index:
+            return None
+        offset, length, _ = self._index[key]
+        start = self._data_offset + offset
+        return memoryview(self._map)[start:start + length]
+
+    def get_metadata(self, key: str) -> Dict[str, Any]:
+        """
+        Get the metadata of the body as returned by the last call to get
+        :param key:
+        :return:
+        """
+        if key not in self._index:
+            return {}
+        return self._index[key][2]
+
+
+class SnapshotResponse(Response):
+    """
+    A response that pass the memoryview of the body to the server without copying it
+    """
+    def render(self, content) -> bytes:
+        if isinstance(content, memoryview):
+            return content
+        return super().render(content)
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import logging as log
+import os
+import threading
+import time
+from typing import Dict, Optional, Union
+
+import requests
+from infoblox_client import connector
+
+from infoblox_discovery.deadline import current_deadline, DeadlineExceeded
+from infoblox_discovery.environments import DISCOVERY_WAPI_RECORD, DISCOVERY_WAPI_REPLAY, DISCOVERY_WAPI_REPLAY_LATENCY
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.recording import Recorder, ReplayConnector, recorder, replay_archive, LATENCIES, ZERO
+from infoblox_discovery.ratelimit import RateLimiter, parse_retry_after
+from infoblox_discovery.response_cache import response_cache, response_key
+
+THROTTLE_STATUS = [requests.codes.TOO_MANY_REQUESTS, requests.codes.SERVICE_UNAVAILABLE]
+THROTTLE_RETRIES = 3
+
+# Metric label for the WAPI object type
+OBJECT_TYPE = 'object_type'
+
+
+class ResponseStats:
+    """
+    Number of responses and response body bytes by WAPI object type for a master
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.responses: Dict[str, int] = {}
+        self.response_bytes: Dict[str, int] = {}
+
+    def add(self, obj_type: str, size: int):
+        with self._lock:
+            self.responses[obj_type] = self.responses.get(obj_type, 0) + 1
+            self.response_bytes[obj_type] = self.response_bytes.get(obj_type, 0) + size
+
+    def get(self) -> Dict[str, Dict[str, int]]:
+        """
+        Get a consistent copy of the counters
+        :return: responses and bytes by object type
+        """
+        with self._lock:
+            return {obj_type: {'responses': count, 'bytes': self.response_bytes[obj_type]}
+                    for obj_type, count in self.responses.items()}
+
+
+_response_stats: Dict[str, ResponseStats] = {}
+_response_stats_lock = threading.Lock()
+
+
+def response_stats(master: str) -> ResponseStats:
+    with _response_stats_lock:
+        stats = _response_stats.get(master)
+        if stats is None:
+            stats = ResponseStats()
+            _response_stats[master] = stats
+        return stats
+
+
+def get_response_stats() -> Dict[str, ResponseStats]:
+    return _response_stats
+
+
+def remove_response_stats(master: str):
+    with _response_stats_lock:
+        _response_stats.pop(master, None)
+
+
+class WapiConnector(connector.Connector):
+    """
+    A connector where every WAPI request, including each page of a paged request, pass the
+    rate limiter of the master. A request is not started after the deadline of the collect, and
+    its timeout is limited to the remaining time, see deadline.py. The objects of a query are
+    reused from the response cache, see response_cache.py, and can be recorded, see recording.py.
+    """
+    def __init__(self, options, limiter: RateLimiter, recorder: Optional[Recorder] = None):
+        self.limiter = limiter
+        self.stats = response_stats(limiter.master)
+        self.responses = response_cache()
+        self.recorder = recorder
+        # The response bytes of the get_object call in the current thread
+        self._local = threading.local()
+        super().__init__(options)
+
+    def get_object(self, obj_type, payload=None, return_fields=None, extattrs=None, force_proxy=False,
+                   max_results=None, paging=None):
+        if self.recorder is None:
+            return self._cached_get_object(obj_type, payload, return_fields, extattrs, force_proxy, max_results, paging)
+        # The key before the connector add the return fields to the payload
+        key = response_key(self.limiter.master, obj_type, payload, return_fields, extattrs, max_results, paging)
+        start = time.monotonic()
+        try:
+            objects = self._cached_get_object(obj_type, payload, return_fields, extattrs, force_proxy, max_results,
+                                              paging)
+        except DeadlineExceeded:
+            raise
+        except Exception as err:
+            self.recorder.record(key, time.monotonic() - start, error=str(err))
+            raise
+        self.recorder.record(key, time.monotonic() - start, objects)
+        return objects
+
+    def _cached_get_object(self, obj_type, payload, return_fields, extattrs, force_proxy, max_results, paging):
+        if not self.responses.enabled():
+            return super().get_object(obj_type, payload, return_fields, extattrs, force_proxy, max_results, paging)
+        key = response_key(self.limiter.master, obj_type, payload, return_fields, extattrs, max_results, paging)
+        cached, objects = self.responses.get(key)
+        if cached:
+            return objects
+        self._local.response_bytes = 0
+        objects = super().get_object(obj_type, payload, return_fields, extattrs, force_proxy, max_results, paging)
+        self.responses.put(key, objects, self._local.response_bytes)
+        return objects
+
+    def _get_object(self, obj_type, url):
+        opts = self._get_request_options()
+        self._log_request('get', url, opts)
+        deadline = current_deadline()
+        for attempt in range(THROTTLE_RETRIES + 1):
+            with self.limiter.request():
+                if deadline is not None:
+                    # Also checked after the wait on the rate limit
+                    deadline.check(obj_type)
+                    opts['timeout'] = deadline.timeout(self.http_request_timeout)
+                if self.session.cookies:
+                    # the first 'get' or 'post' action will generate a cookie
+                    # after that, we don't need to re-authenticate
+                    self.session.auth = None
+                try:
+                    r = self.session.get(url, **opts)
+                except requests.exceptions.Timeout as err:
+                    if deadline is not None and deadline.expired():
+                        deadline.exceeded(obj_type)
+                        raise DeadlineExceeded(obj_type) from err
+                    raise
+            self.stats.add(obj_type, len(r.content))
+            self._local.response_bytes = getattr(self._local, 'response_bytes', 0) + len(r.content)
+            if r.status_code not in THROTTLE_STATUS:
+                break
+            retry_after = parse_retry_after(r.headers.get('Retry-After'))
+            log.warning("WAPI request throttled", extra={"master": self.limiter.master, "object_type": obj_type,
+                                                         "status": r.status_code, "retry_after": retry_after,
+                                                         "attempt": attempt})
+            self.limiter.slow_down(retry_after)
+
+        if r.status_code in THROTTLE_STATUS:
+            # Not a HTTPError, that infoblox-client retry once more without any throttling
+            raise DiscoveryException(f"WAPI request throttled {THROTTLE_RETRIES + 1} times, status {r.status_code}")
+
+        self._validate_authorized(r)
+
+        if r.status_code != requests.codes.ok:
+            log.warning("Failed on object search", extra={"object_type": obj_type, "status": r.status_code})
+            r.raise_for_status()
+        self.limiter.recover()
+        return self._parse_reply(r)
+
+
+def wapi_connector(options, limiter: RateLimiter) -> Union[WapiConnector, ReplayConnector]:
+    """
+    Create the connector of a master, replayed from an archive if INFOBLOX_DISCOVERY_WAPI_REPLAY is set
+    and recorded if INFOBLOX_DISCOVERY_WAPI_RECORD is set
+    :param options: the infoblox-client connector options
+    :param limiter: the rate limiter of the master
+    :return:
+    """
+    if os.getenv(DISCOVERY_WAPI_REPLAY):
+        latency = os.getenv(DISCOVERY_WAPI_REPLAY_LATENCY, ZERO)
+        if latency not in LATENCIES:
+            raise DiscoveryException(f"{DISCOVERY_WAPI_REPLAY_LATENCY} must be one of {','.join(LATENCIES)}")
+        return ReplayConnector(limiter.master, replay_archive(os.getenv(DISCOVERY_WAPI_REPLAY)), latency)
+    if os.getenv(DISCOVERY_WAPI_RECORD):
+        return WapiConnector(options, limiter, recorder(os.getenv(DISCOVERY_WAPI_RECORD)))
+    return WapiConnector(options, limiter)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import ipaddress
+from functools import lru_cache
+from typing import Tuple
+
+# Sized to keep the names of all zones of a large grid between collections
+ZONE_NAME_CACHE_SIZE = 262144
+
+
+@lru_cache(maxsize=ZONE_NAME_CACHE_SIZE)
+def reverse_zone_name(network: str) -> str:
+    """
+    Create the reverse zone name from a network, e.g. 192.168.1.0/24 is 1.168.192.in-addr.arpa.
+    The names for networks not on an octet, or nibble, boundary are in the RFC 2317 look alike
+    format used by IPy, e.g. 192.168.1.0/25 is 0-127.1.168.192.in-addr.arpa.
+    :param network:
+    :return:
+    """
+    net = ipaddress.ip_network(network)
+    if net.version == 6 and net.prefixlen >= 96 and net.network_address.ipv4_mapped is not None:
+        net = ipaddress.ip_network(f"{net.network_address.ipv4_mapped}/{net.prefixlen - 96}")
+
+    if net.version == 4:
+        octets = str(net.network_address).split('.')
+        full_octets = net.prefixlen // 8
+        partial = ''
+        if net.prefixlen % 8 != 0:
+            partial = f"{octets[full_octets]}-{str(net.broadcast_address).split('.')[-1]}."
+        return f"{partial}{'.'.join(reversed(octets[:full_octets]))}.in-addr.arpa."
+
+    nibbles = '%032x' % int(net.network_address)
+    partial = ''
+    if net.prefixlen % 4 != 0:
+        partial = f"{nibbles[net.prefixlen:]}-{int(net.broadcast_address):x}."
+    return f"{partial}{'.'.join(reversed(nibbles[:net.prefixlen // 4]))}.ip6.arpa."
+
+
+@lru_cache(maxsize=ZONE_NAME_CACHE_SIZE)
+def idna_name(fqdn: str) -> str:
+    return fqdn.encode('idna').decode('utf-8')
+
+
+def zone_names(fqdn: str) -> Tuple[str, str]:
+    """
+    Get the zone name and the ascii address of a zone_auth fqdn. Reverse zones are defined as
+    networks in infoblox
+    :param fqdn:
+    :return:
+    """
+    if '/' in fqdn:
+        name = reverse_zone_name(fqdn)
+        return name, name
+    return fqdn, idna_name(fqdn)
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import base64
+import unittest
+
+from infoblox_discovery.auth import Authenticator, hash_password
+
+
+def basic(username: str, password: str) -> str:
+    return 'Basic ' + base64.b64encode(f"{username}:{password}".encode('utf-8')).decode('ascii')
+
+
+class AuthTest(unittest.TestCase):
+
+    def test_disabled(self):
+        self.assertTrue(Authenticator(enabled=False).verify(None))
+
+    def test_users_and_tokens(self):
+        authenticator = Authenticator(enabled=True)
+        authenticator.add_user('prometheus', 'secret')
+        authenticator.add_user('grafana', hash_password('other', iterations=1000))
+        authenticator.add_token('token-1')
+
+        self.assertTrue(authenticator.verify(basic('prometheus', 'secret')))
+        self.assertTrue(authenticator.verify(basic('grafana', 'other')))
+        self.assertTrue(authenticator.verify('Bearer token-1'))
+
+        self.assertFalse(authenticator.verify(None))
+        self.assertFalse(authenticator.verify(basic('prometheus', 'other')))
+        self.assertFalse(authenticator.verify(basic('grafana', 'secret')))
+        self.assertFalse(authenticator.verify(basic('foo', 'secret')))
+        self.assertFalse(authenticator.verify('Bearer token-2'))
+        self.assertFalse(authenticator.verify('Basic not-base64!'))
+
+    def test_verified_cache(self):
+        authenticator = Authenticator(enabled=True, cache_ttl=60)
+        authenticator.add_user('prometheus', hash_password('secret', iterations=1000))
+        header = basic('prometheus', 'secret')
+        self.assertTrue(authenticator.verify(header))
+
+        # A cached header is not verified against the password again
+        authenticator.add_user('prometheus', 'changed')
+        self.assertTrue(authenticator.verify(header))
+
+        authenticator.cache_ttl = 0
+        authenticator._verified.clear()
+        self.assertFalse(authenticator.verify(header))
+
+    def test_rejected_cache(self):
+        authenticator = Authenticator(enabled=True)
+        authenticator.add_user('prometheus', 'secret')
+        header = basic('prometheus', 'other')
+        self.assertFalse(authenticator.verify(header))
+
+        # A rejected header is not verified against the password again
+        authenticator.add_user('prometheus', 'other')
+        self.assertFalse(authenticator.verify(header))
+        authenticator._rejected.clear()
+        self.assertTrue(authenticator.verify(header))
+
+
+if __name__ == '__main__':
+    unittest.main()
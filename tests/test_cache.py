@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import threading
+import unittest
+
+from infoblox_discovery.cache import Cache, ZONES, DHCP_RANGES, STATUS_OK, STATUS_STALE, STATUS_FAILED
+from infoblox_discovery.infoblox_dhcp import dhcp_factory
+from infoblox_discovery.infoblox_zone import zone_factory
+from infoblox_discovery.log_summary import LogSummary
+from infoblox_discovery.metrics import render_dhcp_utilization
+
+
+class CacheDiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = Cache()
+        self.cache.evict('a.foo.com')
+
+    def test_diff(self):
+        diff = self.cache.put('a.foo.com', ZONES, [zone_factory('foo.com', 'foo.com', 'a.foo.com'),
+                                                   zone_factory('bar.com', 'bar.com', 'a.foo.com')])
+        self.assertEqual(['bar.com', 'foo.com'], diff.added)
+        etag = self.cache.get_etag('a.foo.com', ZONES)
+
+        # Same targets and labels keep the etag
+        diff = self.cache.put('a.foo.com', ZONES, [zone_factory('bar.com', 'bar.com', 'a.foo.com'),
+                                                   zone_factory('foo.com', 'foo.com', 'a.foo.com')])
+        self.assertTrue(diff.is_empty())
+        self.assertEqual(etag, self.cache.get_etag('a.foo.com', ZONES))
+
+        diff = self.cache.put('a.foo.com', ZONES, [zone_factory('foo.com', 'foo.com', 'b.foo.com'),
+                                                   zone_factory('baz.com', 'baz.com', 'a.foo.com')])
+        self.assertEqual(['baz.com'], diff.added)
+        self.assertEqual(['bar.com'], diff.removed)
+        self.assertEqual(['foo.com'], diff.changed)
+        self.assertNotEqual(etag, self.cache.get_etag('a.foo.com', ZONES))
+        self.assertEqual({'added': 3, 'removed': 1, 'changed': 1}, self.cache.get_churn()['a.foo.com'][ZONES])
+
+    def test_dhcp_utilization(self):
+        self.cache.put('a.foo.com', DHCP_RANGES, [dhcp_factory('10.0.0.0/24', 'a.foo.com', 287, 'NORMAL'),
+                                                  dhcp_factory('10.0.1.0/24', 'a.foo.com')])
+        etag = self.cache.get_etag('a.foo.com', DHCP_RANGES)
+        self.assertNotIn('__meta_infoblox_utilization',
+                         self.cache.get('a.foo.com', DHCP_RANGES)[0].as_prometheus_file_sd_entry()['labels'])
+        body = render_dhcp_utilization(self.cache).decode('utf-8')
+        self.assertIn('infoblox_dhcp_range_utilization{master="a.foo.com",view="",network="10.0.0.0/24"} 0.287\n', body)
+        self.assertIn('infoblox_dhcp_range_utilization_status{master="a.foo.com",view="",network="10.0.0.0/24"} 0.0\n', body)
+        self.assertNotIn('10.0.1.0/24', body)
+
+        # A changed utilization is not a label change but is rendered
+        self.cache.put('a.foo.com', DHCP_RANGES, [dhcp_factory('10.0.0.0/24', 'a.foo.com', 1000, 'FULL'),
+                                                  dhcp_factory('10.0.1.0/24', 'a.foo.com')])
+        self.assertEqual(etag, self.cache.get_etag('a.foo.com', DHCP_RANGES))
+        body = render_dhcp_utilization(self.cache).decode('utf-8')
+        self.assertIn('network="10.0.0.0/24"} 1.0\n', body)
+        self.assertIn('network="10.0.0.0/24"} 3.0\n', body)
+        self.cache.evict('a.foo.com')
+
+    def test_requests(self):
+        self.cache.put('a.foo.com', ZONES, [zone_factory('foo.com', 'foo.com', 'a.foo.com')])
+        self.cache.count_request('a.foo.com', ZONES, True)
+        self.cache.count_request('a.foo.com', DHCP_RANGES, False)
+        self.cache.count_request('unknown.foo.com', ZONES, False)
+        self.assertEqual(1, self.cache.get_hits('a.foo.com', ZONES))
+        self.assertEqual(1, self.cache.get_misses('a.foo.com', DHCP_RANGES))
+        self.assertEqual(0, self.cache.get_misses('unknown.foo.com', ZONES))
+
+    def test_log_summary(self):
+        summary = LogSummary(sample_size=2)
+        for zone in ['a.com', 'b.com', 'c.com']:
+            summary.add('zones_excluded', zone)
+        summary.add('zone_disabled')
+        self.assertEqual({'zones': 10, 'zones_excluded': 3, 'zone_disabled': 1, 'zones_excluded_sample': 'a.com,b.com'},
+                         summary.extra(zones=10))
+
+    def test_empty(self):
+        diff = self.cache.put('a.foo.com', ZONES, [])
+        self.assertTrue(diff.is_empty())
+        self.assertIsNotNone(self.cache.get_etag('a.foo.com', ZONES))
+
+    def test_status(self):
+        self.assertEqual(STATUS_FAILED, self.cache.get_status('a.foo.com', ZONES)[0])
+        self.cache.put('a.foo.com', ZONES, [zone_factory('foo.com', 'foo.com', 'a.foo.com')])
+        self.assertEqual(STATUS_OK, self.cache.get_status('a.foo.com', ZONES)[0])
+
+        # A failed collect keep the data as stale
+        self.cache.put_failed('a.foo.com', ZONES)
+        self.cache.put_failed('a.foo.com', ZONES)
+        self.assertEqual(STATUS_STALE, self.cache.get_status('a.foo.com', ZONES)[0])
+        self.assertEqual(2, self.cache.get_failures('a.foo.com', ZONES))
+        self.assertEqual(1, len(self.cache.get('a.foo.com', ZONES)))
+
+        # Stale data is not served after ttl
+        self.cache._collected['a.foo.com'][ZONES] -= self.cache._ttl
+        self.assertEqual(STATUS_FAILED, self.cache.get_status('a.foo.com', ZONES)[0])
+        self.assertEqual([], self.cache.get('a.foo.com', ZONES))
+
+        self.cache.put('a.foo.com', ZONES, [zone_factory('foo.com', 'foo.com', 'a.foo.com')])
+        self.assertEqual(STATUS_OK, self.cache.get_status('a.foo.com', ZONES)[0])
+        self.assertEqual(0, self.cache.get_failures('a.foo.com', ZONES))
+
+    def test_concurrent(self):
+        def put(type: str):
+            for i in range(50):
+                self.cache.put('a.foo.com', type, [zone_factory(f"{i}.foo.com", f"{i}.foo.com", 'a.foo.com')])
+                self.cache.put_failed('a.foo.com', type)
+                self.cache.evict('b.foo.com')
+
+        sequence = self.cache._sequence
+        threads = [threading.Thread(target=put, args=(f"zones{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # Every changed put get its own generation
+        self.assertEqual(sequence + 200, self.cache._sequence)
+        self.assertEqual(4, len({self.cache.get_generation('a.foo.com', f"zones{i}") for i in range(4)}))
+        self.assertEqual(1, self.cache.get_failures('a.foo.com', 'zones0'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+import unittest
+
+from infoblox_discovery.cache import Cache, ZONES
+from infoblox_discovery.cache_backend import MemoryCacheBackend, RedisCacheBackend, RespClient, RespError, \
+    cache_backend_factory
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.http_service_discovery import publish_snapshot
+from infoblox_discovery.infoblox_zone import zone_factory
+from infoblox_discovery.replicas import SharedSnapshotWriter
+from infoblox_discovery.snapshot import SnapshotReader
+
+
+class RespServer(socketserver.ThreadingTCPServer):
+    """
+    A stand-in for a redis server with the commands used by the backend
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), RespHandler)
+        self.lock = threading.Lock()
+        # key -> value and monotonic expire time
+        self.data = {}
+
+    def value(self, key):
+        value, expire = self.data.get(key, (None, None))
+        if expire is not None and expire <= time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+
+class RespHandler(socketserver.StreamRequestHandler):
+
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        command = []
+        for _ in range(int(line[1:])):
+            length = int(self.rfile.readline()[1:])
+            command.append(self.rfile.read(length + 2)[:-2])
+        return command
+
+    def handle(self):
+        while True:
+            command = self.read_command()
+            if command is None:
+                return
+            with self.server.lock:
+                self.wfile.write(self.execute(command[0].upper(), command[1:]))
+
+    def execute(self, name, args):
+        server = self.server
+        if name in (b'PING', b'AUTH', b'SELECT'):
+            return b'+OK\r\n'
+        if name == b'GET':
+            value = server.value(args[0])
+            return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+        if name == b'SET':
+            options = [arg.upper() for arg in args[2:]]
+            if b'NX' in options and server.value(args[0]) is not None:
+                return b'$-1\r\n'
+            expire = time.monotonic() + int(options[options.index(b'PX') + 1]) / 1000 if b'PX' in options else None
+            server.data[args[0]] = (args[1], expire)
+            return b'+OK\r\n'
+        if name == b'PEXPIRE':
+            if server.value(args[0]) is None:
+                return b':0\r\n'
+            server.data[args[0]] = (server.data[args[0]][0], time.monotonic() + int(args[1]) / 1000)
+            return b':1\r\n'
+        if name == b'DEL':
+            return b':%d\r\n' % (server.data.pop(args[0], None) is not None)
+        return b'-ERR unknown command\r\n'
+
+
+class CacheBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = RespServer()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.port = self.server.server_address[1]
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def assert_lease(self, backend):
+        self.assertTrue(backend.acquire_lease('leader', 'a', 0.2))
+        self.assertFalse(backend.acquire_lease('leader', 'b', 0.2))
+        self.assertTrue(backend.acquire_lease('leader', 'a', 0.2))
+        time.sleep(0.3)
+        self.assertTrue(backend.acquire_lease('leader', 'b', 0.2))
+        backend.release_lease('leader', 'a')
+        self.assertFalse(backend.acquire_lease('leader', 'a', 0.2))
+        backend.release_lease('leader', 'b')
+        self.assertTrue(backend.acquire_lease('leader', 'a', 0.2))
+
+    def test_memory_lease(self):
+        self.assert_lease(MemoryCacheBackend())
+
+    def test_redis(self):
+        backend = cache_backend_factory(f"redis://:secret@127.0.0.1:{self.port}/2")
+        self.assertTrue(backend.shared)
+        self.assertIsNone(backend.get('foo'))
+        backend.set('foo', b'\r\nbar')
+        self.assertEqual(b'\r\nbar', backend.get('foo'))
+        self.assert_lease(backend)
+        self.assertRaises(RespError, backend.client.execute, 'FOO')
+
+        # A lost connection is opened again
+        backend.client._sock.close()
+        self.assertEqual(b'\r\nbar', backend.get('foo'))
+
+        self.assertRaises(DiscoveryException, cache_backend_factory, 'foo://bar')
+        self.assertFalse(cache_backend_factory('memory://').shared)
+
+    def test_replicas(self):
+        backend = RedisCacheBackend(RespClient('127.0.0.1', self.port))
+        with tempfile.TemporaryDirectory() as directory:
+            leader = SharedSnapshotWriter(os.path.join(directory, 'a.snapshot'), backend, 5, 'a')
+            follower = SharedSnapshotWriter(os.path.join(directory, 'b.snapshot'), backend, 5, 'b')
+            self.assertTrue(leader.elect())
+            self.assertFalse(follower.elect())
+            self.assertFalse(leader.elect())
+            self.assertTrue(leader.is_leader())
+            self.assertFalse(follower.is_leader())
+
+            self.assertFalse(follower.sync())
+            leader.publish({'a.foo.com/zones': b'[]'}, {'a.foo.com/zones': {'etag': '"1-1"'}})
+            self.assertTrue(follower.sync())
+            self.assertFalse(follower.sync())
+            reader = SnapshotReader(os.path.join(directory, 'b.snapshot'))
+            self.assertEqual(b'[]', bytes(reader.get('a.foo.com/zones')))
+            self.assertEqual({'etag': '"1-1"'}, reader.get_metadata('a.foo.com/zones'))
+
+            # The follower continue the generations of the leader when it take over
+            leader.resign()
+            self.assertTrue(follower.elect())
+            self.assertEqual(2, follower.publish({}))
+            self.assertTrue(leader.sync())
+            self.assertEqual(2, SnapshotReader(os.path.join(directory, 'a.snapshot')).generation())
+
+    def test_failover(self):
+        backend = MemoryCacheBackend()
+        cache = Cache()
+        cache.evict('failover.foo.com')
+        with tempfile.TemporaryDirectory() as directory:
+            leader = SharedSnapshotWriter(os.path.join(directory, 'a.snapshot'), backend, 5, 'a')
+            follower = SharedSnapshotWriter(os.path.join(directory, 'b.snapshot'), backend, 5, 'b')
+            self.assertTrue(leader.elect())
+            leader.publish({'failover.foo.com/zones': b'[1]', 'failover.foo.com/hosts': b'[2]',
+                            'failover.foo.com/networks': b'[3]'},
+                           {'failover.foo.com/zones': {'etag': '"1-1"', 'collected': time.time()},
+                            'failover.foo.com/hosts': {'etag': '"1-2"', 'status': 'ok', 'collected': time.time()},
+                            'failover.foo.com/networks': {'etag': '"1-3"', 'collected': time.time() - 7200}})
+
+            # The new leader has only collected the zones
+            leader.resign()
+            self.assertTrue(follower.elect())
+            cache.put('failover.foo.com', ZONES, [zone_factory('foo.com', 'foo.com', 'failover.foo.com')])
+            publish_snapshot(follower)
+            reader = SnapshotReader(os.path.join(directory, 'b.snapshot'))
+            self.assertEqual(1, len(json.loads(bytes(reader.get('failover.foo.com/zones')))))
+            self.assertNotEqual(b'[1]', bytes(reader.get('failover.foo.com/zones')))
+            # The hosts of the previous leader are kept, but not the expired networks
+            self.assertEqual(b'[2]', bytes(reader.get('failover.foo.com/hosts')))
+            self.assertEqual({'etag': '"1-2"', 'status': 'ok'},
+                             {k: v for k, v in reader.get_metadata('failover.foo.com/hosts').items() if k != 'collected'})
+            self.assertIsNone(reader.get('failover.foo.com/networks'))
+            self.assertEqual({'failover.foo.com/hosts'}, follower.inherited)
+        cache.evict('failover.foo.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import unittest
+from unittest import mock
+
+from infoblox_discovery import collect
+from infoblox_discovery.cache import Cache, MEMBERS, NODES, DNS_SERVERS, ZONES, STATUS_STALE, STATUS_OK
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.infoblox_dns_server import dns_server_factory
+from infoblox_discovery.infoblox_zone import zone_factory
+
+CONFIG = {'infoblox': [{'master': 'collect.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['members', 'zones']}]}
+
+
+class CollectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = parse_config(CONFIG)['collect.foo.com']
+        self.cache = Cache()
+        self.cache.evict('collect.foo.com')
+        self.scheduler = mock.Mock()
+        collect._scheduler = self.scheduler
+
+    def tearDown(self):
+        collect._scheduler = None
+        collect._is_leader = None
+        collect._after_collect = None
+
+    def test_priority(self):
+        configs = parse_config({'infoblox': [dict(CONFIG['infoblox'][0], discovery=['web_endpoints', 'zones', 'members']),
+                                             dict(CONFIG['infoblox'][0], master='other.foo.com')]})
+        collects = [collect.MasterCollect(ib, ib.discovery) for ib in configs.values()]
+        self.assertEqual([('collect.foo.com', MEMBERS), ('other.foo.com', MEMBERS), ('collect.foo.com', ZONES),
+                          ('other.foo.com', ZONES), ('collect.foo.com', 'web_endpoints')],
+                         [(task[0].ib.master, task[1]) for task in collect.collect_tasks(collects)])
+
+    @mock.patch('infoblox_discovery.collect.InfoBlox')
+    def test_progressive(self, infoblox):
+        infoblox.return_value.get_infoblox_zones.return_value = {
+            'foo.com': zone_factory('foo.com', 'foo.com', 'collect.foo.com')}
+        infoblox.return_value.get_infoblox_members.return_value = ({}, {}, {})
+        infoblox.return_value.get_infoblox_dns_servers.return_value = {}
+        infoblox.return_value.rendered = {}
+        published = []
+        collect._after_collect = lambda: published.append(self.cache.get_types().get('collect.foo.com'))
+
+        collect.collect_masters([(self.config, self.config.discovery)], concurrency=2)
+        # Every type is published when collected, and the types share the connection
+        self.assertEqual(2, len(published))
+        infoblox.assert_called_once()
+        self.assertEqual(1, self.cache.get_collect_count()['collect.foo.com'])
+        self.assertEqual(STATUS_OK, self.cache.get_status('collect.foo.com', ZONES)[0])
+
+        # Nothing is published when the collected targets did not change
+        published.clear()
+        collect.collect_masters([(self.config, self.config.discovery)], concurrency=2)
+        self.assertEqual(0, len(published))
+
+    def test_leader_only(self):
+        job = mock.Mock()
+        after_collect = mock.Mock()
+        collect.add_collect_jobs(self.scheduler, after_collect, lambda: False)
+        collect.run_job(job)
+        job.assert_not_called()
+        after_collect.assert_not_called()
+
+        collect._is_leader = lambda: True
+        collect.run_job(job, 'a')
+        job.assert_called_once_with('a')
+        # Only published by the collect tasks, not by every job
+        after_collect.assert_not_called()
+
+    def test_retry_backoff(self):
+        with mock.patch.dict('os.environ', {}, clear=True):
+            self.assertIsNone(collect.retry_backoff(0))
+            self.assertEqual(10, collect.retry_backoff(1))
+            self.assertEqual(40, collect.retry_backoff(3))
+            self.assertIsNone(collect.retry_backoff(6))
+
+    @mock.patch('infoblox_discovery.collect.InfoBlox')
+    def test_failed_type(self, infoblox):
+        infoblox.return_value.get_infoblox_zones.return_value = {
+            'foo.com': zone_factory('foo.com', 'foo.com', 'collect.foo.com')}
+        infoblox.return_value.get_infoblox_members.return_value = ({}, {}, {})
+        infoblox.return_value.get_infoblox_dns_servers.return_value = {}
+        infoblox.return_value.rendered = {}
+        collect.collect_master(self.config, self.config.discovery)
+        self.assertEqual(STATUS_OK, self.cache.get_status('collect.foo.com', ZONES)[0])
+        self.scheduler.add_job.assert_not_called()
+
+        # Only the failed type is retried, the other type is collected
+        infoblox.return_value.get_infoblox_zones.side_effect = DiscoveryException("Could not fetch zones")
+        collect.collect_master(self.config, self.config.discovery)
+        self.assertEqual(STATUS_STALE, self.cache.get_status('collect.foo.com', ZONES)[0])
+        self.assertEqual(STATUS_OK, self.cache.get_status('collect.foo.com', NODES)[0])
+        self.assertEqual(1, len(self.cache.get('collect.foo.com', ZONES)))
+        self.assertEqual(1, self.cache.get_collect_count_failed()['collect.foo.com'])
+
+        self.scheduler.add_job.assert_called_once()
+        self.assertEqual([collect.retry_type, 'collect.foo.com', ZONES],
+                         self.scheduler.add_job.call_args.kwargs['args'])
+        self.assertNotIn(MEMBERS, self.scheduler.add_job.call_args.kwargs['id'])
+
+        # The dns servers are collected without views and zones if the enrichment fail
+        infoblox.return_value.get_infoblox_members.return_value = (
+            {}, {}, {'ns1.foo.com': dns_server_factory('ns1.foo.com', 'collect.foo.com')})
+        infoblox.return_value.get_infoblox_dns_servers.side_effect = DiscoveryException("Could not fetch views")
+        collect.collect_master(self.config, [MEMBERS])
+        self.assertEqual(STATUS_OK, self.cache.get_status('collect.foo.com', DNS_SERVERS)[0])
+        self.assertEqual(1, len(self.cache.get('collect.foo.com', DNS_SERVERS)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import unittest
+
+from infoblox_discovery.columns import TargetColumns, target_columns, ZLIB
+from infoblox_discovery.infoblox_dhcp import dhcp_factory
+from infoblox_discovery.infoblox_zone import zone_factory
+from infoblox_discovery.profiling import retained_size
+from infoblox_discovery.render import render_targets
+
+DHCP_RANGES = [dhcp_factory(f"10.0.{i}.0/24", 'foo.com', utilization=i * 10, utilization_status='NORMAL',
+                            extattr_labels={'__meta_infoblox_site': f"site{i % 3}"}, view='default')
+               for i in range(10)]
+
+ZONES = [zone_factory(f"zone{i}.foo.com", f"zone{i}.foo.com", 'foo.com', extattr_labels={'__meta_infoblox_site': 'site1'},
+                      view='default') for i in range(1000)]
+
+
+def columns(data, codec=None) -> TargetColumns:
+    return target_columns(data, [d.as_prometheus_file_sd_entry() for d in data], codec)
+
+
+class ColumnsTest(unittest.TestCase):
+
+    def test_render(self):
+        self.assertEqual(render_targets(DHCP_RANGES), columns(DHCP_RANGES).render())
+        self.assertEqual(render_targets(DHCP_RANGES), render_targets(columns(DHCP_RANGES)))
+
+    def test_lazy_objects(self):
+        dhcp_ranges = columns(DHCP_RANGES)
+        self.assertEqual(10, len(dhcp_ranges))
+        self.assertEqual('10.0.3.0/24', dhcp_ranges[3].network)
+        self.assertEqual('10.0.9.0/24', dhcp_ranges[-1].network)
+        self.assertEqual(DHCP_RANGES[4].as_prometheus_file_sd_entry(), dhcp_ranges[4].as_prometheus_file_sd_entry())
+        self.assertEqual([d.network for d in DHCP_RANGES], [d.network for d in dhcp_ranges])
+        with self.assertRaises(IndexError):
+            dhcp_ranges[10]
+
+    def test_rows(self):
+        self.assertEqual([('10.0.1.0/24', 10), ('10.0.2.0/24', 20)],
+                         list(columns(DHCP_RANGES).rows('network', 'utilization'))[1:3])
+
+    def test_compressed(self):
+        dhcp_ranges = columns(DHCP_RANGES, ZLIB)
+        self.assertIsNotNone(dhcp_ranges.packed_size())
+        self.assertEqual(render_targets(DHCP_RANGES), dhcp_ranges.render())
+        self.assertEqual('site2', dhcp_ranges[5].extattr_labels['__meta_infoblox_site'])
+
+    def test_zones(self):
+        zones = columns(ZONES)
+        self.assertEqual(render_targets(ZONES), zones.render())
+        self.assertEqual(ZONES[7].as_prometheus_file_sd_entry(), zones[7].as_prometheus_file_sd_entry())
+        # The unique address of every zone is a label column, not a label set per zone
+        self.assertEqual(1, len(zones.columns().label_sets))
+        self.assertLess(retained_size(zones), retained_size(ZONES))
+
+    def test_not_columnar(self):
+        mixed = DHCP_RANGES[:2] + [zone_factory('foo.com', '10.0.0.1', 'foo.com')]
+        self.assertIsNone(columns(mixed))
+        self.assertIsNone(columns([]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import copy
+import os
+import tempfile
+import unittest
+
+import yaml
+
+from infoblox_discovery.config import parse_config, diff_config, ConfigWatcher
+from infoblox_discovery.exceptions import DiscoveryException
+
+CONFIG = {
+    'infoblox': [
+        {'master': 'a.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+         'discovery': ['members', 'zones', 'dhcp_ranges'], 'exclude_ranges': [29, 30]},
+        {'master': 'b.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+         'discovery': ['zones', 'web_endpoints'],
+         'exclusion_labels': {'zones': ['zone-exclusion'], 'commons': ['common-exclusion']},
+         'web_endpoints': {'networks': ['192.91.218.0/24']}},
+    ]
+}
+
+
+class ConfigTest(unittest.TestCase):
+
+    def test_parse(self):
+        configs = parse_config(CONFIG)
+        self.assertEqual(['a.foo.com', 'b.foo.com'], list(configs.keys()))
+        self.assertEqual([29, 30], configs['a.foo.com'].exclude_ranges)
+        self.assertEqual(60, configs['a.foo.com'].timeout)
+        self.assertEqual(['192.91.218.0/24'], configs['b.foo.com'].web_endpoint_networks)
+
+    def test_views(self):
+        configs = parse_config(CONFIG)
+        self.assertEqual(['External'], configs['a.foo.com'].dns_views)
+        self.assertEqual(['default'], configs['a.foo.com'].network_views)
+
+        config = copy.deepcopy(CONFIG)
+        config['infoblox'][0]['dns_views'] = ['External', 'Internal']
+        self.assertEqual(['External', 'Internal'], parse_config(config)['a.foo.com'].dns_views)
+        self.assertEqual({'a.foo.com': ['zones']}, diff_config(configs, parse_config(config)).changed)
+
+        config['infoblox'][0]['network_views'] = ['default', 'default']
+        self.assertRaises(DiscoveryException, parse_config, config)
+
+    def test_invalid(self):
+        config = copy.deepcopy(CONFIG)
+        config['infoblox'][0]['discovery'].append('foo')
+        self.assertRaises(DiscoveryException, parse_config, config)
+
+        config = copy.deepcopy(CONFIG)
+        config['infoblox'][1]['exclusion_labels'] = {'foo': ['bar']}
+        self.assertRaises(DiscoveryException, parse_config, config)
+
+        config = copy.deepcopy(CONFIG)
+        del config['infoblox'][1]['password']
+        self.assertRaises(DiscoveryException, parse_config, config)
+
+        config = copy.deepcopy(CONFIG)
+        config['infoblox'][1]['web_endpoints'] = ['10.0.0.0/24']
+        self.assertRaises(DiscoveryException, parse_config, config)
+
+    def test_diff(self):
+        old = parse_config(CONFIG)
+        config = copy.deepcopy(CONFIG)
+        config['infoblox'][0]['exclude_ranges'] = [29]
+        config['infoblox'][0]['discovery'].remove('members')
+        del config['infoblox'][1]
+        config['infoblox'].append({'master': 'c.foo.com', 'wapi_version': '2.10.5', 'username': 'foo',
+                                   'password': 'bar', 'discovery': ['members']})
+
+        change = diff_config(old, parse_config(config))
+        self.assertEqual(['b.foo.com'], change.removed)
+        self.assertEqual({'a.foo.com': ['dhcp_ranges'], 'c.foo.com': ['members']}, change.changed)
+        self.assertEqual({'a.foo.com': ['members']}, change.dropped)
+
+        config['infoblox'][0]['password'] = 'new'
+        change = diff_config(old, parse_config(config))
+        self.assertEqual(['zones', 'dhcp_ranges'], change.changed['a.foo.com'])
+
+        self.assertTrue(diff_config(old, parse_config(CONFIG)).is_empty())
+
+    def test_watcher(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'config.yml')
+            with open(file_name, 'w') as config_file:
+                yaml.safe_dump(CONFIG, config_file)
+
+            watcher = ConfigWatcher(file_name)
+            change = watcher.poll()
+            self.assertEqual(2, len(change.changed))
+            self.assertIsNone(watcher.poll())
+
+            # An invalid file keeps the last valid configuration
+            with open(file_name, 'w') as config_file:
+                config_file.write("infoblox: foo")
+            self.assertIsNone(watcher.poll())
+            self.assertEqual(2, len(watcher.get_configs()))
+
+
+if __name__ == '__main__':
+    unittest.main()
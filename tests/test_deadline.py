@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import unittest
+from unittest import mock
+
+from infoblox_discovery import collect
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.cache import Cache, WEB_ENDPOINTS, STATUS_PARTIAL, STATUS_FAILED
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.deadline import Deadline, DeadlineExceeded, current_deadline, deadline_scope
+
+CONFIG = {'infoblox': [{'master': 'deadline.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['web_endpoints'], 'dns_views': ['External'],
+                        'network_views': ['default', 'lab'],
+                        'web_endpoints': {'networks': ['10.0.0.0/24', '10.0.1.0/24']}}]}
+
+
+def get_object(object_type, query, **kwargs):
+    # Like the connector, check the deadline before every request, and run out of time after the first host
+    deadline = current_deadline()
+    deadline.check(object_type)
+    if object_type == 'ipv4address':
+        if query['network_view'] == 'lab':
+            deadline.exceeded(object_type)
+            raise DeadlineExceeded(object_type)
+        return [{'names': ['a.foo.com', 'b.foo.com'], 'types': ['HOST'], 'ip_address': '10.0.0.1'}]
+    deadline.end = 0
+    return [{'view': 'External', 'dns_aliases': [f"www.{query['name']}"], 'extattrs': {}}]
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config = parse_config(CONFIG)['deadline.foo.com']
+        self.infoblox = InfoBlox(self.config)
+        self.infoblox.conn = mock.Mock()
+        self.infoblox.conn.get_object.side_effect = get_object
+        self.cache = Cache()
+        self.cache.evict('deadline.foo.com')
+        collect._scheduler = mock.Mock()
+
+    def tearDown(self):
+        collect._scheduler = None
+
+    def test_deadline(self):
+        self.assertFalse(Deadline().expired())
+        self.assertEqual(5, Deadline(10).timeout(5))
+        cycle = Deadline(0.000001)
+        deadline = Deadline(60, cycle)
+        self.assertTrue(deadline.expired())
+        self.assertRaises(DeadlineExceeded, deadline.check, 'zone_auth')
+        deadline.exceeded('zone_auth')
+        self.assertEqual(['zone_auth'], deadline.stages)
+
+    def test_views(self):
+        with deadline_scope(Deadline()) as deadline:
+            names = self.infoblox._get_fqdn_by_network('10.0.0.0/24')
+        # The view that ran out of time is left out
+        self.assertEqual(['a.foo.com', 'b.foo.com'], names)
+        self.assertEqual(['ipv4address'], deadline.stages)
+        self.assertIsNone(current_deadline())
+
+    def test_partial(self):
+        with mock.patch('infoblox_discovery.collect.InfoBlox', return_value=self.infoblox):
+            collect.collect_master(self.config, self.config.discovery)
+
+        # The web endpoints of the host names fetched in time, the second network is not fetched
+        self.assertEqual(['www.a.foo.com'], [w.host_name for w in self.cache.get('deadline.foo.com', WEB_ENDPOINTS)])
+        self.assertEqual(STATUS_PARTIAL, self.cache.get_status('deadline.foo.com', WEB_ENDPOINTS)[0])
+        self.assertEqual(['ipv4address', 'record:host'], self.cache.get_partial('deadline.foo.com', WEB_ENDPOINTS))
+        self.assertEqual(1, self.cache.get_deadline_exceeded('deadline.foo.com', WEB_ENDPOINTS))
+        collect._scheduler.add_job.assert_not_called()
+
+    @mock.patch.dict('os.environ', {'INFOBLOX_DISCOVERY_COLLECT_BUDGET': '0.000001'})
+    def test_cycle(self):
+        with mock.patch('infoblox_discovery.collect.InfoBlox', return_value=self.infoblox):
+            collect.collect_master(self.config, self.config.discovery)
+
+        self.infoblox.conn.get_object.assert_not_called()
+        self.assertEqual(STATUS_FAILED, self.cache.get_status('deadline.foo.com', WEB_ENDPOINTS)[0])
+        self.assertEqual(1, self.cache.get_deadline_exceeded('deadline.foo.com', WEB_ENDPOINTS))
+        collect._scheduler.add_job.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import unittest
+from unittest import mock
+
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.infoblox_dns_server import dns_server_factory, zone_assignments
+
+CONFIG = {'infoblox': [{'master': 'dns.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['members']}]}
+
+ZONES = [
+    {'grid_primary': [{'name': 'ns1.foo.com'}], 'grid_secondaries': [{'name': 'ns2.foo.com'}]},
+    {'grid_primary': [{'name': 'ns1.foo.com'}], 'grid_secondaries': [{'name': 'ns1.foo.com'}]},
+    {'grid_primary': [{'name': 'ns2.foo.com'}], 'disable': True},
+    {'grid_primary': [], 'grid_secondaries': []},
+]
+
+
+class DNSServerTest(unittest.TestCase):
+
+    def test_zone_assignments(self):
+        self.assertEqual({'ns1.foo.com': {'grid_primary': 2, 'grid_secondaries': 1},
+                          'ns2.foo.com': {'grid_primary': 0, 'grid_secondaries': 1}},
+                         zone_assignments(ZONES))
+
+    def test_dns_servers(self):
+        infoblox = InfoBlox(parse_config(CONFIG)['dns.foo.com'])
+        infoblox.conn = mock.Mock()
+        infoblox.conn.get_object.side_effect = [
+            [{'host_name': 'ns1.foo.com', 'views': ['Internal', 'External']}, {'host_name': 'ns3.foo.com'}],
+            ZONES]
+        dns_servers = infoblox.get_infoblox_dns_servers(
+            {name: dns_server_factory(name, 'dns.foo.com') for name in ['ns1.foo.com', 'ns2.foo.com']})
+
+        self.assertEqual(2, infoblox.conn.get_object.call_count)
+        labels = dns_servers['ns1.foo.com'].as_prometheus_file_sd_entry()['labels']
+        self.assertEqual('External,Internal', labels['__meta_infoblox_views'])
+        self.assertEqual('2', labels['__meta_infoblox_primary_zones'])
+        self.assertEqual('1', labels['__meta_infoblox_secondary_zones'])
+        self.assertEqual('', dns_servers['ns2.foo.com'].views)
+        self.assertEqual('1', dns_servers['ns2.foo.com'].secondary_zones)
+
+
+if __name__ == '__main__':
+    unittest.main()
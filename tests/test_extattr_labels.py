@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import copy
+import json
+import unittest
+from unittest import mock
+
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.extattr_labels import ExtattrLabels, EMPTY_LABELS
+from infoblox_discovery.render import render_targets
+
+CONFIG = {'infoblox': [{'master': 'labels.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['dhcp_ranges'],
+                        'extattr_labels': {'commons': {'Site': 'site'}, 'dhcp_ranges': {'Tenant': 'tenant'}}}]}
+
+RANGES = [
+    {'network': '10.0.0.0/24', 'extattrs': {'Site': {'value': 'sto'}, 'Tenant': {'value': 'a'}}},
+    {'network': '10.0.1.0/24', 'extattrs': {'Site': {'value': 'sto'}, 'Tenant': {'value': 'a'}}},
+    {'network': '10.0.2.0/24', 'extattrs': {'Site': {'value': 'got'}}},
+    {'network': '10.0.3.0/24', 'extattrs': {}},
+]
+
+
+class ExtattrLabelsTest(unittest.TestCase):
+
+    def test_config(self):
+        config = parse_config(CONFIG)['labels.foo.com']
+        self.assertEqual({'Site': 'site', 'Tenant': 'tenant'}, config.extattr_label_mapping('dhcp_ranges'))
+        self.assertEqual({'Site': 'site'}, config.extattr_label_mapping('zones'))
+
+        invalid = copy.deepcopy(CONFIG)
+        invalid['infoblox'][0]['extattr_labels']['zones'] = {'Site': 'not-valid'}
+        self.assertRaises(DiscoveryException, parse_config, invalid)
+
+    def test_shared_labels(self):
+        labels = ExtattrLabels({'Site': 'site', 'Env': 'env'})
+        first = labels.labels({'Site': {'value': 'sto'}, 'Env': {'value': ['prod', 'test']}})
+        self.assertEqual({'__meta_infoblox_site': 'sto', '__meta_infoblox_env': 'prod,test'}, first)
+        self.assertIs(first, labels.labels({'Env': {'value': ['prod', 'test']}, 'Site': {'value': 'sto'}}))
+        self.assertIs(EMPTY_LABELS, labels.labels({'Other': {'value': 'foo'}}))
+        self.assertEqual(1, labels.label_sets())
+
+    def test_dhcp_ranges(self):
+        infoblox = InfoBlox(parse_config(CONFIG)['labels.foo.com'])
+        infoblox.conn = mock.Mock()
+        infoblox.conn.get_object.return_value = RANGES
+        dhcp_ranges = infoblox.get_infoblox_dhcp_ranges()
+
+        self.assertIs(dhcp_ranges['default/10.0.0.0/24'].extattr_labels,
+                      dhcp_ranges['default/10.0.1.0/24'].extattr_labels)
+        groups = json.loads(render_targets(list(dhcp_ranges.values())))
+        self.assertEqual(3, len(groups))
+        self.assertEqual(['10.0.0.0/24', '10.0.1.0/24'], groups[0]['targets'])
+        self.assertEqual({'__meta_infoblox_master': 'labels.foo.com', '__meta_infoblox_view': 'default',
+                          '__meta_infoblox_site': 'sto', '__meta_infoblox_tenant': 'a'}, groups[0]['labels'])
+        self.assertEqual({'__meta_infoblox_master': 'labels.foo.com', '__meta_infoblox_view': 'default'},
+                         groups[2]['labels'])
+
+
+if __name__ == '__main__':
+    unittest.main()
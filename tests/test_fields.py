@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import unittest
+from unittest import mock
+
+from infoblox_discovery.fields import projection, return_fields, MEMBER, RANGE
+from infoblox_discovery.ratelimit import RateLimiter
+from infoblox_discovery.wapi import WapiConnector, response_stats, remove_response_stats
+
+
+class FieldsTest(unittest.TestCase):
+
+    def test_projection(self):
+        self.assertEqual(['host_name', 'node_info', 'extattrs'],
+                         projection(['host_name'], ['node_info', 'host_name'], ['extattrs']))
+        self.assertEqual(['host_name', 'enable_ha', 'node_info', 'service_status', 'extattrs'], return_fields(MEMBER))
+        self.assertEqual(['network', 'dhcp_utilization', 'dhcp_utilization_status', 'extattrs'],
+                         return_fields(RANGE))
+
+    def test_response_bytes(self):
+        remove_response_stats('b.foo.com')
+        limiter = RateLimiter('b.foo.com', requests_per_second=None, burst=1, max_concurrency=1)
+        conn = WapiConnector({'host': 'b.foo.com', 'username': 'foo', 'password': 'bar', 'wapi_version': '2.10.5'},
+                             limiter)
+        conn.session = mock.Mock(cookies=None)
+        conn.session.get.return_value = mock.Mock(status_code=200, headers={}, content=b'[{"a": 1}]')
+        conn.get_object('member')
+        conn.get_object('member', {'host_name': 'a.foo.com'})
+        self.assertEqual({'member': {'responses': 2, 'bytes': 20}}, response_stats('b.foo.com').get())
+
+
+if __name__ == '__main__':
+    unittest.main()
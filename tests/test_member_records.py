@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import unittest
+from unittest import mock
+
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.member_records import member_record, ACTIVE, PASSIVE, STANDALONE
+
+CONFIG = {'infoblox': [{'master': 'records.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['members']}]}
+
+MEMBERS = [
+    {'host_name': 'ha.foo.com', 'enable_ha': True, 'extattrs': {},
+     'service_status': [{'service': 'DNS', 'status': 'WORKING'}],
+     'node_info': [{'ha_status': 'ACTIVE', 'lan_ha_port_setting': {'mgmt_lan': '10.0.0.1'},
+                    'service_status': [{'service': 'NODE_STATUS', 'status': 'WORKING'}]},
+                   {'ha_status': 'PASSIVE', 'mgmt_network_setting': {'address': '10.0.0.2'}},
+                   {}]},
+    {'host_name': 'single.foo.com', 'enable_ha': False, 'extattrs': {},
+     'service_status': [{'service': 'DNS', 'status': 'INACTIVE'}],
+     'node_info': [{'lan_ha_port_setting': {'mgmt_lan': '10.0.1.1'}}]},
+]
+
+
+class MemberRecordTest(unittest.TestCase):
+
+    def test_member_record(self):
+        record = member_record(MEMBERS[0])
+        self.assertTrue(record.service_working('DNS'))
+        self.assertEqual(['10.0.0.1', '10.0.0.2', None], [node.ip for node in record.nodes])
+        self.assertEqual([ACTIVE, PASSIVE, PASSIVE], [node.role for node in record.nodes])
+        self.assertEqual({'NODE_STATUS': 'WORKING'}, record.nodes[0].services)
+        self.assertEqual(STANDALONE, member_record(MEMBERS[1]).nodes[0].role)
+
+    def test_members(self):
+        infoblox = InfoBlox(parse_config(CONFIG)['records.foo.com'])
+        infoblox.conn = mock.Mock()
+        infoblox.conn.get_object.return_value = MEMBERS
+        members, nodes, dns_servers = infoblox.get_infoblox_members()
+
+        self.assertEqual(['ha.foo.com', 'single.foo.com'], list(members.keys()))
+        self.assertEqual(['10.0.0.1', '10.0.0.2'], list(nodes.keys()))
+        self.assertEqual('ACTIVE', nodes['10.0.0.1'].as_prometheus_file_sd_entry()['labels']['__meta_infoblox_ha_status'])
+        self.assertEqual(['ha.foo.com'], list(dns_servers.keys()))
+
+
+if __name__ == '__main__':
+    unittest.main()
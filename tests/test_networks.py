@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import ipaddress
+import unittest
+from unittest import mock
+
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.networks import PrefixTree, NetworkFilter, EXCLUDED, NOT_INCLUDED
+
+LAB_SUBNETS = [f"10.1.{i}.0/26" for i in range(0, 256, 2)]
+
+CONFIG = {'infoblox': [{'master': 'networks.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['dhcp_ranges', 'web_endpoints'], 'exclude_ranges': [30],
+                        'include_networks': ['10.0.0.0/8', '2001:db8::/32'],
+                        'exclude_networks': ['10.200.0.0/16'] + LAB_SUBNETS,
+                        'web_endpoints': {'networks': ['10.1.0.0/16', '10.200.1.0/24']}}]}
+
+
+class NetworksTest(unittest.TestCase):
+
+    def test_prefix_tree(self):
+        tree = PrefixTree([ipaddress.ip_network(network) for network in ['10.200.0.0/16', '10.1.2.0/26', '10.1.2.0/26']])
+        self.assertEqual(2, len(tree))
+        self.assertTrue(tree.covers(ipaddress.ip_network('10.200.0.0/16')))
+        self.assertTrue(tree.covers(ipaddress.ip_network('10.200.33.0/24')))
+        self.assertTrue(tree.covers(ipaddress.ip_network('10.1.2.32/27')))
+        self.assertFalse(tree.covers(ipaddress.ip_network('10.1.2.0/24')))
+        self.assertFalse(tree.covers(ipaddress.ip_network('10.201.0.0/24')))
+        self.assertFalse(tree.covers(ipaddress.ip_network('::/0')))
+
+    def test_filter(self):
+        network_filter = parse_config(CONFIG)['networks.foo.com'].network_filter
+        self.assertIsNone(network_filter.filtered('10.1.1.0/24'))
+        self.assertIsNone(network_filter.filtered('2001:db8:1::/48'))
+        self.assertEqual(EXCLUDED, network_filter.filtered('10.1.4.10'))
+        self.assertEqual(EXCLUDED, network_filter.filtered('10.200.3.0/24'))
+        self.assertEqual(NOT_INCLUDED, network_filter.filtered('192.168.0.0/24'))
+        self.assertIsNone(NetworkFilter().filtered('192.168.0.0/24'))
+
+    def test_invalid_network(self):
+        config = {'infoblox': [dict(CONFIG['infoblox'][0], exclude_networks=['10.200.1.0/16'])]}
+        self.assertRaises(DiscoveryException, parse_config, config)
+
+    def test_dhcp_ranges(self):
+        infoblox = InfoBlox(parse_config(CONFIG)['networks.foo.com'])
+        summary = mock.Mock()
+        ranges = [{'network': network, 'extattrs': {}}
+                  for network in ['10.1.1.0/24', '10.1.2.0/26', '10.200.5.0/24', '192.168.0.0/24', '10.3.0.0/30']]
+        dhcp_ranges = infoblox.build_dhcp_ranges(ranges, summary, 'default')
+
+        self.assertEqual(['default/10.1.1.0/24'], list(dhcp_ranges.keys()))
+        summary.add.assert_any_call('dhcp_ranges_excluded', '10.200.5.0/24')
+        summary.add.assert_any_call('dhcp_ranges_not_included', '192.168.0.0/24')
+
+    def test_web_endpoints(self):
+        infoblox = InfoBlox(parse_config(CONFIG)['networks.foo.com'])
+        infoblox.conn = mock.Mock()
+
+        def get_object(object_type, query, **kwargs):
+            if object_type == 'ipv4address':
+                return [{'names': ['www.foo.com'], 'types': ['HOST'], 'ip_address': '10.1.1.10'},
+                        {'names': ['lab.foo.com'], 'types': ['HOST'], 'ip_address': '10.1.2.10'}]
+            return [{'view': 'External', 'dns_aliases': [f"alias.{query['name']}"], 'extattrs': {}}]
+
+        infoblox.conn.get_object.side_effect = get_object
+        self.assertEqual(['External/alias.www.foo.com'], list(infoblox.get_web_endpoints_by_networks('10.1.0.0/16')))
+        # The excluded network is not fetched
+        infoblox.conn.get_object.reset_mock()
+        self.assertEqual({}, infoblox.get_web_endpoints_by_networks('10.200.1.0/24'))
+        infoblox.conn.get_object.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
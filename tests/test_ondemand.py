@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import asyncio
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+from infoblox_discovery import http_service_discovery
+from infoblox_discovery.cache import Cache, ZONES
+from infoblox_discovery.infoblox_zone import zone_factory
+from infoblox_discovery.ondemand import SingleFlight
+
+MASTER = 'ondemand.foo.com'
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_coalesce(self):
+        release = threading.Event()
+        calls = []
+
+        def refresh(key):
+            calls.append(key)
+            release.wait(5)
+
+        single_flight = SingleFlight(cooldown=60)
+        first = single_flight.do('a', refresh, 'a')
+        self.assertIs(first, single_flight.do('a', refresh, 'a'))
+        release.set()
+        first.result(5)
+        self.assertEqual(['a'], calls)
+        # A new refresh is not started within the cooldown
+        self.assertIsNone(single_flight.do('a', refresh, 'a'))
+        self.assertEqual(0, single_flight.in_flight())
+
+
+class OnDemandTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = Cache()
+        self.cache.evict(MASTER)
+        http_service_discovery._single_flight = SingleFlight()
+
+    def tearDown(self):
+        self.cache.evict(MASTER)
+
+    def refresh(self, master, discovery_type):
+        time.sleep(0.05)
+        self.cache.put(master, ZONES, [zone_factory('foo.com', 'foo.com', master)])
+
+    @mock.patch.dict('os.environ', {'INFOBLOX_DISCOVERY_ON_DEMAND': 'wait'})
+    def test_wait(self):
+        with mock.patch.object(http_service_discovery, 'collectable_type', return_value=ZONES), \
+                mock.patch.object(http_service_discovery, 'refresh_type', side_effect=self.refresh) as refresh:
+            etag, targets, stale = asyncio.run(http_service_discovery.on_demand_targets(MASTER, ZONES))
+            refresh.assert_called_once_with(MASTER, ZONES)
+        self.assertIsNotNone(etag)
+        self.assertFalse(stale)
+        self.assertEqual(['foo.com'], json.loads(targets)[0]['targets'])
+
+    @mock.patch.dict('os.environ', {'INFOBLOX_DISCOVERY_ON_DEMAND': 'stale'})
+    def test_stale(self):
+        self.cache.put(MASTER, ZONES, [zone_factory('bar.com', 'bar.com', MASTER)])
+        self.cache._collected[MASTER][ZONES] -= self.cache._ttl + 1
+        with mock.patch.object(http_service_discovery, 'collectable_type', return_value=ZONES), \
+                mock.patch.object(http_service_discovery, 'refresh_type', side_effect=self.refresh):
+            etag, targets, stale = asyncio.run(http_service_discovery.on_demand_targets(MASTER, ZONES))
+            self.assertIsNone(etag)
+            self.assertTrue(stale)
+            self.assertEqual(['bar.com'], json.loads(targets)[0]['targets'])
+            # The refresh continue in the background
+            time.sleep(0.2)
+        self.assertEqual('foo.com', self.cache.get(MASTER, ZONES)[0].zone)
+
+    @mock.patch.dict('os.environ', {'INFOBLOX_DISCOVERY_ON_DEMAND': 'wait'})
+    def test_not_configured(self):
+        with mock.patch.object(http_service_discovery, 'collectable_type', return_value=None), \
+                mock.patch.object(http_service_discovery, 'refresh_type') as refresh:
+            self.assertEqual((None, b'[]', False), asyncio.run(http_service_discovery.on_demand_targets(MASTER, ZONES)))
+            refresh.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import json
+import multiprocessing
+import pickle
+import unittest
+from unittest import mock
+
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.pool import partitions, shutdown_pool, build_block
+from infoblox_discovery.render import render_targets, render_block, join_blocks
+
+CONFIG = {'infoblox': [{'master': 'pool.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['dhcp_ranges'], 'exclude_ranges': [32],
+                        'extattr_labels': {'dhcp_ranges': {'Site': 'site'}}}]}
+
+RANGES = [{'network': f"10.0.{i}.0/24", 'extattrs': {'Site': {'value': f"site{i}"}}} for i in range(10)] + \
+         [{'network': '10.1.0.1/32', 'extattrs': {}}]
+
+
+def collect_dhcp_ranges(result):
+    infoblox = InfoBlox(parse_config(CONFIG)['pool.foo.com'])
+    infoblox.conn = mock.Mock()
+    infoblox.conn.get_object.return_value = RANGES
+    result.put((len(infoblox.get_infoblox_dhcp_ranges()), 'dhcp_ranges' in infoblox.rendered))
+
+
+class PoolTest(unittest.TestCase):
+
+    def tearDown(self):
+        shutdown_pool()
+
+    def test_partitions(self):
+        self.assertEqual([[1, 2], [3, 4], [5]], partitions([1, 2, 3, 4, 5], 3))
+        self.assertEqual([[1]], partitions([1], 4))
+        self.assertEqual([], partitions([], 2))
+
+    def test_join_blocks(self):
+        infoblox = InfoBlox(parse_config(CONFIG)['pool.foo.com'])
+        dhcp_ranges = list(infoblox.build_dhcp_ranges(RANGES, mock.Mock(), 'default').values())
+        self.assertEqual(render_targets(dhcp_ranges),
+                         join_blocks([render_block(dhcp_ranges[:4]), render_block([]), render_block(dhcp_ranges[4:])]))
+        self.assertEqual(b'[]', join_blocks([render_block([])]))
+
+    def test_build_block(self):
+        config = parse_config(CONFIG)['pool.foo.com']
+        ranges = [{'network': f"10.{i // 256}.{i % 256}.0/24", 'extattrs': {'Site': {'value': f"site{i % 5}"}}}
+                  for i in range(1000)]
+        block = build_block(config, 'dhcp_ranges', ranges, 'default')
+        dhcp_ranges = InfoBlox(config).build_dhcp_ranges(ranges, mock.Mock(), 'default')
+        self.assertEqual({key: d.__dict__ for key, d in dhcp_ranges.items()},
+                         {key: d.__dict__ for key, d in block.targets().items()})
+        # The columns are returned to the collect process instead of the pickled targets
+        self.assertLess(len(pickle.dumps(block)), len(pickle.dumps((dhcp_ranges, block.rendered, block.summary))))
+
+    @mock.patch.dict('os.environ', {'INFOBLOX_DISCOVERY_PROCESS_POOL_WORKERS': '2',
+                                    'INFOBLOX_DISCOVERY_PROCESS_POOL_MIN_OBJECTS': '4'})
+    def test_dhcp_ranges_in_pool(self):
+        infoblox = InfoBlox(parse_config(CONFIG)['pool.foo.com'])
+        infoblox.conn = mock.Mock()
+        infoblox.conn.get_object.return_value = RANGES
+        dhcp_ranges = infoblox.get_infoblox_dhcp_ranges()
+
+        self.assertEqual([f"default/{r['network']}" for r in RANGES[:10]], list(dhcp_ranges.keys()))
+        self.assertEqual(2, len(infoblox.rendered['dhcp_ranges']))
+        self.assertEqual(render_targets(list(dhcp_ranges.values())), join_blocks(infoblox.rendered['dhcp_ranges']))
+        self.assertEqual(json.loads(join_blocks(infoblox.rendered['dhcp_ranges']))[3]['labels']['__meta_infoblox_site'],
+                         'site3')
+
+    @mock.patch.dict('os.environ', {'INFOBLOX_DISCOVERY_PROCESS_POOL_WORKERS': '2',
+                                    'INFOBLOX_DISCOVERY_PROCESS_POOL_MIN_OBJECTS': '4'})
+    def test_daemon_process(self):
+        # The collector process in snapshot mode is a daemon, that can not start the pool workers
+        context = multiprocessing.get_context('spawn')
+        result = context.Queue()
+        process = context.Process(target=collect_dhcp_ranges, args=(result,), daemon=True)
+        process.start()
+        self.assertEqual((10, False), result.get(timeout=30))
+        process.join()
+
+    @mock.patch.dict('os.environ', {'INFOBLOX_DISCOVERY_PROCESS_POOL_WORKERS': '2',
+                                    'INFOBLOX_DISCOVERY_PROCESS_POOL_MIN_OBJECTS': '4'})
+    def test_duplicate_targets_in_pool(self):
+        infoblox = InfoBlox(parse_config(CONFIG)['pool.foo.com'])
+        infoblox.conn = mock.Mock()
+        infoblox.conn.get_object.return_value = RANGES[:4] + RANGES[:4]
+        dhcp_ranges = infoblox.get_infoblox_dhcp_ranges()
+
+        self.assertEqual(4, len(dhcp_ranges))
+        self.assertNotIn('dhcp_ranges', infoblox.rendered)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import marshal
+import time
+import unittest
+
+from infoblox_discovery.profiling import profile, trace_allocations, retained_size, profiling, TEXT, PSTATS, \
+    COLLAPSED
+
+_kept = []
+
+
+def work():
+    total = 0
+    end = time.monotonic() + 0.05
+    while time.monotonic() < end:
+        total += sum(range(1000))
+    _kept.append([str(i) for i in range(10000)])
+    return total
+
+
+class ProfilingTest(unittest.TestCase):
+
+    def test_profile(self):
+        self.assertIn(b'work', profile(work, TEXT, 10))
+        stats = marshal.loads(profile(work, PSTATS))
+        self.assertIn('work', [function[2] for function in stats.keys()])
+        collapsed = profile(work, COLLAPSED).decode('utf-8')
+        self.assertIn('work (', collapsed)
+        self.assertTrue(all(line.rsplit(' ', 1)[1].isdigit() for line in collapsed.splitlines()))
+
+    def test_profiling(self):
+        profiled = []
+        profile(lambda: profiled.append(profiling()), PSTATS)
+        self.assertEqual([True], profiled)
+        self.assertFalse(profiling())
+
+    def test_trace_allocations(self):
+        result = trace_allocations(work, top=5)
+        self.assertGreater(result['traced_bytes'], 0)
+        self.assertIn('test_profiling.py', result['top'][0]['site'])
+
+    def test_retained_size(self):
+        labels = {'__meta_infoblox_site': 'site1'}
+        shared = [labels, labels]
+        self.assertLess(retained_size(shared), retained_size([labels, dict(labels)]))
+        self.assertGreater(retained_size([str(i) * 10 for i in range(100)]), 100 * 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
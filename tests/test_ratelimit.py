@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import time
+import unittest
+from unittest import mock
+
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.ratelimit import TokenBucket, RateLimiter, parse_retry_after
+from infoblox_discovery.wapi import WapiConnector, THROTTLE_RETRIES
+
+
+def response(status_code: int, headers=None, content=b'[]'):
+    r = mock.Mock(status_code=status_code, headers=headers or {}, content=content)
+    return r
+
+
+class RateLimitTest(unittest.TestCase):
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        self.assertEqual(0, bucket.reserve())
+        self.assertEqual(0, bucket.reserve())
+        self.assertAlmostEqual(0.1, bucket.reserve(), delta=0.01)
+        self.assertAlmostEqual(0.2, bucket.reserve(), delta=0.01)
+        bucket.pause(5)
+        self.assertGreater(bucket.reserve(), 4)
+
+    def test_retry_after(self):
+        self.assertEqual(3, parse_retry_after('3'))
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('foo'))
+        self.assertEqual(0, parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'))
+
+    def test_slow_down_and_recover(self):
+        limiter = RateLimiter('a.foo.com', requests_per_second=100, burst=100, max_concurrency=2)
+        limiter.slow_down(0)
+        limiter.slow_down(0)
+        self.assertEqual(25, limiter.current_rate())
+        for _ in range(20):
+            limiter.recover()
+        self.assertEqual(100, limiter.current_rate())
+        self.assertEqual(2, limiter.throttled)
+
+    def test_connector_throttled(self):
+        limiter = RateLimiter('a.foo.com', requests_per_second=None, burst=1, max_concurrency=1)
+        conn = WapiConnector({'host': 'a.foo.com', 'username': 'foo', 'password': 'bar', 'wapi_version': '2.10.5'},
+                             limiter)
+        conn.session = mock.Mock(cookies=None)
+        conn.session.get.side_effect = [response(429, {'Retry-After': '0.05'}), response(200, content=b'[{"a": 1}]')]
+        start = time.monotonic()
+        self.assertEqual([{'a': 1}], conn.get_object('member'))
+        self.assertGreaterEqual(time.monotonic() - start, 0.05)
+        self.assertEqual(2, limiter.requests)
+        self.assertEqual(1, limiter.throttled)
+
+    def test_connector_throttled_out(self):
+        limiter = RateLimiter('throttled.foo.com', requests_per_second=None, burst=1, max_concurrency=1)
+        conn = WapiConnector({'host': 'throttled.foo.com', 'username': 'foo', 'password': 'bar', 'wapi_version': '2.10.5'},
+                             limiter)
+        conn.session = mock.Mock(cookies=None)
+        conn.session.get.return_value = response(429, {'Retry-After': '0'})
+        self.assertRaises(DiscoveryException, conn.get_object, 'member')
+        # Not retried again by infoblox-client when the throttle retries run out
+        self.assertEqual(THROTTLE_RETRIES + 1, conn.session.get.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
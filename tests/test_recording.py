@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import requests
+from infoblox_client.exceptions import InfobloxConnectionError
+
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.exceptions import DiscoveryException
+from infoblox_discovery.ratelimit import rate_limiter
+from infoblox_discovery.recording import Recorder, ReplayArchive, ReplayConnector
+from infoblox_discovery.response_cache import ResponseCache
+from infoblox_discovery.wapi import WapiConnector
+
+CONFIG = {'infoblox': [{'master': 'record.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['dhcp_ranges']}]}
+
+RANGES = b'{"result": [{"network": "10.0.0.0/24", "extattrs": {}}, {"network": "10.0.1.0/24", "extattrs": {}}]}'
+
+
+def response(content: bytes):
+    return mock.Mock(status_code=200, headers={}, content=content)
+
+
+class RecordingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.archive = os.path.join(self.directory.name, 'wapi.jsonl.gz')
+        self.config = parse_config(CONFIG)['record.foo.com']
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def record(self, *responses):
+        recorder = Recorder(self.archive)
+        infoblox = InfoBlox(self.config)
+        infoblox.conn = WapiConnector(infoblox.opts, rate_limiter('record.foo.com', None, 1, 1), recorder)
+        infoblox.conn.responses = ResponseCache(ttl=0, max_bytes=0)
+        infoblox.conn.session = mock.Mock(cookies=None)
+        infoblox.conn.session.get.side_effect = responses
+        return infoblox, recorder
+
+    def test_replay(self):
+        infoblox, recorder = self.record(response(RANGES), response(b'[]'), requests.ConnectionError('refused'))
+        recorded = infoblox.get_infoblox_dhcp_ranges()
+        infoblox.conn.get_object('member', return_fields=['host_name'])
+        self.assertRaises(InfobloxConnectionError, infoblox.conn.get_object, 'member', return_fields=['host_name'])
+        recorder.close()
+        self.assertEqual(3, recorder.queries)
+
+        with mock.patch.dict('os.environ', {'INFOBLOX_DISCOVERY_WAPI_REPLAY': self.archive}):
+            replayed = InfoBlox(self.config)
+        self.assertIsInstance(replayed.conn, ReplayConnector)
+        self.assertEqual(list(recorded.keys()), list(replayed.get_infoblox_dhcp_ranges().keys()))
+        # The same query is replayed in the recorded order, and the last response repeated
+        self.assertEqual([], replayed.conn.get_object('member', return_fields=['host_name']))
+        self.assertRaises(DiscoveryException, replayed.conn.get_object, 'member', return_fields=['host_name'])
+        self.assertRaises(DiscoveryException, replayed.conn.get_object, 'member', return_fields=['host_name'])
+        # Not recorded
+        self.assertRaises(DiscoveryException, replayed.conn.get_object, 'member')
+
+    def test_recorded_latency(self):
+        infoblox, recorder = self.record(response(b'[{"a": 1}]'))
+        infoblox.conn.get_object('member')
+        recorder.close()
+        archive = ReplayArchive(self.archive)
+        self.assertEqual(1, len(archive))
+        connector = ReplayConnector('record.foo.com', archive, 'recorded')
+        self.assertEqual([{'a': 1}], connector.get_object('member'))
+        archive.rewind()
+        self.assertEqual([{'a': 1}], ReplayConnector('record.foo.com', archive).get_object('member'))
+
+    def test_invalid_archive(self):
+        with open(self.archive, 'wb') as archive:
+            archive.write(b'not an archive')
+        self.assertRaises(DiscoveryException, ReplayArchive, self.archive)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import time
+import unittest
+from unittest import mock
+
+from infoblox_discovery.ratelimit import RateLimiter
+from infoblox_discovery.response_cache import ResponseCache, response_key
+from infoblox_discovery.wapi import WapiConnector
+
+
+def key(obj_type: str, payload=None):
+    return response_key('c.foo.com', obj_type, payload, ['host_name'], None, None, False)
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def test_key(self):
+        self.assertEqual(key('member', {'a': 1, 'b': 2}), key('member', {'b': 2, 'a': 1}))
+        self.assertNotEqual(key('member'), response_key('c.foo.com', 'member', None, ['node_info'], None, None, False))
+
+    def test_ttl(self):
+        responses = ResponseCache(ttl=0.05, max_bytes=1000)
+        responses.put(key('member'), [{'a': 1}], 10)
+        self.assertEqual((True, [{'a': 1}]), responses.get(key('member')))
+        time.sleep(0.06)
+        self.assertEqual((False, None), responses.get(key('member')))
+        self.assertEqual(0, responses.size)
+        self.assertEqual({'c.foo.com': 1}, responses.hits)
+        self.assertEqual({'c.foo.com': 1}, responses.misses)
+
+    def test_lru(self):
+        responses = ResponseCache(ttl=60, max_bytes=100)
+        responses.put(key('a'), 'a', 40)
+        responses.put(key('b'), 'b', 40)
+        responses.get(key('a'))
+        responses.put(key('c'), 'c', 40)
+        # The least recently used is evicted
+        self.assertEqual([True, False, True], [responses.get(key(k))[0] for k in ['a', 'b', 'c']])
+        self.assertEqual(80, responses.size)
+        responses.put(key('d'), 'd', 101)
+        self.assertEqual(2, len(responses))
+        responses.clear('c.foo.com')
+        self.assertEqual(0, len(responses))
+
+    def test_connector(self):
+        limiter = RateLimiter('c.foo.com', requests_per_second=None, burst=1, max_concurrency=1)
+        conn = WapiConnector({'host': 'c.foo.com', 'username': 'foo', 'password': 'bar', 'wapi_version': '2.10.5'},
+                             limiter)
+        conn.responses = ResponseCache(ttl=60, max_bytes=1000)
+        conn.session = mock.Mock(cookies=None)
+        conn.session.get.return_value = mock.Mock(status_code=200, headers={}, content=b'[{"a": 1}]')
+
+        self.assertEqual([{'a': 1}], conn.get_object('member', return_fields=['host_name']))
+        self.assertEqual([{'a': 1}], conn.get_object('member', return_fields=['host_name']))
+        conn.get_object('member', return_fields=['node_info'])
+        # Only the query with other return fields is fetched again
+        self.assertEqual(2, conn.session.get.call_count)
+        self.assertEqual(20, conn.responses.size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import os
+import tempfile
+import threading
+import unittest
+
+from infoblox_discovery.cache import Cache, ZONES
+from infoblox_discovery.http_service_discovery import publish_snapshot
+from infoblox_discovery.infoblox_zone import zone_factory
+from infoblox_discovery.snapshot import SnapshotReader, SnapshotWriter, snapshot_key, METRICS_KEY
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def test_publish(self):
+        with tempfile.TemporaryDirectory() as directory:
+            file_name = os.path.join(directory, 'snapshot')
+            reader = SnapshotReader(file_name)
+            self.assertIsNone(reader.get(METRICS_KEY))
+            self.assertEqual(0, reader.generation())
+
+            writer = SnapshotWriter(file_name)
+            writer.publish({snapshot_key('a.foo.com', 'zones'): b'[1]', METRICS_KEY: b'metric 1\n'})
+            self.assertEqual(1, reader.generation())
+            self.assertEqual(b'[1]', bytes(reader.get(snapshot_key('a.foo.com', 'zones'))))
+            body = reader.get(METRICS_KEY)
+
+            writer.publish({snapshot_key('a.foo.com', 'zones'): b'[1, 2]'})
+            self.assertEqual(2, reader.generation())
+            self.assertEqual(b'[1, 2]', bytes(reader.get(snapshot_key('a.foo.com', 'zones'))))
+            self.assertIsNone(reader.get(METRICS_KEY))
+            # A body handed out before the new snapshot is still valid
+            self.assertEqual(b'metric 1\n', bytes(body))
+
+            # The generation continue after a restart of the writer
+            self.assertEqual(3, SnapshotWriter(file_name).publish({}))
+
+    def test_publish_changed(self):
+        cache = Cache()
+        cache.evict('snapshot.foo.com')
+        with tempfile.TemporaryDirectory() as directory:
+            writer = SnapshotWriter(os.path.join(directory, 'snapshot'))
+            cache.put('snapshot.foo.com', ZONES, [zone_factory('foo.com', 'foo.com', 'snapshot.foo.com')])
+            generation = publish_snapshot(writer)
+            self.assertIsNotNone(generation)
+
+            # The same targets are not published again
+            cache.put('snapshot.foo.com', ZONES, [zone_factory('foo.com', 'foo.com', 'snapshot.foo.com')])
+            self.assertIsNone(publish_snapshot(writer))
+            self.assertEqual(generation, SnapshotReader(writer.file_name).generation())
+
+            # A failed collect change the status
+            cache.put_failed('snapshot.foo.com', ZONES)
+            self.assertEqual(generation + 1, publish_snapshot(writer))
+        cache.evict('snapshot.foo.com')
+
+    def test_publish_concurrent(self):
+        cache = Cache()
+        cache.evict('snapshot.foo.com')
+        with tempfile.TemporaryDirectory() as directory:
+            writer = SnapshotWriter(os.path.join(directory, 'snapshot'))
+
+            def collect(i: int):
+                cache.put('snapshot.foo.com', f"zones{i}", [zone_factory(f"{i}.com", f"{i}.com", 'snapshot.foo.com')])
+                publish_snapshot(writer)
+
+            threads = [threading.Thread(target=collect, args=(i,)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            # The last published snapshot has the targets of every collect
+            reader = SnapshotReader(writer.file_name)
+            self.assertEqual(cache.get_state(), writer.published_state)
+            self.assertTrue(all(reader.get(snapshot_key('snapshot.foo.com', f"zones{i}")) is not None for i in range(8)))
+        cache.evict('snapshot.foo.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
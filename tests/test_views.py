@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+
+import threading
+import unittest
+from unittest import mock
+
+from infoblox_discovery.api import InfoBlox
+from infoblox_discovery.config import parse_config
+from infoblox_discovery.diff import fingerprint
+from infoblox_discovery.profiling import profile
+
+CONFIG = {'infoblox': [{'master': 'views.foo.com', 'wapi_version': '2.10.5', 'username': 'foo', 'password': 'bar',
+                        'discovery': ['zones', 'web_endpoints'], 'dns_views': ['External', 'Internal'],
+                        'network_views': ['default', 'lab'],
+                        'web_endpoints': {'networks': ['10.0.0.0/24']}}]}
+
+ZONES = {'External': [{'fqdn': 'foo.com', 'extattrs': {}}],
+         'Internal': [{'fqdn': 'foo.com', 'extattrs': {}}, {'fqdn': 'bar.foo.com', 'extattrs': {}}]}
+
+
+class ViewsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.infoblox = InfoBlox(parse_config(CONFIG)['views.foo.com'])
+        self.infoblox.conn = mock.Mock()
+
+    def test_zones(self):
+        # Both views must be fetched at the same time to pass the barrier
+        barrier = threading.Barrier(2, timeout=5)
+
+        def get_object(object_type, query, **kwargs):
+            barrier.wait()
+            return ZONES[query['view']]
+
+        self.infoblox.conn.get_object.side_effect = get_object
+        zones = self.infoblox.get_infoblox_zones()
+
+        self.assertEqual(['External/foo.com', 'Internal/foo.com', 'Internal/bar.foo.com'], list(zones.keys()))
+        self.assertEqual('Internal', zones['Internal/foo.com'].as_prometheus_file_sd_entry()['labels']['__meta_infoblox_view'])
+        # The same zone in two views are different targets
+        self.assertEqual(3, len(fingerprint(list(zones.values()))))
+
+    def test_profiled_zones(self):
+        threads = []
+
+        def get_object(object_type, query, **kwargs):
+            threads.append(threading.get_ident())
+            return ZONES[query['view']]
+
+        self.infoblox.conn.get_object.side_effect = get_object
+        profile(self.infoblox.get_infoblox_zones)
+        # A profiled collect fetch the views in the profiled thread
+        self.assertEqual([threading.get_ident()] * 2, threads)
+
+    def test_web_endpoints(self):
+        def get_object(object_type, query, **kwargs):
+            if object_type == 'ipv4address':
+                return [{'names': ['www.foo.com'], 'types': ['HOST']}]
+            return [{'view': 'External', 'dns_aliases': ['a.foo.com'], 'extattrs': {}},
+                    {'view': 'Other', 'dns_aliases': ['b.foo.com'], 'extattrs': {}}]
+
+        self.infoblox.conn.get_object.side_effect = get_object
+        web_endpoints = self.infoblox.get_web_endpoints_by_networks('10.0.0.0/24')
+
+        self.assertEqual(['External/a.foo.com'], list(web_endpoints.keys()))
+        # The host name is in both network views but only fetched once
+        self.assertEqual(3, self.infoblox.conn.get_object.call_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+    Copyright (C) 2023  Anders Håål
+
+    This file is part of infoblox-discovery.
+
+    infoblox-discovery is free software: you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation, either version 3 of the License, or
+    (at your option) any later version.
+
+    infoblox-discovery is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with infoblox-discovery.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import unittest
+
+from infoblox_discovery.zone_names import reverse_zone_name, zone_names
+
+
+class ZoneNamesTest(unittest.TestCase):
+
+    def test_reverse_zone_name(self):
+        # The expected names are the names created by IPy reverseName
+        expected = {
+            '10.0.0.0/8': '10.in-addr.arpa.',
+            '10.1.0.0/16': '1.10.in-addr.arpa.',
+            '192.168.1.0/24': '1.168.192.in-addr.arpa.',
+            '192.168.1.0/25': '0-127.1.168.192.in-addr.arpa.',
+            '192.168.1.128/26': '128-191.1.168.192.in-addr.arpa.',
+            '10.1.2.3/32': '3.2.1.10.in-addr.arpa.',
+            '2001:db8::/32': '8.b.d.0.1.0.0.2.ip6.arpa.',
+            '2001:db8:1::/48': '1.0.0.0.8.b.d.0.1.0.0.2.ip6.arpa.',
+            '2001:db8::/33': '-20010db87fffffffffffffffffffffff.8.b.d.0.1.0.0.2.ip6.arpa.',
+            '::ffff:10.0.0.0/104': '10.in-addr.arpa.',
+        }
+        for network, name in expected.items():
+            self.assertEqual(name, reverse_zone_name(network), network)
+
+        self.assertRaises(ValueError, reverse_zone_name, '192.168.1.1/24')
+
+    def test_zone_names(self):
+        self.assertEqual(('foo.com', 'foo.com'), zone_names('foo.com'))
+        self.assertEqual(('bücher.example', 'xn--bcher-kva.example'), zone_names('bücher.example'))
+        self.assertEqual(('1.168.192.in-addr.arpa.', '1.168.192.in-addr.arpa.'), zone_names('192.168.1.0/24'))
+
+
+if __name__ == '__main__':
+    unittest.main()